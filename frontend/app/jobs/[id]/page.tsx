@@ -4,7 +4,7 @@ import { useState, useEffect } from "react"
 
 import { useParams } from "next/navigation"
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query"
-import { api } from "@/lib/api"
+import { api, ExportFormat } from "@/lib/api"
 import { Button } from "@/components/ui/button"
 import { Badge } from "@/components/ui/badge"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
@@ -45,6 +45,19 @@ export default function JobDetailsPage() {
     const [cleanInstruction, setCleanInstruction] = useState("")
     const [cleanFile, setCleanFile] = useState<string>("all")
     const [isCleanDialogOpen, setIsCleanDialogOpen] = useState(false)
+    const [exporting, setExporting] = useState<ExportFormat | null>(null)
+
+    // Prebuilt exports may still be building: wait for them before downloading
+    const handleExport = async (format: ExportFormat) => {
+        setExporting(format)
+        try {
+            await api.downloadExport(id, format)
+        } catch (e) {
+            alert(e instanceof Error ? e.message : "Export failed")
+        } finally {
+            setExporting(null)
+        }
+    }
 
     // Poll job status
     const { data: job, isLoading: jobLoading } = useQuery({
@@ -70,13 +83,6 @@ export default function JobDetailsPage() {
         }
     }, [files, selectedFile])
 
-    // Fetch data for selected file
-    const { data: jobData, isLoading: dataLoading } = useQuery({
-        queryKey: ['job_data', id, selectedFile],
-        queryFn: () => api.getJobData(id, selectedFile || undefined),
-        enabled: job?.status === 'completed' && !!selectedFile,
-    })
-
     const cleanMutation = useMutation({
         mutationFn: () => api.cleanJob(id, cleanInstruction, cleanFile === "all" ? undefined : cleanFile),
         onSuccess: () => {
@@ -185,15 +191,15 @@ export default function JobDetailsPage() {
 
                         <DropdownMenu>
                             <DropdownMenuTrigger asChild>
-                                <Button variant="outline" className="gap-2">
-                                    <Download className="w-4 h-4" /> Export
+                                <Button variant="outline" className="gap-2" disabled={exporting !== null}>
+                                    <Download className="w-4 h-4" /> {exporting ? `Preparing ${exporting.toUpperCase()}...` : "Export"}
                                 </Button>
                             </DropdownMenuTrigger>
                             <DropdownMenuContent align="end">
-                                <DropdownMenuItem asChild><a href={api.getDownloadUrl(id, 'csv')}>CSV</a></DropdownMenuItem>
-                                <DropdownMenuItem asChild><a href={api.getDownloadUrl(id, 'json')}>JSON</a></DropdownMenuItem>
-                                <DropdownMenuItem asChild><a href={api.getDownloadUrl(id, 'sqlite')}>SQLite</a></DropdownMenuItem>
-                                <DropdownMenuItem asChild><a href={api.getDownloadUrl(id, 'parquet')}>Parquet</a></DropdownMenuItem>
+                                <DropdownMenuItem onSelect={() => handleExport('csv')}>CSV</DropdownMenuItem>
+                                <DropdownMenuItem onSelect={() => handleExport('json')}>JSON</DropdownMenuItem>
+                                <DropdownMenuItem onSelect={() => handleExport('sqlite')}>SQLite</DropdownMenuItem>
+                                <DropdownMenuItem onSelect={() => handleExport('parquet')}>Parquet</DropdownMenuItem>
                             </DropdownMenuContent>
                         </DropdownMenu>
                     </div>
@@ -266,10 +272,11 @@ export default function JobDetailsPage() {
                                 </div>
                             )}
 
-                            {dataLoading ? (
-                                <div className="h-64 flex items-center justify-center">Loading data...</div>
+                            {selectedFile ? (
+                                // pages are fetched, sorted and filtered on the server
+                                <DataGrid key={selectedFile} source={{ jobId: id, file: selectedFile }} />
                             ) : (
-                                <DataGrid data={jobData || []} />
+                                <div className="h-64 flex items-center justify-center">Loading data...</div>
                             )}
                         </TabsContent>
 
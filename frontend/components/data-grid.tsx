@@ -1,8 +1,10 @@
 "use client"
 
 import * as React from "react"
+import { keepPreviousData, useQuery } from "@tanstack/react-query"
 import {
     ColumnDef,
+    PaginationState,
     SortingState,
     flexRender,
     getCoreRowModel,
@@ -13,6 +15,7 @@ import {
 } from "@tanstack/react-table"
 import { ArrowUpDown, ChevronLeft, ChevronRight } from "lucide-react"
 
+import { api } from "@/lib/api"
 import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import {
@@ -25,17 +28,49 @@ import {
 } from "@/components/ui/table"
 
 interface DataGridProps<TData> {
-    data: TData[]
+    data?: TData[]
+    // page, sort and filter a job table on the server instead of in the browser
+    source?: { jobId: string; file?: string }
+    pageSize?: number
 }
 
-export function DataGrid<TData extends object>({ data }: DataGridProps<TData>) {
+export function DataGrid<TData extends object>({ data = [], source, pageSize }: DataGridProps<TData>) {
     const [sorting, setSorting] = React.useState<SortingState>([])
     const [globalFilter, setGlobalFilter] = React.useState("")
+    const [pagination, setPagination] = React.useState<PaginationState>({
+        pageIndex: 0,
+        pageSize: pageSize ?? (source ? 50 : 10),
+    })
+    const [search, setSearch] = React.useState("")
+
+    // Debounce the filter box before it becomes a server query; a new view starts at page 1
+    React.useEffect(() => {
+        const timer = setTimeout(() => {
+            setSearch(globalFilter)
+            setPagination((p) => ({ ...p, pageIndex: 0 }))
+        }, 300)
+        return () => clearTimeout(timer)
+    }, [globalFilter])
+
+    const sort = sorting[0] ? `${sorting[0].desc ? "-" : ""}${sorting[0].id}` : undefined
+    const { data: page } = useQuery({
+        queryKey: ['job_data_page', source?.jobId, source?.file, pagination.pageIndex, pagination.pageSize, sort, search],
+        queryFn: () => api.getJobDataPage(source!.jobId, source!.file, {
+            limit: pagination.pageSize,
+            offset: pagination.pageIndex * pagination.pageSize,
+            sort,
+            q: search || undefined,
+        }),
+        enabled: !!source,
+        placeholderData: keepPreviousData,
+    })
+    const rows = React.useMemo(() => (source ? (page?.rows ?? []) : data) as TData[], [source, page, data])
+    const total = source ? (page?.total ?? 0) : data.length
 
     // Dynamically generate columns from the first item keys
     const columns = React.useMemo<ColumnDef<TData>[]>(() => {
-        if (!data || data.length === 0) return []
-        const keys = Object.keys(data[0])
+        if (!rows || rows.length === 0) return []
+        const keys = Object.keys(rows[0])
         return keys.map((key) => ({
             accessorKey: key,
             header: ({ column }) => {
@@ -58,24 +93,33 @@ export function DataGrid<TData extends object>({ data }: DataGridProps<TData>) {
                 return String(val) // Limit length?
             }
         }))
-    }, [data])
+    }, [rows])
 
     const table = useReactTable({
-        data,
+        data: rows,
         columns,
         getCoreRowModel: getCoreRowModel(),
         getPaginationRowModel: getPaginationRowModel(),
         getSortedRowModel: getSortedRowModel(),
         getFilteredRowModel: getFilteredRowModel(),
-        onSortingChange: setSorting,
+        manualPagination: !!source,
+        manualSorting: !!source,
+        manualFiltering: !!source,
+        pageCount: source ? Math.ceil(total / pagination.pageSize) : undefined,
+        onSortingChange: (updater) => {
+            setSorting(updater)
+            setPagination((p) => ({ ...p, pageIndex: 0 }))
+        },
         onGlobalFilterChange: setGlobalFilter,
+        onPaginationChange: setPagination,
         state: {
             sorting,
             globalFilter,
+            pagination,
         },
     })
 
-    if (!data || data.length === 0) {
+    if (rows.length === 0 && !globalFilter && (!source || page !== undefined)) {
         return <div className="p-8 text-center text-muted-foreground border rounded-lg">No data available</div>
     }
 
@@ -89,7 +133,7 @@ export function DataGrid<TData extends object>({ data }: DataGridProps<TData>) {
                     className="max-w-sm"
                 />
                 <div className="ml-auto text-sm text-muted-foreground">
-                    {data.length} rows found
+                    {total} rows found
                 </div>
             </div>
             <div className="rounded-md border">
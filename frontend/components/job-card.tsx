@@ -1,6 +1,6 @@
 "use client"
 
-import { Job, api } from "@/lib/api"
+import { Job, ExportFormat, api } from "@/lib/api"
 import { Card, CardHeader, CardTitle, CardContent, CardFooter } from "@/components/ui/card"
 import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
@@ -37,6 +37,11 @@ export function JobCard({ job }: { job: Job }) {
     // We assume metadata has options if saved, or we check job.
     const isHealed = job.metadata?.options?.force_playwright === true
 
+    // Prebuilt exports may still be building: wait for them before downloading
+    const handleExport = (format: ExportFormat) => {
+        api.downloadExport(job.id, format).catch((e) => alert(e instanceof Error ? e.message : "Export failed"))
+    }
+
     return (
         <Card className="hover:shadow-lg transition-shadow border-muted/60 bg-card/50 backdrop-blur-sm">
             <CardHeader className="flex flex-row items-center justify-between pb-2">
@@ -75,15 +80,9 @@ export function JobCard({ job }: { job: Job }) {
                         </Button>
                     </DropdownMenuTrigger>
                     <DropdownMenuContent>
-                        <DropdownMenuItem asChild>
-                            <a href={api.getDownloadUrl(job.id, 'csv')} target="_blank" rel="noopener noreferrer">CSV</a>
-                        </DropdownMenuItem>
-                        <DropdownMenuItem asChild>
-                            <a href={api.getDownloadUrl(job.id, 'json')} target="_blank" rel="noopener noreferrer">JSON</a>
-                        </DropdownMenuItem>
-                        <DropdownMenuItem asChild>
-                            <a href={api.getDownloadUrl(job.id, 'sqlite')} target="_blank" rel="noopener noreferrer">SQLite</a>
-                        </DropdownMenuItem>
+                        <DropdownMenuItem onSelect={() => handleExport('csv')}>CSV</DropdownMenuItem>
+                        <DropdownMenuItem onSelect={() => handleExport('json')}>JSON</DropdownMenuItem>
+                        <DropdownMenuItem onSelect={() => handleExport('sqlite')}>SQLite</DropdownMenuItem>
                     </DropdownMenuContent>
                 </DropdownMenu>
 
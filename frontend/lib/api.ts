@@ -12,17 +12,45 @@ export interface JobOptions {
     llm_api_key?: string;
     llm_prompt?: string;
     llm_model?: string;
+    http_pool_connections?: number;
+    http_pool_maxsize?: number;
+    http_connect_timeout?: number;
+    http_read_timeout?: number;
+    http2?: boolean;
+    crawl_concurrency?: number;
+    crawl_per_host?: number;
+    pagination_inference?: boolean;
+    learn_fetch_strategy?: boolean;
+    dedupe_tables?: boolean;
+    dedupe_across_urls?: boolean;
+    http_cache?: boolean;
+    http_cache_ttl?: number;
+    http_cache_max_mb?: number;
+    block_resources?: boolean;
+    block_resource_types?: string[];
+    block_domains?: string[];
+    allow_xhr_domains?: string[];
+    render_wait_max_ms?: number;
+    max_grid_rows?: number;
+    capture_xhr?: boolean;
+    session_pagination?: 'auto' | 'click' | 'scroll' | 'off';
+    render_concurrency?: number;
+    stream_threshold_mb?: number;
+    max_body_mb?: number;
+    batch_shard_size?: number;
+    sitemap_max_urls?: number;
 }
 
 export interface JobRequest {
-    type: 'url' | 'prompt';
+    type: 'url' | 'prompt' | 'batch';
     value: string;
+    urls?: string[];
     options?: JobOptions;
 }
 
 export interface Job {
     id: string;
-    type: 'url' | 'prompt';
+    type: 'url' | 'prompt' | 'batch';
     value: string;
     status: 'queued' | 'running' | 'completed' | 'failed' | 'cleaning';
     metadata?: any; // eslint-disable-line @typescript-eslint/no-explicit-any
@@ -40,6 +68,32 @@ export interface VisualizeRequest {
     file?: string;
 }
 
+export interface DataQuery {
+    limit?: number;
+    offset?: number;
+    cursor?: string;
+    columns?: string[];
+    sort?: string; // column, "-column" for descending
+    filters?: string[]; // "column:op:value"
+    q?: string;
+}
+
+export interface DataPage {
+    rows: any[]; // eslint-disable-line @typescript-eslint/no-explicit-any
+    total: number;
+    nextCursor?: string;
+}
+
+export type ExportFormat = 'csv' | 'json' | 'sqlite' | 'parquet';
+
+export interface ExportStatus {
+    status: 'ready' | 'queued' | 'building' | 'failed' | 'missing' | 'empty';
+    format: ExportFormat;
+    tables_done?: number;
+    tables_total?: number;
+    error?: string;
+}
+
 async function handleResponse(res: Response) {
     if (!res.ok) {
         const error = await res.json().catch(() => ({ detail: res.statusText }));
@@ -63,6 +117,15 @@ export const api = {
         return handleResponse(res);
     },
 
+    resumeJob: async (jobId: string, llmApiKey?: string, force = false): Promise<{ job_id: string; resumed_from_page: number }> => {
+        const res = await fetch(`${API_URL}/jobs/${jobId}/resume?force=${force}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ llm_api_key: llmApiKey }),
+        });
+        return handleResponse(res);
+    },
+
     getJobTables: async (jobId: string): Promise<string[]> => {
         const res = await fetch(`${API_URL}/jobs/${jobId}/tables`);
         return handleResponse(res);
@@ -77,6 +140,26 @@ export const api = {
         return handleResponse(res);
     },
 
+    // One server-side page (sorted/filtered on the server) plus the view's row count
+    getJobDataPage: async (jobId: string, file?: string, query: DataQuery = {}): Promise<DataPage> => {
+        const params = new URLSearchParams();
+        params.set('limit', String(query.limit ?? 100));
+        if (query.cursor) params.set('cursor', query.cursor);
+        else params.set('offset', String(query.offset ?? 0));
+        if (file) params.set('file', file);
+        if (query.columns?.length) params.set('columns', query.columns.join(','));
+        if (query.sort) params.set('sort', query.sort);
+        query.filters?.forEach((f) => params.append('filter', f));
+        if (query.q) params.set('q', query.q);
+        const res = await fetch(`${API_URL}/jobs/${jobId}/data?${params.toString()}`);
+        const rows = await handleResponse(res);
+        return {
+            rows,
+            total: Number(res.headers.get('X-Total-Count') ?? rows.length),
+            nextCursor: res.headers.get('X-Next-Cursor') ?? undefined,
+        };
+    },
+
     cleanJob: async (jobId: string, instruction?: string, file?: string) => {
         const res = await fetch(`${API_URL}/jobs/${jobId}/clean`, {
             method: 'POST',
@@ -104,7 +187,24 @@ export const api = {
         return handleResponse(res);
     },
 
-    getDownloadUrl: (jobId: string, format: 'csv' | 'json' | 'sqlite' | 'parquet' = 'csv') => {
+    getDownloadUrl: (jobId: string, format: ExportFormat = 'csv') => {
         return `${API_URL}/jobs/${jobId}/download?format=${format}`;
+    },
+
+    getExportStatus: async (jobId: string, format: ExportFormat): Promise<ExportStatus> => {
+        const res = await fetch(`${API_URL}/jobs/${jobId}/exports/${format}`);
+        return handleResponse(res);
+    },
+
+    // Exports are built by the worker: wait until this one is ready, then download it
+    downloadExport: async (jobId: string, format: ExportFormat = 'csv', pollMs = 2000) => {
+        for (;;) {
+            const status = await api.getExportStatus(jobId, format);
+            if (status.status === 'ready') break;
+            if (status.status === 'empty') throw new Error('This job has no data to export');
+            if (status.status === 'failed') throw new Error(status.error || 'Export failed');
+            await new Promise((resolve) => setTimeout(resolve, pollMs));
+        }
+        window.location.href = api.getDownloadUrl(jobId, format);
     }
 };
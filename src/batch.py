@@ -0,0 +1,361 @@
+# src/batch.py
+"""
+Batch jobs: scrape a list of URLs (or every URL in a sitemap) as one job.
+
+process_batch_job expands the input and fans it out into shard jobs of
+`batch_shard_size` URLs on the same RQ queue, so any number of workers can
+work on one batch. Each shard writes its tables (with a source_url column) to
+data/{job_id}/shards/{n}/ and records its progress in jobs_db.batch_shards.
+finalize_batch_job runs once every shard has finished (or failed) and merges
+the shard tables into job-level outputs under data/{job_id}/, one table per
+distinct set of columns.
+"""
+import os
+import glob
+import gzip
+import json
+import pandas as pd
+from src import exports, jobs_db, fetch_strategy, storage
+from src.scraper.http_client import get_http_client, configure_from_options
+from src.scraper.fetcher import HEADERS
+from src.scraper.crawler import CrawlEngine, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST
+from src.scraper.dedupe import TableDeduper
+from src.scraper.stream_ingest import save_streamed_tables
+from src.tasks import DATA_DIR, _fetch_static, _open_http_cache, _open_renderer, _scrape_page, _post_webhook
+
+DEFAULT_SHARD_SIZE = 50
+DEFAULT_SITEMAP_MAX_URLS = 10000
+SITEMAP_MAX_DEPTH = 3
+# RQ timeout per shard: a floor plus a per-URL budget
+SHARD_TIMEOUT_BASE = 600
+SHARD_TIMEOUT_PER_URL = 30
+
+
+def _is_sitemap(value: str) -> bool:
+    v = (value or "").strip().lower().split("?")[0]
+    return v.endswith(".xml") or v.endswith(".xml.gz") or "sitemap" in v
+
+
+def fetch_sitemap_urls(url: str, limit: int = DEFAULT_SITEMAP_MAX_URLS, depth: int = 0) -> list:
+    """Page URLs listed in a sitemap; sitemap indexes are followed recursively."""
+    from lxml import etree
+
+    resp = get_http_client().get(url, headers=HEADERS)
+    resp.raise_for_status()
+    body = resp.content
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    root = etree.fromstring(body, parser=etree.XMLParser(recover=True, resolve_entities=False, no_network=True))
+    if root is None:
+        return []
+    locs = [(el.text or "").strip() for el in root.iter("{*}loc")]
+    locs = [loc for loc in locs if loc]
+    if etree.QName(root).localname != "sitemapindex":
+        return locs[:limit]
+    urls = []
+    if depth >= SITEMAP_MAX_DEPTH:
+        return urls
+    for child in locs:
+        if len(urls) >= limit:
+            break
+        try:
+            urls.extend(fetch_sitemap_urls(child, limit - len(urls), depth + 1))
+        except Exception as e:
+            print(f"Failed to read sitemap {child}: {e}")
+    return urls[:limit]
+
+
+def expand_batch_urls(payload: dict) -> list:
+    """
+    URLs of a batch payload: `urls` if given, else `value` as a sitemap URL or a
+    whitespace/comma separated URL list. Deduplicated, order preserved.
+    """
+    opts = payload.get("options", {}) or {}
+    urls = payload.get("urls") or []
+    value = (payload.get("value") or "").strip()
+    if not urls and value:
+        if _is_sitemap(value) and len(value.split()) == 1:
+            urls = fetch_sitemap_urls(value, int(opts.get("sitemap_max_urls", DEFAULT_SITEMAP_MAX_URLS)))
+        else:
+            urls = value.replace(",", " ").split()
+    seen = set()
+    result = []
+    for u in urls:
+        u = u.strip()
+        if u and u not in seen:
+            seen.add(u)
+            result.append(u)
+    return result
+
+
+def _shard_dir(job_id: str, shard: int) -> str:
+    return os.path.join(DATA_DIR, job_id, "shards", str(shard))
+
+
+def process_batch_job(job_id: str, payload: dict):
+    """
+    payload: {"type": "batch", "value": "<sitemap url or url list>", "urls": [...], "options": {...}}
+    Expands the URLs and enqueues one shard job per `batch_shard_size` URLs plus
+    a finalize job depending on all of them. Outside a worker (no current RQ job)
+    the shards run inline.
+    """
+    jobs_db.update_job_status(job_id, "running")
+    try:
+        opts = payload.get("options", {}) or {}
+        configure_from_options(opts)
+        urls = expand_batch_urls(payload)
+        if not urls:
+            jobs_db.update_job_status(job_id, "failed", {"error": "no URLs to scrape"})
+            return
+
+        size = max(1, int(opts.get("batch_shard_size", DEFAULT_SHARD_SIZE)))
+        shards = [urls[i:i + size] for i in range(0, len(urls), size)]
+        os.makedirs(os.path.join(DATA_DIR, job_id, "shards"), exist_ok=True)
+        for n, shard_urls in enumerate(shards):
+            jobs_db.update_shard_progress(job_id, n, "queued", len(shard_urls))
+        jobs_db.update_job_status(job_id, "running", {"urls": len(urls), "shards": len(shards)})
+
+        from rq import get_current_job
+        current = get_current_job()
+        if current is None:
+            for n, shard_urls in enumerate(shards):
+                process_batch_shard(job_id, n, shard_urls, opts)
+            finalize_batch_job(job_id, payload)
+            return
+
+        from rq import Queue
+        from rq.job import Dependency
+        queue = Queue(current.origin, connection=current.connection)
+        shard_jobs = [
+            queue.enqueue(
+                process_batch_shard,
+                job_id,
+                n,
+                shard_urls,
+                opts,
+                job_timeout=SHARD_TIMEOUT_BASE + SHARD_TIMEOUT_PER_URL * len(shard_urls),
+            )
+            for n, shard_urls in enumerate(shards)
+        ]
+        queue.enqueue(
+            finalize_batch_job,
+            job_id,
+            {k: v for k, v in payload.items() if k != "urls"},
+            depends_on=Dependency(jobs=shard_jobs, allow_failure=True),
+            job_timeout=SHARD_TIMEOUT_BASE,
+        )
+    except Exception as e:
+        jobs_db.update_job_status(job_id, "failed", {"error": str(e)})
+        raise
+
+
+def _write_shard_table(df: pd.DataFrame, path: str):
+    try:
+        df.to_parquet(path, index=False)
+    except Exception:
+        # mixed-type object columns: store them as text
+        df = df.copy()
+        for col in df.select_dtypes(["object"]).columns:
+            df[col] = df[col].astype(str)
+        df.to_parquet(path, index=False)
+
+
+def process_batch_shard(job_id: str, shard: int, urls: list, opts: dict):
+    """Scrape one shard of a batch job into data/{job_id}/shards/{shard}/."""
+    configure_from_options(opts)
+    shard_dir = _shard_dir(job_id, shard)
+    os.makedirs(shard_dir, exist_ok=True)
+    force_playwright = bool(opts.get("force_playwright", False))
+    state = {"force_playwright": force_playwright, "http_cache": _open_http_cache(opts)}
+    done = failed = rows = 0
+    failed_urls = []
+    files = []
+    # repeats from other URLs are kept (and recorded) unless dedupe_across_urls
+    deduper = TableDeduper(across_sources=bool(opts.get("dedupe_across_urls", False))) if opts.get("dedupe_tables", True) else None
+    jobs_db.update_shard_progress(job_id, shard, "running", len(urls))
+
+    # The shard's URLs are independent pages: fetch them all ahead on the engine
+    engine = None
+    if not force_playwright and len(urls) > 1:
+        engine = CrawlEngine(
+            lambda u: _fetch_static(u, opts, state["http_cache"]),
+            concurrency=opts.get("crawl_concurrency", DEFAULT_CONCURRENCY),
+            per_host=opts.get("crawl_per_host", DEFAULT_PER_HOST),
+        ).start()
+        for url in urls:
+            # no point fetching statically what will be rendered anyway
+            if not opts.get("learn_fetch_strategy", True) or fetch_strategy.peek_strategy(url) == fetch_strategy.STATIC:
+                engine.prefetch(url)
+    # URLs known to need a browser render concurrently, a window ahead of the loop;
+    # static->render fallbacks also render on it instead of the sync browser
+    render_at = [
+        i for i, u in enumerate(urls)
+        if force_playwright or (opts.get("learn_fetch_strategy", True) and fetch_strategy.peek_strategy(u) == fetch_strategy.RENDER)
+    ]
+    renderer = _open_renderer(opts) if len(render_at) > 1 else None
+    state["renderer"] = renderer
+    render_window = renderer.concurrency * 2 if renderer else 0
+    scheduled = 0
+    try:
+        for i, url in enumerate(urls):
+            while renderer is not None and scheduled < len(render_at) and render_at[scheduled] < i + render_window:
+                renderer.prefetch(urls[render_at[scheduled]])
+                scheduled += 1
+            # the static->render fallback is decided per URL, not for the whole shard
+            state["force_playwright"] = force_playwright
+            page = _scrape_page(
+                job_id,
+                url,
+                i + 1,
+                shard_dir,
+                opts,
+                state,
+                prefetched=engine.take(url) if engine else None,
+                prerendered=renderer.take(url) if renderer else None,
+            )
+            done += 1
+            if page.get("stream") is not None:
+                try:
+                    for t in save_streamed_tables(
+                        page["stream"],
+                        shard_dir,
+                        lambda k, i=i: f"url_{i + 1:05d}_table_{k}",
+                        formats=("parquet",),
+                        extra_columns={"source_url": url},
+                        deduper=deduper,
+                        text_parquet=True,
+                        source=url,
+                    ):
+                        files.extend(t["files"])
+                        rows += t["rows"]
+                except Exception as e:
+                    print(f"Streaming {url} failed: {e}")
+                    page["success"] = False
+            if not page["success"]:
+                failed += 1
+                failed_urls.append(url)
+            for t, df in enumerate(page["tables"]):
+                df = df.dropna(axis=1, how="all")
+                if df.empty:
+                    continue
+                name = f"url_{i + 1:05d}_table_{t + 1}.parquet"
+                # e.g. the same table found by two extraction strategies
+                if deduper is not None and deduper.check(df, name, source=url):
+                    continue
+                if "source_url" not in df.columns:
+                    df = df.copy()
+                    df.insert(0, "source_url", url)
+                _write_shard_table(df, os.path.join(shard_dir, name))
+                files.append(name)
+                rows += len(df)
+            jobs_db.update_shard_progress(job_id, shard, "running", len(urls), done, failed, rows)
+    except Exception:
+        jobs_db.update_shard_progress(job_id, shard, "failed", len(urls), done, failed, rows)
+        raise
+    finally:
+        if engine is not None:
+            engine.close()
+        if renderer is not None:
+            renderer.close()
+
+    with open(os.path.join(shard_dir, "_shard.json"), "w") as f:
+        json.dump({
+            "urls": urls,
+            "failed_urls": failed_urls,
+            "files": files,
+            "deduplicated": deduper.stats() if deduper is not None else None,
+            "async_render": renderer.stats() if renderer is not None else None,
+        }, f)
+    jobs_db.update_shard_progress(job_id, shard, "completed", len(urls), done, failed, rows)
+
+
+def finalize_batch_job(job_id: str, payload: dict):
+    """Merge all shard tables into job-level tables (see storage)."""
+    opts = payload.get("options", {}) or {}
+    webhook_url = opts.get("webhook_url")
+    job_dir = os.path.join(DATA_DIR, job_id)
+    shard_files = glob.glob(os.path.join(job_dir, "shards", "*", "*.parquet"))
+    shard_files.sort(key=lambda p: (int(os.path.basename(os.path.dirname(p))), os.path.basename(p)))
+
+    failed_urls = []
+    dedupe_tables = dedupe_rows = 0
+    for manifest in glob.glob(os.path.join(job_dir, "shards", "*", "_shard.json")):
+        try:
+            with open(manifest) as f:
+                info = json.load(f)
+            failed_urls.extend(info.get("failed_urls", []))
+            dedupe_tables += (info.get("deduplicated") or {}).get("tables", 0)
+            dedupe_rows += (info.get("deduplicated") or {}).get("rows", 0)
+        except Exception:
+            pass
+    # shards only dedupe within themselves; repeats across shards are handled
+    # here the same way; every kept shard table passes through here, so this
+    # deduper also records all repeats kept from different URLs
+    across_urls = bool(opts.get("dedupe_across_urls", False))
+    deduper = TableDeduper(across_sources=across_urls) if opts.get("dedupe_tables", True) else None
+
+    try:
+        import pyarrow.parquet as pq
+
+        # group shard tables by their columns; each group becomes one output table
+        groups = {}
+        for path in shard_files:
+            cols = tuple(pq.read_schema(path).names)
+            groups.setdefault(cols, []).append(path)
+
+        saved_files = []
+        total_rows = 0
+        for paths in groups.values():
+            frames = []
+            for p in paths:
+                part = pd.read_parquet(p)
+                name = os.path.relpath(p, job_dir)
+                source = str(part["source_url"].iloc[0]) if "source_url" in part.columns and len(part) else None
+                if deduper is not None and deduper.check(part, name, exclude=["source_url"], source=source):
+                    continue
+                frames.append(part)
+            if not frames:
+                continue
+            df = pd.concat(frames, ignore_index=True)
+            base_name = f"batch_table_{len(saved_files) + 1}"
+            storage.write_table(job_dir, base_name, df)
+            saved_files.append(storage.file_name(base_name))
+            total_rows += len(df)
+
+        progress = jobs_db.get_batch_progress(job_id) or {}
+        meta = {
+            "rows": total_rows,
+            "table_count": len(saved_files),
+            "urls": progress.get("urls_total"),
+            "urls_scraped": progress.get("urls_done"),
+            "urls_failed": len(failed_urls),
+            "failed_urls": failed_urls[:100],
+            "shards": progress.get("shards"),
+            "shards_incomplete": (progress.get("shards") or 0) - (progress.get("shards_finished") or 0),
+            "deduplicated": {
+                "tables": dedupe_tables + (deduper.skipped if deduper else 0),
+                "rows": dedupe_rows + (deduper.rows_skipped if deduper else 0),
+                "kept_duplicates": deduper.kept_duplicates if deduper else [],
+            },
+        }
+        if not saved_files:
+            meta["note"] = "no tables found"
+            pd.DataFrame().to_csv(os.path.join(job_dir, "no_data.csv"), index=False)
+        else:
+            exports.schedule_exports(job_id)
+        jobs_db.update_job_status(job_id, "completed", meta)
+    except Exception as e:
+        jobs_db.update_job_status(job_id, "failed", {"error": str(e)})
+        raise
+
+    if webhook_url:
+        try:
+            _post_webhook(webhook_url, {
+                "job_id": job_id,
+                "status": "completed",
+                "rows": total_rows,
+                "files": saved_files,
+                "download_url": f"/jobs/{job_id}/download"
+            })
+        except Exception as e:
+            print(f"Webhook failed: {e}")
@@ -0,0 +1,221 @@
+# src/browser_server.py
+"""
+Long-lived shared Chromium for all RQ workers.
+
+Launches Playwright's bundled Chromium with a CDP endpoint and keeps it alive:
+a health check polls /json/version and the browser is relaunched if the
+process exits or stops answering. Workers connect to it by setting
+BROWSER_CDP_URL (e.g. http://127.0.0.1:9222) instead of launching their own
+Chromium for every job.
+
+New headless Chromium ignores --remote-debugging-address and only listens on
+loopback, so Chromium's CDP port stays on 127.0.0.1 (BROWSER_INTERNAL_PORT)
+and a TCP forwarder exposes it on BROWSER_SERVER_HOST:BROWSER_SERVER_PORT.
+Startup fails unless /json/version answers through that forwarded address.
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+
+# Ensure project root (/app) is on sys.path so `src` is importable
+HERE = os.path.dirname(os.path.abspath(__file__))       # /app/src
+PROJECT_ROOT = os.path.dirname(HERE)                    # /app
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv("BROWSER_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("BROWSER_SERVER_PORT", "9222"))
+# Chromium's own (loopback-only) CDP port, forwarded to HOST:PORT
+INTERNAL_PORT = int(os.getenv("BROWSER_INTERNAL_PORT", str(PORT + 1)))
+HEALTH_INTERVAL = float(os.getenv("BROWSER_HEALTH_INTERVAL", "5"))
+HEALTH_FAILURES = int(os.getenv("BROWSER_HEALTH_FAILURES", "3"))  # consecutive failures before relaunch
+STARTUP_TIMEOUT = 30.0
+
+
+def _chromium_executable() -> str:
+    from playwright.sync_api import sync_playwright
+    pw = sync_playwright().start()
+    try:
+        return pw.chromium.executable_path
+    finally:
+        pw.stop()
+
+
+def _healthy(port: int = INTERNAL_PORT) -> bool:
+    try:
+        resp = requests.get(f"http://127.0.0.1:{port}/json/version", timeout=2)
+        return resp.ok and "webSocketDebuggerUrl" in resp.json()
+    except Exception:
+        return False
+
+
+class TcpForwarder:
+    """Accepts connections on (host, port) and pipes each one to 127.0.0.1:target_port."""
+
+    def __init__(self, host: str, port: int, target_port: int):
+        self.target_port = target_port
+        self.sock = socket.create_server((host, port))
+        self._thread = threading.Thread(target=self._accept_loop, name="cdp-forwarder", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        try:
+            # wakes the blocked accept(); close() alone leaves the port listening
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(("127.0.0.1", self.target_port), timeout=5)
+                upstream.settimeout(None)
+            except OSError as exc:
+                logger.warning("CDP forwarder: Chromium not reachable on %s: %s", self.target_port, exc)
+                client.close()
+                continue
+            for src, dst in ((client, upstream), (upstream, client)):
+                threading.Thread(target=self._pipe, args=(src, dst), daemon=True).start()
+
+    @staticmethod
+    def _pipe(src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                s.close()
+
+
+class BrowserServer:
+    def __init__(self):
+        self.executable = _chromium_executable()
+        self.proc = None
+        self.profile_dir = None
+        self.launches = 0
+        self._stopping = False
+        self.forwarder = TcpForwarder(HOST, PORT, INTERNAL_PORT).start()
+
+    def launch(self):
+        self.profile_dir = tempfile.mkdtemp(prefix="adf-chromium-")
+        args = [
+            self.executable,
+            "--headless=new",
+            "--no-sandbox",
+            "--disable-dev-shm-usage",
+            "--no-first-run",
+            "--no-default-browser-check",
+            f"--remote-debugging-port={INTERNAL_PORT}",
+            f"--user-data-dir={self.profile_dir}",
+            "about:blank",
+        ]
+        logger.info("Launching shared Chromium on 127.0.0.1:%s (served on %s:%s)", INTERNAL_PORT, HOST, PORT)
+        self.proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.launches += 1
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Chromium exited during startup (code {self.proc.returncode})")
+            if _healthy():
+                # what workers will see: the endpoint through the forwarder
+                if not _healthy(PORT):
+                    raise RuntimeError(f"Chromium is up but its CDP endpoint is not reachable on port {PORT}")
+                logger.info("Shared Chromium ready on port %s (launch #%s, pid %s)", PORT, self.launches, self.proc.pid)
+                return
+            time.sleep(0.2)
+        raise RuntimeError("Chromium did not expose its CDP endpoint in time")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def relaunch(self):
+        self.stop()
+        self.launch()
+
+    def serve_forever(self):
+        self.launch()
+        failures = 0
+        while not self._stopping:
+            time.sleep(HEALTH_INTERVAL)
+            if self._stopping:
+                break
+            if self.proc.poll() is not None:
+                logger.warning("Shared Chromium exited (code %s), relaunching", self.proc.returncode)
+                self._safe_relaunch()
+                failures = 0
+                continue
+            if _healthy():
+                failures = 0
+                continue
+            failures += 1
+            logger.warning("Shared Chromium health check failed (%s/%s)", failures, HEALTH_FAILURES)
+            if failures >= HEALTH_FAILURES:
+                self._safe_relaunch()
+                failures = 0
+
+    def _safe_relaunch(self):
+        try:
+            self.relaunch()
+        except Exception as exc:
+            logger.exception("Relaunch failed: %s", exc)
+
+    def shutdown(self, *_):
+        self._stopping = True
+        self.stop()
+        self.forwarder.close()
+
+
+def main():
+    server = BrowserServer()
+    signal.signal(signal.SIGTERM, lambda *a: (server.shutdown(), sys.exit(0)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
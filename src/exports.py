@@ -0,0 +1,299 @@
+# src/exports.py
+"""
+Prebuilt job exports.
+
+JSON, SQLite and Parquet downloads used to be produced inside the request.
+schedule_exports() queues build_exports() on the worker when a job (or a
+cleaning run) finishes, and it materializes them into data/{job_id}/exports/.
+Every artifact is keyed by the fingerprint of the job's stored tables (names,
+sizes and mtimes, see fingerprint()): writing a table, e.g. cleaned_*,
+changes the key, so an artifact is never served for tables it wasn't built
+from. Each build keeps a status file ({fmt}-{fingerprint}.status.json) that
+/download reports as 202 progress until the artifact is ready.
+
+Builds run on their own RQ queue (EXPORT_QUEUE), which workers check before
+the scrape queue, so a download never waits behind long crawls or batches;
+builds requested by a download go to its front.
+
+The artifacts of all jobs together are capped at EXPORT_CACHE_MAX_MB; the
+least recently served ones are evicted first and rebuilt on demand.
+Formats not in PREBUILT_FORMATS (CSV by default) are streamed by /download.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from src import storage
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.getcwd(), "data")
+EXPORT_DIR = "exports"
+EXPORT_QUEUE = os.getenv("EXPORT_QUEUE", "exports")
+FORMATS = ("csv", "json", "parquet", "sqlite")
+PREBUILT_FORMATS = tuple(
+    f for f in (x.strip() for x in os.getenv("EXPORT_PREBUILD", "json,sqlite,parquet").split(",")) if f in FORMATS
+)
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "2048"))
+BUILD_TIMEOUT = 1800
+BUILD_STALE_S = BUILD_TIMEOUT  # a queued/building status older than this lost its worker
+FAILED_RETRY_S = 300  # a failed build is retried on demand after this long
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(DATA_DIR, job_id)
+
+
+def fingerprint(job_dir: str) -> Optional[str]:
+    """Key of the job's current tables; None when it has none."""
+    names = storage.list_tables(job_dir)
+    if not names:
+        return None
+    h = hashlib.sha1()
+    for name in names:
+        path = storage.table_path(job_dir, name)
+        st = os.stat(path)
+        h.update(f"{name}\0{os.path.basename(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def _download_name(job_id: str, names, fmt: str) -> str:
+    if fmt == "sqlite":
+        return f"{job_id}.db"
+    if len(names) == 1:
+        return f"{names[0]}.{fmt}"
+    return f"{job_id}_{fmt}.zip"
+
+
+def _status_path(job_dir: str, fmt: str, fp: str) -> str:
+    return os.path.join(job_dir, EXPORT_DIR, f"{fmt}-{fp}.status.json")
+
+
+def _read_status(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_status(path: str, status: Dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    status = dict(status, updated=time.time())
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def lookup(job_id: str, fmt: str) -> Dict:
+    """
+    Where the `fmt` export of the job's current tables stands:
+    {"status": "ready", "path", "download_name"} or {"status": "queued" |
+    "building" | "failed" | "missing", ...progress}; "empty" without tables.
+    """
+    job_dir = _job_dir(job_id)
+    names = storage.list_tables(job_dir)
+    if fmt == "sqlite" and not storage.load_manifest(job_dir):
+        # jobs from before the table store wrote their data.db directly
+        legacy = os.path.join(job_dir, "data.db")
+        if os.path.exists(legacy):
+            return {"status": "ready", "format": fmt, "path": legacy, "download_name": f"{job_id}.db"}
+    fp = fingerprint(job_dir)
+    if fp is None:
+        return {"status": "empty", "format": fmt}
+    if fmt != "sqlite" and len(names) == 1:
+        stored = storage.source_file(job_dir, names[0], fmt)
+        if stored:
+            return {"status": "ready", "format": fmt, "path": stored, "download_name": _download_name(job_id, names, fmt)}
+    status = _read_status(_status_path(job_dir, fmt, fp))
+    if status is None:
+        return {"status": "missing", "format": fmt, "fingerprint": fp}
+    if status.get("status") == "ready":
+        path = os.path.join(job_dir, EXPORT_DIR, status["file"])
+        if not os.path.exists(path):
+            return {"status": "missing", "format": fmt, "fingerprint": fp}
+        return dict(status, path=path)
+    return status
+
+
+def touch(path: str):
+    """Mark an artifact as just served (eviction removes the least recently served first)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _needs_build(status: Dict) -> bool:
+    age = time.time() - (status.get("updated") or 0)
+    if status["status"] == "missing":
+        return True
+    if status["status"] in ("queued", "building"):
+        return age > BUILD_STALE_S
+    if status["status"] == "failed":
+        return age > FAILED_RETRY_S
+    return False
+
+
+def request_export(job_id: str, fmt: str, queue=None) -> Dict:
+    """
+    lookup(), queueing a build when there is none under way for the current
+    tables; someone is waiting for it, so it goes to the front of `queue`.
+    """
+    status = lookup(job_id, fmt)
+    if _needs_build(status):
+        schedule_exports(job_id, [fmt], queue=queue, at_front=True)
+        status = lookup(job_id, fmt)
+    return status
+
+
+def schedule_exports(job_id: str, formats: Optional[Iterable[str]] = None, queue=None, at_front: bool = False):
+    """
+    Queue build_exports for the job on `queue`; inside an RQ job the
+    EXPORT_QUEUE is used, outside of one the exports are built right away.
+    """
+    formats = list(PREBUILT_FORMATS if formats is None else formats)
+    if not formats:
+        return
+    if queue is None:
+        from rq import get_current_job
+        current = get_current_job()
+        if current is None:
+            try:
+                build_exports(job_id=job_id, formats=formats)
+            except Exception as e:
+                logger.warning("Building exports of %s failed: %s", job_id, e)
+            return
+        from rq import Queue
+        queue = Queue(EXPORT_QUEUE, connection=current.connection)
+    job_dir = _job_dir(job_id)
+    fp = fingerprint(job_dir)
+    if fp is None:
+        return
+    queued = {}
+    for fmt in formats:
+        path = _status_path(job_dir, fmt, fp)
+        status = _read_status(path)
+        if status is None or status.get("status") not in ("ready", "building"):
+            queued[fmt] = {"status": "queued", "format": fmt, "fingerprint": fp}
+            _write_status(path, queued[fmt])
+    try:
+        # keyword arguments only: the worker's stuck-job handler fails the job named by args[0]
+        queue.enqueue(build_exports, job_id=job_id, formats=formats, job_timeout=BUILD_TIMEOUT, at_front=at_front)
+    except Exception as e:
+        logger.warning("Could not schedule exports of %s: %s", job_id, e)
+        for fmt, status in queued.items():
+            _write_status(_status_path(job_dir, fmt, fp), dict(status, status="failed", error=f"not queued: {e}"))
+
+
+def _write_chunks(path: str, chunks):
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _build(job_id: str, job_dir: str, names, fmt: str, fp: str):
+    status_path = _status_path(job_dir, fmt, fp)
+    progress = {"status": "building", "format": fmt, "fingerprint": fp, "tables_done": 0, "tables_total": len(names)}
+    _write_status(status_path, progress)
+
+    def _table_done(_name=None):
+        progress["tables_done"] += 1
+        _write_status(status_path, progress)
+
+    download_name = _download_name(job_id, names, fmt)
+    file = f"{fmt}-{fp}{os.path.splitext(download_name)[1]}"
+    path = os.path.join(job_dir, EXPORT_DIR, file)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    started = time.monotonic()
+    try:
+        if fmt == "sqlite":
+            storage.write_sqlite(job_dir, tmp, on_table=_table_done)
+        elif len(names) == 1:
+            _write_chunks(tmp, storage.iter_export(job_dir, names[0], fmt))
+            _table_done()
+        else:
+            def _entries():
+                for name in names:
+                    yield f"{name}.{fmt}", storage.iter_export(job_dir, name, fmt)
+                    _table_done()
+            # Parquet is compressed already
+            _write_chunks(tmp, storage.iter_zip(_entries(), compress=fmt != "parquet"))
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.exception("Export %s of %s failed: %s", fmt, job_id, e)
+        _remove(tmp)
+        _write_status(status_path, dict(progress, status="failed", error=str(e)))
+        return
+    _write_status(status_path, dict(
+        progress,
+        status="ready",
+        file=file,
+        download_name=download_name,
+        size=os.path.getsize(path),
+        build_ms=int((time.monotonic() - started) * 1000),
+    ))
+
+
+def _drop_superseded(job_dir: str, fmt: str, fp: str):
+    # artifacts of earlier tables can never be served again
+    for status_path in glob.glob(os.path.join(job_dir, EXPORT_DIR, f"{fmt}-*.status.json")):
+        if status_path == _status_path(job_dir, fmt, fp):
+            continue
+        status = _read_status(status_path) or {}
+        if status.get("file"):
+            _remove(os.path.join(job_dir, EXPORT_DIR, status["file"]))
+        _remove(status_path)
+
+
+def build_exports(job_id: str, formats: Optional[Iterable[str]] = None):
+    """Materialize the job's exports in `formats` (default PREBUILT_FORMATS) for its current tables."""
+    job_dir = _job_dir(job_id)
+    for fmt in (PREBUILT_FORMATS if formats is None else formats):
+        if fmt not in FORMATS:
+            continue
+        status = lookup(job_id, fmt)
+        if status["status"] in ("ready", "empty"):
+            continue
+        if status["status"] == "building" and not _needs_build(status):
+            continue  # another worker is on it
+        fp = fingerprint(job_dir)
+        _build(job_id, job_dir, storage.list_tables(job_dir), fmt, fp)
+        _drop_superseded(job_dir, fmt, fp)
+    evict()
+
+
+def evict(max_mb: int = EXPORT_CACHE_MAX_MB):
+    """Remove the least recently served artifacts until all jobs' artifacts fit in max_mb."""
+    artifacts = []
+    for status_path in glob.glob(os.path.join(DATA_DIR, "*", EXPORT_DIR, "*.status.json")):
+        status = _read_status(status_path) or {}
+        if status.get("status") != "ready" or not status.get("file"):
+            continue
+        path = os.path.join(os.path.dirname(status_path), status["file"])
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        artifacts.append((st.st_mtime, st.st_size, path, status_path))
+    total = sum(a[1] for a in artifacts)
+    limit = max_mb * 1024 * 1024
+    for _, size, path, status_path in sorted(artifacts):
+        if total <= limit:
+            break
+        logger.info("Evicting export %s (%d bytes)", path, size)
+        _remove(path)
+        _remove(status_path)
+        total -= size
@@ -0,0 +1,71 @@
+# src/fetch_strategy.py
+"""
+Per-domain fetch strategy learning.
+
+Every page first tries a plain requests fetch and only renders with Playwright
+when that yields no tables. On JS-rendered sites the static attempt is wasted
+on every page, so the outcome (and duration) of each path is recorded per
+domain in jobs_db.domain_strategies, as moving averages. Once the static path
+keeps failing on a domain where rendering works, later pages and jobs go
+straight to rendering; every REPROBE_EVERY routed pages the static path is
+tried again in case the site changed.
+"""
+import time
+from urllib.parse import urlsplit
+
+from src import jobs_db
+
+STATIC = "static"
+RENDER = "render"
+
+MIN_STATIC_ATTEMPTS = 3
+STATIC_SUCCESS_FLOOR = 0.2  # route to rendering below this static success rate
+RENDER_SUCCESS_FLOOR = 0.5  # ... as long as rendering itself mostly works
+REPROBE_EVERY = 20
+
+
+def _domain(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def _learned(row) -> str:
+    if not row or (row["static_attempts"] or 0) < MIN_STATIC_ATTEMPTS:
+        return STATIC
+    if row["static_rate"] is None or row["static_rate"] >= STATIC_SUCCESS_FLOOR:
+        return STATIC
+    if row["render_rate"] is None or row["render_rate"] < RENDER_SUCCESS_FLOOR:
+        return STATIC
+    return RENDER
+
+
+def _lookup(domain: str):
+    try:
+        return jobs_db.get_domain_strategy(domain)
+    except Exception:
+        return None
+
+
+def peek_strategy(url: str) -> str:
+    """The learned strategy for `url`'s domain, without counting towards a re-probe."""
+    return _learned(_lookup(_domain(url)))
+
+
+def choose_strategy(url: str) -> str:
+    """STATIC or RENDER for the next page of `url`'s domain (re-probing STATIC periodically)."""
+    domain = _domain(url)
+    row = _lookup(domain)
+    if _learned(row) == STATIC:
+        return STATIC
+    if (row["since_probe"] or 0) >= REPROBE_EVERY:
+        jobs_db.set_strategy_probe_counter(domain, 0)
+        return STATIC
+    jobs_db.set_strategy_probe_counter(domain)
+    return RENDER
+
+
+def record_outcome(url: str, strategy: str, success: bool, started: float):
+    """Record whether `strategy` produced tables; `started` is a time.monotonic() stamp."""
+    try:
+        jobs_db.record_fetch_outcome(_domain(url), strategy, success, (time.monotonic() - started) * 1000)
+    except Exception as e:
+        print(f"Failed to record fetch strategy for {url}: {e}")
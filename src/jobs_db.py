@@ -23,6 +23,33 @@ def init_db():
         created_at TEXT DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    # per-shard progress of batch jobs; each shard only ever writes its own row
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS batch_shards (
+        job_id TEXT,
+        shard INTEGER,
+        status TEXT,
+        total INTEGER,
+        done INTEGER,
+        failed INTEGER,
+        rows INTEGER,
+        PRIMARY KEY (job_id, shard)
+    )
+    """)
+    # learned fetch strategy per domain (see src/fetch_strategy.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS domain_strategies (
+        domain TEXT PRIMARY KEY,
+        static_rate REAL,
+        static_attempts INTEGER DEFAULT 0,
+        static_ms REAL,
+        render_rate REAL,
+        render_attempts INTEGER DEFAULT 0,
+        render_ms REAL,
+        since_probe INTEGER DEFAULT 0,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
     conn.commit()
     conn.close()
 
@@ -67,3 +94,79 @@ def get_job(job_id: str):
         "metadata": json.loads(row[4] or "{}"),
         "created_at": row[5],
     }
+
+def update_shard_progress(job_id: str, shard: int, status: str, total: int, done: int = 0, failed: int = 0, rows: int = 0):
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT OR REPLACE INTO batch_shards (job_id, shard, status, total, done, failed, rows) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (job_id, shard, status, total, done, failed, rows)
+    )
+    conn.commit()
+    conn.close()
+
+def fail_shard(job_id: str, shard: int):
+    """Mark one shard of a batch job failed, keeping its progress counts."""
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute("UPDATE batch_shards SET status='failed' WHERE job_id=? AND shard=?", (job_id, shard))
+    conn.commit()
+    conn.close()
+
+def get_batch_progress(job_id: str):
+    """Aggregate progress over all shards of a batch job (None if it has none)."""
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute("SELECT status, total, done, failed, rows FROM batch_shards WHERE job_id=?", (job_id,))
+    rows = cur.fetchall()
+    conn.close()
+    if not rows:
+        return None
+    return {
+        "shards": len(rows),
+        "shards_finished": sum(1 for r in rows if r[0] in ("completed", "failed")),
+        "urls_total": sum(r[1] or 0 for r in rows),
+        "urls_done": sum(r[2] or 0 for r in rows),
+        "urls_failed": sum(r[3] or 0 for r in rows),
+        "rows": sum(r[4] or 0 for r in rows),
+    }
+
+STRATEGY_COLUMNS = ("domain", "static_rate", "static_attempts", "static_ms", "render_rate", "render_attempts", "render_ms", "since_probe")
+
+def get_domain_strategy(domain: str):
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(STRATEGY_COLUMNS)} FROM domain_strategies WHERE domain=?", (domain,))
+    row = cur.fetchone()
+    conn.close()
+    return dict(zip(STRATEGY_COLUMNS, row)) if row else None
+
+def record_fetch_outcome(domain: str, strategy: str, success: bool, elapsed_ms: float, alpha: float = 0.3):
+    """Fold one outcome of `strategy` ("static" or "render") into the domain's moving averages."""
+    if strategy not in ("static", "render"):
+        raise ValueError(f"unknown strategy {strategy}")
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO domain_strategies (domain) VALUES (?)", (domain,))
+    cur.execute(
+        f"""UPDATE domain_strategies SET
+            {strategy}_rate = CASE WHEN {strategy}_rate IS NULL THEN ? ELSE {strategy}_rate * (1 - ?) + ? * ? END,
+            {strategy}_ms = CASE WHEN {strategy}_ms IS NULL THEN ? ELSE {strategy}_ms * (1 - ?) + ? * ? END,
+            {strategy}_attempts = {strategy}_attempts + 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE domain=?""",
+        (float(success), alpha, float(success), alpha, elapsed_ms, alpha, elapsed_ms, alpha, domain)
+    )
+    conn.commit()
+    conn.close()
+
+def set_strategy_probe_counter(domain: str, value: Optional[int] = None):
+    """Increment the pages-since-last-probe counter, or reset it to `value`."""
+    conn = _connect()
+    cur = conn.cursor()
+    if value is None:
+        cur.execute("UPDATE domain_strategies SET since_probe = since_probe + 1 WHERE domain=?", (domain,))
+    else:
+        cur.execute("UPDATE domain_strategies SET since_probe = ? WHERE domain=?", (value, domain))
+    conn.commit()
+    conn.close()
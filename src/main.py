@@ -1,22 +1,22 @@
 # src/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Literal
 import uuid
 import os
 from src import jobs_db
 from src import analysis
-import sqlite3
+from src import exports, storage
 import pandas as pd
 import numpy as np
 from rq import Queue
 from redis import Redis
-import zipfile
-import glob
 
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 redis_conn = Redis.from_url(REDIS_URL)
 q = Queue(connection=redis_conn)
+export_q = Queue(exports.EXPORT_QUEUE, connection=redis_conn)
 
 app = FastAPI(title="AutoDataFlow")
 
@@ -26,6 +26,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # paging headers of /jobs/{job_id}/data
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 
@@ -41,11 +43,57 @@ class JobOptions(BaseModel):
     llm_api_key: str | None = os.getenv("LLM_API_KEY")
     llm_prompt: str | None = None
     llm_model: str = "gemini-2.5-flash"
+    # shared HTTP client (keep-alive pools); http2 needs httpx[http2] installed
+    http_pool_connections: int = 10
+    http_pool_maxsize: int = 10
+    http_connect_timeout: float = 5.0
+    http_read_timeout: float = 10.0
+    http2: bool = False
+    # crawl engine: global in-flight cap and per-host limit
+    crawl_concurrency: int = 8
+    crawl_per_host: int = 2
+    # predict ?page=N style URLs from pages 1-2 and prefetch them ahead
+    pagination_inference: bool = True
+    # route domains whose static fetch keeps finding no tables straight to rendering
+    learn_fetch_strategy: bool = True
+    # write identical tables (same headers and cells) only once per job
+    dedupe_tables: bool = True
+    # batches: also drop a table repeating one from a different URL (by default
+    # it is kept and only listed under deduplicated.kept_duplicates)
+    dedupe_across_urls: bool = False
+    # conditional page cache under data/_http_cache (ETag / Last-Modified); opt-in
+    http_cache: bool = False
+    http_cache_ttl: int = 0
+    http_cache_max_mb: int = 512
+    # Playwright request interception; None keeps the built-in defaults
+    block_resources: bool = True
+    block_resource_types: list[str] | None = None
+    block_domains: list[str] | None = None
+    allow_xhr_domains: list[str] = []
+    # hard upper bound (ms) on the post-navigation DOM-stability wait
+    render_wait_max_ms: int = 3000
+    # row budget per virtualized grid (ag-Grid, MUI, ...)
+    max_grid_rows: int = 10000
+    # read grids from the JSON XHR/fetch responses behind them when they match
+    capture_xhr: bool = True
+    # rendered crawls page through SPAs in one browser page: click next controls,
+    # scroll for infinite loads, or both ("auto"); "off" opens each page URL anew
+    session_pagination: Literal["auto", "click", "scroll", "off"] = "auto"
+    # pages a crawl/batch worker renders at once on one browser (1 = one at a time)
+    render_concurrency: int = 4
+    # pages above this size are parsed as a stream straight to disk (0 = never);
+    # bodies above max_body_mb fail the page
+    stream_threshold_mb: int = 16
+    max_body_mb: int = 512
+    # batch jobs: URLs per shard job, cap on URLs taken from a sitemap
+    batch_shard_size: int = 50
+    sitemap_max_urls: int = 10000
 
 
 class JobRequest(BaseModel):
-    type: str  # "url" or "prompt"
-    value: str
+    type: str  # "url", "prompt" or "batch"
+    value: str = ""  # batch: sitemap URL or whitespace/comma separated URLs
+    urls: list[str] | None = None  # batch: explicit URL list
     options: JobOptions = JobOptions()
 
 
@@ -68,11 +116,18 @@ def startup_event():
 
 @app.post('/jobs')
 def create_job(req: JobRequest):
-    if req.type not in ("url", "prompt"):
-        raise HTTPException(status_code=400, detail="type must be 'url' or 'prompt'")
+    if req.type not in ("url", "prompt", "batch"):
+        raise HTTPException(status_code=400, detail="type must be 'url', 'prompt' or 'batch'")
+    if req.type == "batch" and not (req.urls or req.value.strip()):
+        raise HTTPException(status_code=400, detail="batch jobs need 'urls' or a sitemap/URL list in 'value'")
     job_id = str(uuid.uuid4())
-    jobs_db.create_job(job_id, req.type, req.value)
+    jobs_db.create_job(job_id, req.type, req.value or f"{len(req.urls or [])} URLs")
     # enqueue background worker task; pass the dict so options are serializable
+    if req.type == "batch":
+        # fans out into shard jobs on the same queue
+        from src.batch import process_batch_job
+        q.enqueue(process_batch_job, job_id, req.dict())
+        return {"job_id": job_id}
     from src.tasks import process_url_job
     q.enqueue(process_url_job, job_id, req.dict())
     return {"job_id": job_id}
@@ -83,13 +138,65 @@ def get_job(job_id: str):
     job = jobs_db.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
+    if job["type"] == "batch":
+        job["metadata"]["progress"] = jobs_db.get_batch_progress(job_id)
     return job
 
 
+class ResumeRequest(BaseModel):
+    # the checkpoint never stores the LLM key; pass it again to keep the LLM fallback
+    llm_api_key: str | None = None
+
+
+@app.post('/jobs/{job_id}/resume')
+def resume_job(job_id: str, req: ResumeRequest = ResumeRequest(), force: bool = False):
+    """Continue a crashed or timed-out crawl from its last completed page."""
+    job = jobs_db.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if job["status"] == "completed":
+        raise HTTPException(status_code=409, detail="job already completed")
+    if job["status"] in ("queued", "running") and not force:
+        raise HTTPException(status_code=409, detail="job is still running; pass force=true if its worker died")
+    from src.tasks import process_url_job, load_checkpoint
+    checkpoint = load_checkpoint(job_id)
+    if not checkpoint:
+        raise HTTPException(status_code=404, detail="no checkpoint to resume from")
+    payload = checkpoint["payload"]
+    if req.llm_api_key:
+        payload.setdefault("options", {})["llm_api_key"] = req.llm_api_key
+    resumed_from = checkpoint.get("completed_page", 0) + 1
+    jobs_db.update_job_status(job_id, "queued", {"resumed_from_page": resumed_from, "error": None, "resumable": None})
+    q.enqueue(process_url_job, job_id, payload, resume=True)
+    return {"job_id": job_id, "resumed_from_page": resumed_from}
+
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+EXPORT_RETRY_AFTER_S = 2
+
+
+def _export_progress(state: dict) -> dict:
+    return {k: state.get(k) for k in ("status", "format", "tables_done", "tables_total", "error")}
+
+
+def _export_chunks(job_dir: str, table: str, fmt: str):
+    # headers are sent by now: a table failing halfway can only be logged (and is cut short)
+    try:
+        yield from storage.iter_export(job_dir, table, fmt)
+    except Exception as e:
+        print(f"Failed to export {table} as {fmt}: {e}")
+
+
 @app.get('/jobs/{job_id}/download')
 def download(job_id: str, format: str = 'csv'):
     try:
-        from fastapi.responses import FileResponse
+        from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
         job = jobs_db.get_job(job_id)
         if not job:
             raise HTTPException(status_code=404, detail="job not found")
@@ -116,146 +223,50 @@ def download(job_id: str, format: str = 'csv'):
                  return FileResponse(path, filename=os.path.basename(path))
             raise HTTPException(status_code=404, detail="export not found")
     
-        # New structure logic
-        if format == 'sqlite':
-            try:
-                path = os.path.join(job_dir, "data.db")
-                
-                # On-demand generation if missing
-                if not os.path.exists(path):
-                     csv_files = glob.glob(os.path.join(job_dir, "*.csv"))
-                     if csv_files:
-                         try:
-                             # Ensure we don't lock the file for long
-                             conn = sqlite3.connect(path)
-                             for f in csv_files:
-                                 try:
-                                     df = pd.read_csv(f)
-                                     table_name = os.path.basename(f).replace(".csv", "")
-                                     df.to_sql(table_name, conn, index=False, if_exists="replace")
-                                 except Exception:
-                                     pass
-                             conn.close()
-                         except Exception:
-                             pass
-    
-                if os.path.exists(path):
-                    return FileResponse(path, filename=f"{job_id}.db")
-                raise HTTPException(status_code=404, detail="sqlite export not found")
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                raise HTTPException(status_code=500, detail=f"SQLite Export Error: {str(e)}")
-    
-        # JSON Handling
-        if format == 'json':
-            # Source is CSVs
-            csv_files = glob.glob(os.path.join(job_dir, "*.csv"))
-            if not csv_files:
-                 raise HTTPException(status_code=404, detail="no data found to convert to json")
-                 
-            json_files = []
-            for f in csv_files:
-                try:
-                    # Convert to JSON
-                    df = pd.read_csv(f)
-                    base_name = os.path.basename(f).replace(".csv", ".json")
-                    json_path = os.path.join(job_dir, base_name)
-                    df.to_json(json_path, orient='records', indent=2)
-                    json_files.append(json_path)
-                except Exception as e:
-                    print(f"Failed to convert {f}: {e}")
-            
-            if not json_files:
-                 raise HTTPException(status_code=500, detail="failed to convert data to json")
-    
-            if len(json_files) == 1:
-                return FileResponse(json_files[0], filename=os.path.basename(json_files[0]))
-                
-            zip_filename = f"{job_id}_json.zip"
-            zip_path = os.path.join(job_dir, zip_filename)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for f in json_files:
-                    zf.write(f, arcname=os.path.basename(f))
-            return FileResponse(zip_path, filename=zip_filename)
-    
-        # Parquet Handling (On-Demand)
-        if format == 'parquet':
-            # Check existing
-            files = glob.glob(os.path.join(job_dir, "*.parquet"))
-            
-            # If none, generate from CSV
-            if not files:
-                csv_files = glob.glob(os.path.join(job_dir, "*.csv"))
-                for f in csv_files:
-                    try:
-                        df = pd.read_csv(f)
-                        # Convert object columns to string to avoid PyArrow serialization errors
-                        for col in df.select_dtypes(['object']).columns:
-                            df[col] = df[col].astype(str)
-                            
-                        base_name = os.path.basename(f).replace(".csv", ".parquet")
-                        pq_path = os.path.join(job_dir, base_name)
-                        df.to_parquet(pq_path, index=False)
-                        files.append(pq_path)
-                    except Exception as e:
-                        print(f"Failed to convert {f} to parquet: {e}")
-    
-            if not files:
-                 raise HTTPException(status_code=404, detail="no parquet files found")
-    
-            if len(files) == 1:
-                return FileResponse(files[0], filename=os.path.basename(files[0]))
-                
-            zip_filename = f"{job_id}_parquet.zip"
-            zip_path = os.path.join(job_dir, zip_filename)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for f in files:
-                    zf.write(f, arcname=os.path.basename(f))
-            return FileResponse(zip_path, filename=zip_filename)
-    
-        # Fallback to simple glob for CSV (or if format passed is technically handled above but fell through)
-        extension = "csv"
-        files = glob.glob(os.path.join(job_dir, f"*.{extension}"))
+        # New structure logic: exports are derived from the stored tables
+        tables = storage.list_tables(job_dir)
+        # JSON / Parquet / SQLite / CSV (anything else falls back to CSV)
+        extension = format if format in exports.FORMATS else "csv"
+        
+        # Prebuilt by the worker (see src/exports.py): serve it, or report progress
+        if extension in exports.PREBUILT_FORMATS or extension == "sqlite":
+            state = exports.request_export(job_id, extension, queue=export_q)
+            if state["status"] == "ready":
+                exports.touch(state["path"])
+                return FileResponse(state["path"], filename=state["download_name"])
+            if state["status"] == "failed":
+                raise HTTPException(status_code=500, detail=f"Export failed: {state.get('error')}")
+            if state["status"] != "empty":
+                return JSONResponse(_export_progress(state), status_code=202, headers={"Retry-After": str(EXPORT_RETRY_AFTER_S)})
         
-        if not files:
+        if not tables:
+            no_data = os.path.join(job_dir, storage.NO_DATA_FILE)
+            if extension == "csv" and os.path.exists(no_data):
+                return FileResponse(no_data, filename=storage.NO_DATA_FILE)
             raise HTTPException(status_code=404, detail=f"no {format} files found")
+        if extension == "sqlite":
+            raise HTTPException(status_code=404, detail="sqlite export not found")
             
-        # If only one file, return it directly
-        if len(files) == 1:
-            return FileResponse(files[0], filename=os.path.basename(files[0]))
+        # A single table stored in the requested format is served as is (with Range support)
+        if len(tables) == 1:
+            stored = storage.source_file(job_dir, tables[0], extension)
+            if stored:
+                return FileResponse(stored, filename=f"{tables[0]}.{extension}")
+            return StreamingResponse(
+                _export_chunks(job_dir, tables[0], extension),
+                media_type=EXPORT_MEDIA_TYPES[extension],
+                headers={"Content-Disposition": f'attachment; filename="{tables[0]}.{extension}"'},
+            )
             
-        # If multiple files, zip them
-        import uuid
-        # If multiple files, zip them
-        # Use unique name to avoid Windows file locking if previous download failed/open
-        zip_filename = f"{job_id}_{format}_{uuid.uuid4().hex[:8]}.zip"
-        zip_path = os.path.join(job_dir, zip_filename)
-        
-        try:
-            # Create zip if not exists (or always recreate to be safe)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for f in files:
-                    # Avoid zipping the zip itself if it somehow matches (unlikely with .csv ext)
-                    if f == zip_path: 
-                        continue
-                    try:
-                        zf.write(f, arcname=os.path.basename(f))
-                    except Exception as e:
-                        print(f"Warning: could not add {f} to zip: {e}")
-                        
-            return FileResponse(zip_path, filename=zip_filename)
-        except Exception as e:
-            import traceback
-            error_msg = f"Failed to create zip: {str(e)}\n{traceback.format_exc()}"
-            print(error_msg)
-            try:
-                # Write to job dir
-                with open(os.path.join(job_dir, "download_error.txt"), "w") as f:
-                    f.write(error_msg)
-            except:
-                pass
-            raise HTTPException(status_code=500, detail=f"Failed to create zip: {str(e)}")
+        # Several tables: zip them while the response is sent, nothing is staged on disk
+        zip_filename = f"{job_id}_{extension}.zip"
+        entries = ((f"{t}.{extension}", _export_chunks(job_dir, t, extension)) for t in tables)
+        return StreamingResponse(
+            # Parquet is compressed already
+            storage.iter_zip(entries, compress=extension != "parquet"),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'},
+        )
             
     except Exception as e:
         import traceback
@@ -270,6 +281,21 @@ def download(job_id: str, format: str = 'csv'):
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
 
+@app.get('/jobs/{job_id}/exports/{format}')
+def get_export_status(job_id: str, format: str):
+    """Progress of a prebuilt export (queued on demand); streamed formats are always ready."""
+    job = jobs_db.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if job['status'] != 'completed':
+        raise HTTPException(status_code=400, detail="job not completed yet")
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail="unsupported format")
+    if format not in exports.PREBUILT_FORMATS and format != "sqlite":
+        return {"status": "ready", "format": format}
+    return _export_progress(exports.request_export(job_id, format, queue=export_q))
+
+
 
 @app.get('/jobs/{job_id}/tables')
 def get_job_tables(job_id: str):
@@ -282,16 +308,7 @@ def get_job_tables(job_id: str):
     if not os.path.exists(job_dir):
         return []
         
-    import glob
-    # Find all CSVs
-    files = glob.glob(os.path.join(job_dir, "*.csv"))
-    tables = []
-    for f in files:
-        name = os.path.basename(f)
-        # Filter out metadata files if any, though usually we want to see data
-        if name == "no_data.csv":
-            continue
-        tables.append(name)
+    tables = [storage.file_name(t) for t in storage.list_tables(job_dir)]
         
     # Sort: cleaned first, then page_1, etc.
     tables.sort(key=lambda x: (not x.startswith("cleaned"), x))
@@ -299,29 +316,69 @@ def get_job_tables(job_id: str):
 
 
 @app.get('/jobs/{job_id}/data')
-def get_job_data(job_id: str, limit: int = 1000, offset: int = 0, file: str | None = None):
+def get_job_data(
+    job_id: str,
+    response: Response,
+    limit: int = 1000,
+    offset: int = 0,
+    file: str | None = None,
+    columns: str | None = None,
+    sort: str | None = None,
+    filter: list[str] = Query(default=[]),
+    q: str | None = None,
+    cursor: str | None = None,
+):
+    """
+    One page of a table. columns: comma-separated projection; sort: column,
+    "-column" for descending; filter (repeatable): "column:op:value" with op
+    in eq, ne, lt, le, gt, ge, contains; q: text in any column; cursor: the
+    X-Next-Cursor of the previous page (instead of offset).
+    X-Total-Count carries the number of rows in the (filtered) view.
+    """
     job = jobs_db.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
     
+    job_dir = os.path.join(os.getcwd(), 'data', job_id)
+    table = _resolve_table(job_dir, file)
+    if table is None:
+        return []
     try:
-        df = _load_job_df(job_id, filename=file)
-        if df.empty:
-             return []
-             
-        # Remove NaNs which crash JSON serialization
-        df = df.fillna("")
-        
-        # Replace Infinity
-        df = df.replace([np.inf, -np.inf], "")
-        
-        # Return slice
-        return df.iloc[offset : offset + limit].to_dict(orient='records')
+        df, total, next_cursor = storage.read_window(
+            job_dir,
+            table,
+            offset=offset,
+            limit=limit,
+            columns=[c for c in columns.split(",") if c] if columns else None,
+            sort=sort.lstrip("-") if sort else None,
+            descending=bool(sort and sort.startswith("-")),
+            filters=filter,
+            search=q,
+            cursor=cursor,
+        )
+    except FileNotFoundError:
+        return []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Data error: {str(e)}")
 
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if df.empty:
+         return []
+         
+    # Remove NaNs which crash JSON serialization (only the page is touched)
+    df = df.astype(object).where(df.notna(), "")
+    
+    # Replace Infinity
+    df = df.replace([np.inf, -np.inf], "")
+    
+    return df.to_dict(orient='records')
+
 
 class CleanRequest(BaseModel):
     instruction: str | None = None
@@ -349,59 +406,33 @@ def clean_job(job_id: str, req: CleanRequest = CleanRequest()):
     return {"status": "cleaning_started", "job_id": job_id}
 
 
-def _load_job_df(job_id: str, filename: str | None = None) -> pd.DataFrame:
-    """Helper to load job data into a DataFrame."""
-    job_dir = os.path.join(os.getcwd(), 'data', job_id)
+def _resolve_table(job_dir: str, filename: str | None = None) -> str | None:
+    """Table name for a `file` parameter; without one the first table /tables lists (cleaned first)."""
     if not os.path.exists(job_dir):
-        return pd.DataFrame()
+        return None
     
     # If specific file requested
     if filename:
         # Prevent traversal
         if ".." in filename or "/" in filename:
-            return pd.DataFrame()
-        
-        path = os.path.join(job_dir, filename)
-        if os.path.exists(path):
-            try:
-                if filename.endswith(".csv"):
-                    return pd.read_csv(path)
-                # Add parquet support if needed
-            except Exception:
-                pass
-        return pd.DataFrame()
+            return None
+        return storage.table_name(filename)
+    tables = storage.list_tables(job_dir)
+    if not tables:
+        return None
+    return min(tables, key=lambda x: (not x.startswith("cleaned"), x))
 
-    # Default fallback (original logic): Try first available
-    # Try SQLite first
-    db_path = os.path.join(job_dir, "data.db")
-    if os.path.exists(db_path):
-        try:
-            conn = sqlite3.connect(db_path)
-            # Get first table
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            if tables:
-                table_name = tables[0][0]
-                df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-                conn.close()
-                if not df.empty:
-                    return df
-            conn.close()
-        except Exception:
-            pass
-
-    # Fallback to CSV
-    import glob
-    csv_files = glob.glob(os.path.join(job_dir, "*.csv"))
-    if csv_files:
-        try:
-            # Load first CSV
-            return pd.read_csv(csv_files[0])
-        except Exception:
-            pass
-            
-    return pd.DataFrame()
+
+def _load_job_df(job_id: str, filename: str | None = None) -> pd.DataFrame:
+    """Helper to load job data into a DataFrame."""
+    job_dir = os.path.join(os.getcwd(), 'data', job_id)
+    table = _resolve_table(job_dir, filename)
+    if table is None:
+        return pd.DataFrame()
+    try:
+        return storage.read_table(job_dir, table)
+    except Exception:
+        return pd.DataFrame()
 
 
 @app.post('/jobs/{job_id}/query')
@@ -0,0 +1,522 @@
+# src/scraper/async_renderer.py
+"""
+Concurrent Playwright rendering inside one worker.
+
+The sync renderer (playwright_client.render_and_extract) drives one page at a
+time, and most of that time is spent waiting on the network. AsyncRenderer
+runs the async Playwright API on its own event loop thread and renders
+several pages at once on one browser. Like CrawlEngine, callers stay
+synchronous and get concurrent.futures.Future objects back.
+
+The loop, the browser connection and the warm pages belong to the worker
+process (AsyncBrowserPool) and outlive jobs; each job only gets an
+AsyncRenderer on top of it. Admission is bounded three times: at most the
+job's `concurrency` pages render at once, the pool holds at most
+RENDER_POOL_CONTEXTS pages, and a new page only opens while the machine has
+at least RENDER_MIN_FREE_MB of memory available plus the expected cost of one
+more page (the first page is always admitted).
+
+Results have the same shape as render_and_extract():
+{"tables", "content", "network", "ready", "xhr", "pagination"}.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import async_playwright, TimeoutError as PWAsyncTimeout
+
+from src.scraper.playwright_client import (
+    BROWSER_CDP_URL,
+    BROWSER_PAGE_QUOTA,
+    DEFAULT_MAX_GRID_ROWS,
+    DOM_POLL_MS,
+    DOM_QUIET_MS,
+    MAX_SCROLLS,
+    POOL_MAX_CONTEXTS,
+    POOL_MAX_ORIGINS,
+    POOL_MAX_USES,
+    SCROLL_BUDGET_MS,
+    READY_SELECTOR,
+    RouteBlocker,
+    _EXTRACT_ALL_JS,
+    _WAIT_STABLE_JS,
+    _extract_args,
+    _origin,
+    _payload_to_tables,
+    _proxy_config,
+    _resolve_cdp_url,
+    _unique_tables,
+    scroll_budget,
+)
+from src.scraper.session_crawl import probe_pagination_async
+from src.scraper.xhr_capture import AsyncResponseCapture, match_xhr_tables, merge_xhr_tables, xhr_covers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "4"))
+# memory kept free for the worker itself, and the expected footprint of one more page
+RENDER_MIN_FREE_MB = int(os.getenv("RENDER_MIN_FREE_MB", "512"))
+RENDER_PAGE_MB = int(os.getenv("RENDER_PAGE_MB", "150"))
+# warm pages the process keeps on its browser, across all jobs
+RENDER_POOL_CONTEXTS = int(os.getenv("RENDER_POOL_CONTEXTS", str(max(DEFAULT_RENDER_CONCURRENCY, POOL_MAX_CONTEXTS))))
+ADMISSION_POLL_S = 0.2
+
+
+def available_memory_mb() -> Optional[int]:
+    """MemAvailable from /proc/meminfo; None where it can't be read."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _AsyncRouteBlocker(RouteBlocker):
+    async def install(self, page):
+        await page.route("**/*", self._handle)
+
+    async def _handle(self, route, request):
+        try:
+            if self._should_block(request):
+                self._count_blocked(request.resource_type)
+                await route.abort("blockedbyclient")
+            else:
+                self.stats["allowed"] += 1
+                await route.continue_()
+        except Exception:
+            # the page may have navigated away or closed while the request was pending
+            pass
+
+
+class AsyncBrowserPool:
+    """
+    The worker process's async Playwright: one event loop thread, one browser
+    (the shared one at BROWSER_CDP_URL when reachable) and warm pages kept
+    across jobs, the async counterpart of playwright_client.BrowserManager.
+    Pages are keyed by (proxy, stealth); stealth is applied once per page,
+    and a returned page is reset like BrowserManager._reset_slot or recycled
+    after max_uses renders. Jobs render through their own AsyncRenderer and
+    never start or close the browser.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_contexts: int = RENDER_POOL_CONTEXTS, max_uses: int = POOL_MAX_USES,
+                 min_free_mb: int = RENDER_MIN_FREE_MB, page_mb: int = RENDER_PAGE_MB,
+                 cdp_url: Optional[str] = BROWSER_CDP_URL):
+        self.cdp_url = cdp_url
+        self.remote = False
+        self.max_uses = max_uses
+        # on a shared browser the pool doubles as this worker's page quota
+        self.max_contexts = min(max_contexts, BROWSER_PAGE_QUOTA) if cdp_url else max_contexts
+        self.min_free_mb = int(min_free_mb)
+        self.page_mb = int(page_mb)
+        self.pid = os.getpid()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._browser_lock: Optional[asyncio.Lock] = None
+        self._slot_freed: Optional[asyncio.Condition] = None
+        self._playwright = None
+        self._browser = None
+        self._idle: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._in_use = 0
+        self._in_flight = 0
+        self._stats = {"created": 0, "reused": 0, "recycled": 0, "discarded": 0, "reconnects": 0,
+                       "cdp_fallbacks": 0, "memory_waits": 0, "peak_concurrency": 0}
+
+    @classmethod
+    def get_instance(cls) -> "AsyncBrowserPool":
+        """The pool of this process, started on first use (a forked child gets its own)."""
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.pid != os.getpid():
+                cls._instance = cls().start()
+                atexit.register(cls._instance.close)
+            return cls._instance
+
+    def start(self):
+        if self._loop is not None:
+            return self
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(self._loop)
+            self._browser_lock = asyncio.Lock()
+            self._slot_freed = asyncio.Condition()
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="async-renderer", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _get_browser(self):
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                logger.warning("Async Playwright browser disconnected, %s...", "reconnecting" if self.remote else "relaunching")
+                self._stats["reconnects"] += 1
+                # the warm pages belonged to the lost browser
+                self._idle = {}
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = None
+            self.remote = False
+            if self.cdp_url:
+                try:
+                    self._browser = await self._playwright.chromium.connect_over_cdp(_resolve_cdp_url(self.cdp_url), timeout=10000)
+                    self.remote = True
+                except Exception as e:
+                    logger.error("Shared browser at %s unavailable (%s), launching a local one", self.cdp_url, e)
+                    self._stats["cdp_fallbacks"] += 1
+            if self._browser is None:
+                logger.info("Starting async Playwright browser instance...")
+                self._browser = await self._playwright.chromium.launch(headless=True, args=["--no-sandbox"])
+            return self._browser
+
+    async def admit(self) -> bool:
+        """
+        Wait until memory allows one more page (the first page always gets in);
+        True if it had to wait. Pair with release().
+        """
+        waited = False
+        while self._in_flight > 0:
+            free = available_memory_mb()
+            if free is None or free - self.page_mb >= self.min_free_mb:
+                break
+            if not waited:
+                waited = True
+                self._stats["memory_waits"] += 1
+                logger.info("Render admission waiting: %s MB available", free)
+            await asyncio.sleep(ADMISSION_POLL_S)
+        self._in_flight += 1
+        self._stats["peak_concurrency"] = max(self._stats["peak_concurrency"], self._in_flight)
+        return waited
+
+    def release(self):
+        self._in_flight -= 1
+
+    async def _new_slot(self, key: tuple) -> Dict[str, Any]:
+        proxy, stealth = key
+        context_args = {}
+        proxy_config = _proxy_config(proxy)
+        if proxy_config:
+            context_args["proxy"] = proxy_config
+        browser = await self._get_browser()
+        context = await browser.new_context(**context_args)
+        page = await context.new_page()
+        if stealth:
+            try:
+                from playwright_stealth import stealth_async
+                await stealth_async(page)
+            except ImportError:
+                pass
+        self._stats["created"] += 1
+        slot = {"key": key, "context": context, "page": page, "uses": 0, "origins": set(), "browser": browser}
+        # every origin the page talks to (frames included) may leave storage behind
+        context.on("request", lambda request: slot["origins"].add(_origin(request.url)))
+        return slot
+
+    async def _close_slot(self, slot: Dict[str, Any]):
+        try:
+            await slot["context"].close()
+        except Exception:
+            pass
+
+    async def _reset_slot(self, slot: Dict[str, Any]) -> bool:
+        """Same reset as BrowserManager._reset_slot: False if the page should be discarded."""
+        page = slot["page"]
+        origins = slot["origins"] - {None}
+        if len(origins) > POOL_MAX_ORIGINS:
+            return False
+        try:
+            await page.unroute("**/*")
+        except Exception:
+            pass
+        try:
+            await page.goto("about:blank")
+            cdp = await slot["context"].new_cdp_session(page)
+            try:
+                for origin in origins:
+                    await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            finally:
+                await cdp.detach()
+            await slot["context"].clear_cookies()
+            slot["origins"].clear()
+            return True
+        except Exception as e:
+            logger.debug("Could not clear pooled context storage (%s), recycling it", e)
+            return False
+
+    async def _acquire(self, key: tuple) -> Dict[str, Any]:
+        async with self._slot_freed:
+            while True:
+                browser = await self._get_browser()
+                idle = self._idle.setdefault(key, [])
+                while idle:
+                    slot = idle.pop()
+                    if slot["browser"] is browser:
+                        self._in_use += 1
+                        self._stats["reused"] += 1
+                        return slot
+                if self._in_use + sum(len(v) for v in self._idle.values()) < self.max_contexts:
+                    break
+                evicted = next((slots.pop(0) for slots in self._idle.values() if slots), None)
+                if evicted is not None:
+                    # make room by closing an idle page of another key
+                    await self._close_slot(evicted)
+                    self._stats["discarded"] += 1
+                    break
+                await self._slot_freed.wait()
+            self._in_use += 1
+        try:
+            return await self._new_slot(key)
+        except BaseException:
+            await self._give_back(None, key)
+            raise
+
+    async def _give_back(self, slot: Optional[Dict[str, Any]], key: tuple, healthy: bool = False):
+        if slot is not None:
+            slot["uses"] += 1
+            if not healthy or slot["uses"] >= self.max_uses or not await self._reset_slot(slot):
+                await self._close_slot(slot)
+                self._stats["recycled" if healthy else "discarded"] += 1
+            else:
+                self._idle.setdefault(key, []).append(slot)
+        async with self._slot_freed:
+            self._in_use -= 1
+            self._slot_freed.notify()
+
+    @asynccontextmanager
+    async def page(self, proxy: Optional[str] = None, stealth: bool = True):
+        """
+        Borrow a warm page (created on demand), waiting while the pool is full
+        of pages in use; reset and returned to the pool afterwards.
+        """
+        key = (proxy or None, bool(stealth))
+        slot = await self._acquire(key)
+        healthy = False
+        try:
+            yield slot["page"]
+            healthy = True
+        finally:
+            await self._give_back(slot, key, healthy)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["idle"] = sum(len(v) for v in self._idle.values())
+        stats["in_use"] = self._in_use
+        stats["remote"] = self.remote
+        return stats
+
+    async def _shutdown(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for slots in self._idle.values():
+            for slot in slots:
+                await self._close_slot(slot)
+        self._idle = {}
+        if self._browser is not None:
+            # for a shared browser this only drops our contexts and the connection
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    def close(self):
+        """Stop the loop and the browser; only at process exit."""
+        if self._loop is None or self.pid != os.getpid():
+            return
+        try:
+            self.submit(self._shutdown()).result(timeout=15)
+        except Exception as e:
+            logger.debug("async renderer: shutdown failed: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+
+class AsyncRenderer:
+    def __init__(self, concurrency: int = DEFAULT_RENDER_CONCURRENCY, pool: Optional[AsyncBrowserPool] = None, **defaults):
+        """
+        A job's renderer on the process's AsyncBrowserPool.
+        defaults: render options used by prefetch() and as the base for render()
+                  (timeout, wait_for, proxy, stealth, resource_policy, max_grid_rows, capture_xhr,
+                  probe_pagination).
+        """
+        self.concurrency = max(1, int(concurrency or DEFAULT_RENDER_CONCURRENCY))
+        self.defaults = defaults
+        self._pool = pool
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"rendered": 0, "failed": 0, "peak_concurrency": 0, "memory_waits": 0}
+        self._in_flight = 0
+
+    def start(self):
+        if self._pool is None:
+            self._pool = AsyncBrowserPool.get_instance()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def remote(self) -> bool:
+        return bool(self._pool and self._pool.remote)
+
+    async def _wait_stable(self, page, max_wait_ms: int) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            return await page.evaluate(
+                _WAIT_STABLE_JS,
+                {"quietMs": DOM_QUIET_MS, "maxMs": max_wait_ms, "pollMs": DOM_POLL_MS, "selector": READY_SELECTOR},
+            )
+        except Exception as e:
+            logger.debug("wait for DOM stable interrupted: %s", e)
+            return {"waited_ms": int((time.monotonic() - started) * 1000), "reason": "error"}
+
+    async def _extract(self, page, max_rows: int, max_scrolls: int = MAX_SCROLLS, budget_ms: int = SCROLL_BUDGET_MS):
+        try:
+            payload = await page.evaluate(_EXTRACT_ALL_JS, _extract_args(max_rows, max_scrolls, budget_ms))
+        except Exception as e:
+            logger.info("In-page extraction failed: %s", e)
+            return []
+        return _unique_tables(_payload_to_tables(payload))
+
+    async def _extract_with_capture(self, page, capture: AsyncResponseCapture, max_rows: int, budget_ms: int = SCROLL_BUDGET_MS):
+        # same strategy as playwright_client._extract_with_capture
+        results = await self._extract(page, max_rows, max_scrolls=0)
+        matches = match_xhr_tables(await capture.collect(), results)
+        if any(t.get("source") == "virtualized" for t in results) and not xhr_covers(results, matches):
+            results = await self._extract(page, max_rows, budget_ms=budget_ms)
+            matches = match_xhr_tables(await capture.collect(), results)
+        return merge_xhr_tables(results, matches)
+
+    async def _render(self, url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+        timeout = int(opts.get("timeout", 30))
+        max_rows = int(opts.get("max_grid_rows") or DEFAULT_MAX_GRID_ROWS)
+        policy = opts.get("resource_policy")
+        blocker = _AsyncRouteBlocker(policy) if policy else None
+        capture = AsyncResponseCapture() if opts.get("capture_xhr", True) else None
+        results, content, ready, pagination = [], "", None, None
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            if await self._pool.admit():
+                self._stats["memory_waits"] += 1
+            self._in_flight += 1
+            self._stats["peak_concurrency"] = max(self._stats["peak_concurrency"], self._in_flight)
+            try:
+                async with self._pool.page(proxy=opts.get("proxy"), stealth=opts.get("stealth", True)) as page:
+                    page.set_default_navigation_timeout(timeout * 1000)
+                    if blocker:
+                        await blocker.install(page)
+                    if capture:
+                        capture.install(page)
+                    try:
+                        try:
+                            await page.goto(url, wait_until="domcontentloaded")
+                        except PWAsyncTimeout:
+                            logger.info("Playwright navigation timeout for %s", url)
+                        ready = await self._wait_stable(page, int(opts.get("wait_for", 900)))
+                        try:
+                            content = await page.content()
+                        except Exception:
+                            content = ""
+                        if capture:
+                            results = await self._extract_with_capture(page, capture, max_rows, scroll_budget(timeout))
+                        else:
+                            results = await self._extract(page, max_rows, budget_ms=scroll_budget(timeout))
+                        if opts.get("probe_pagination"):
+                            pagination = await probe_pagination_async(page)
+                        self._stats["rendered"] += 1
+                    except Exception as exc:
+                        self._stats["failed"] += 1
+                        logger.exception("async render of %s failed: %s", url, exc)
+                        if opts.get("screenshot_path"):
+                            try:
+                                await page.screenshot(path=opts["screenshot_path"])
+                            except Exception:
+                                pass
+                        results = []
+                    finally:
+                        if capture:
+                            capture.uninstall(page)
+            finally:
+                self._in_flight -= 1
+                self._pool.release()
+        xhr = None
+        if capture:
+            xhr = {
+                "responses": capture.seen,
+                "tables": sum(1 for t in results if str(t.get("source", "")).startswith("xhr:")),
+            }
+        return {"tables": results, "content": content, "network": blocker.stats if blocker else None, "ready": ready, "xhr": xhr, "pagination": pagination}
+
+    def render(self, url: str, **opts) -> Future:
+        """Render `url` (options override the defaults) and return its future."""
+        self.start()
+        return self._pool.submit(self._render(url, dict(self.defaults, **opts)))
+
+    def prefetch(self, url: str, **opts) -> Future:
+        """Schedule a render of `url` (idempotent) and return its future."""
+        with self._lock:
+            fut = self._pending.get(url)
+            if fut is None:
+                fut = self.render(url, **opts)
+                self._pending[url] = fut
+            return fut
+
+    def take(self, url: str) -> Optional[Future]:
+        """Hand over a scheduled render to the caller; None if `url` was never prefetched."""
+        with self._lock:
+            return self._pending.pop(url, None)
+
+    def discard(self, url: str):
+        """Drop a prefetched render that turned out not to be needed."""
+        fut = self.take(url)
+        if fut is not None:
+            fut.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, concurrency=self.concurrency, remote=self.remote)
+
+    def close(self):
+        """End the job's use of the pool: cancel its pending renders. The browser stays up."""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for fut in pending:
+            fut.cancel()
@@ -0,0 +1,127 @@
+# src/scraper/crawler.py
+"""
+Concurrent crawl engine.
+
+Runs an asyncio event loop on a background thread and schedules page fetches on
+it, bounded by a global concurrency cap and a per-host in-flight limit. Callers
+stay synchronous (RQ tasks, the sync Playwright API) and get back
+concurrent.futures.Future objects, so page N+1 can be downloading while page N
+is still being parsed and persisted on the calling thread.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PER_HOST = 2
+
+
+class CrawlEngine:
+    def __init__(self, fetch: Callable[[str], object], concurrency: int = DEFAULT_CONCURRENCY, per_host: int = DEFAULT_PER_HOST):
+        """
+        fetch: blocking callable url -> result (e.g. fetch_with_requests). It is run
+        on a thread pool so it can reuse the shared keep-alive HTTP client.
+        """
+        self._fetch = fetch
+        self.concurrency = max(1, int(concurrency or DEFAULT_CONCURRENCY))
+        self.per_host = max(1, int(per_host or DEFAULT_PER_HOST))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._loop is not None:
+            return self
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="crawl-fetch")
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(self._loop)
+            self._global_sem = asyncio.Semaphore(self.concurrency)
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="crawl-engine", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _host_sem(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self.per_host)
+            self._host_sems[host] = sem
+        return sem
+
+    async def _run_fetch(self, url: str):
+        async with self._global_sem:
+            async with self._host_sem(url):
+                return await self._loop.run_in_executor(self._executor, self._fetch, url)
+
+    def prefetch(self, url: str) -> Future:
+        """Schedule `url` for fetching (idempotent) and return its future."""
+        if self._loop is None:
+            self.start()
+        with self._lock:
+            fut = self._pending.get(url)
+            if fut is None:
+                fut = asyncio.run_coroutine_threadsafe(self._run_fetch(url), self._loop)
+                self._pending[url] = fut
+            return fut
+
+    def take(self, url: str) -> Optional[Future]:
+        """Hand over a scheduled fetch to the caller; None if `url` was never prefetched."""
+        with self._lock:
+            return self._pending.pop(url, None)
+
+    def discard(self, url: str):
+        """Drop a prefetch that turned out not to be needed."""
+        fut = self.take(url)
+        if fut is not None:
+            fut.cancel()
+
+    async def _cancel_tasks(self):
+        # let cancelled fetches unwind before the loop stops
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for fut in pending:
+            fut.cancel()
+        if self._loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.debug("crawl engine: cancelling tasks failed: %s", e)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self._thread is not None:
+                self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,111 @@
+# src/scraper/dedupe.py
+"""
+Content-hash table deduplication.
+
+Tables are hashed over their normalized headers and cell text (whitespace
+collapsed, case-folded headers, 1.0 == 1, NaN == ""), so the same table
+found by two extraction strategies, or repeated on every page of a crawl
+(sidebars, footers), hashes the same while different tables of equal shape
+do not.
+"""
+
+import hashlib
+from typing import Dict, List, Optional
+
+MAX_RECORDED = 200  # duplicates listed individually in job metadata
+
+
+def _norm(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    return " ".join(str(value).split())
+
+
+class TableHasher:
+    """Incremental table hash: the headers once, then rows in any number of batches."""
+
+    def __init__(self, headers):
+        self._h = hashlib.sha1()
+        self._h.update("\x1f".join(_norm(c).lower() for c in headers).encode("utf-8"))
+
+    def update(self, rows):
+        for row in rows:
+            self._h.update(b"\x1e")
+            self._h.update("\x1f".join(_norm(v) for v in row).encode("utf-8"))
+
+    def update_frame(self, df):
+        self.update(df.itertuples(index=False, name=None))
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+
+def _digest(headers, rows) -> str:
+    h = TableHasher(headers)
+    h.update(rows)
+    return h.hexdigest()
+
+
+def raw_table_hash(headers: List, rows: List[List]) -> str:
+    """Hash of an extracted {headers, rows} table."""
+    return _digest(headers or [], rows or [])
+
+
+def frame_hash(df, exclude: Optional[List[str]] = None) -> str:
+    """Hash of a DataFrame's content; `exclude` drops bookkeeping columns (e.g. source_url)."""
+    if exclude:
+        df = df.drop(columns=[c for c in exclude if c in df.columns])
+    return _digest(list(df.columns), df.itertuples(index=False, name=None))
+
+
+class TableDeduper:
+    """
+    Remembers the hash of every table kept so far in a job; check() tells
+    whether a table was already kept and under which name.
+
+    Tables can carry a source (a batch's page URL). With across_sources=False
+    a repeat is only dropped when it comes from the same source; the same
+    table from another source is kept and listed in `kept_duplicates`.
+    """
+
+    def __init__(self, seen: Optional[Dict[str, str]] = None, across_sources: bool = True):
+        self.seen: Dict[str, str] = dict(seen or {})
+        self.across_sources = across_sources
+        self.skipped = 0
+        self.rows_skipped = 0
+        self.duplicates: List[Dict[str, str]] = []
+        self.kept_duplicates: List[Dict[str, str]] = []
+        self._first_by_content: Dict[str, str] = {}
+
+    def check(self, df, name: str, exclude: Optional[List[str]] = None, source: Optional[str] = None) -> Optional[str]:
+        """Name of the identical table kept earlier, or None (and `name` is registered)."""
+        return self.check_key(frame_hash(df, exclude=exclude), name, len(df), source=source)
+
+    def check_key(self, key: str, name: str, rows: int, source: Optional[str] = None) -> Optional[str]:
+        """check() for a table hashed elsewhere (e.g. incrementally while streaming)."""
+        if source is not None and not self.across_sources:
+            first_anywhere = self._first_by_content.setdefault(key, name)
+            key = f"{source}\x1d{key}"
+            if key not in self.seen and first_anywhere != name:
+                if len(self.kept_duplicates) < MAX_RECORDED:
+                    self.kept_duplicates.append({"table": name, "duplicate_of": first_anywhere})
+        first = self.seen.get(key)
+        if first is None:
+            self.seen[key] = name
+            return None
+        self.skipped += 1
+        self.rows_skipped += rows
+        if len(self.duplicates) < MAX_RECORDED:
+            self.duplicates.append({"table": name, "duplicate_of": first})
+        return first
+
+    def stats(self) -> dict:
+        stats = {"tables": self.skipped, "rows": self.rows_skipped, "duplicates": self.duplicates}
+        if not self.across_sources:
+            stats["kept_duplicates"] = self.kept_duplicates
+        return stats
@@ -0,0 +1,209 @@
+# src/scraper/document.py
+"""
+Parse-once HTML document shared by every extractor that looks at a page.
+
+The lxml tree is built lazily on first use and then reused for table
+extraction, CSS selection, next-page detection and the LLM text/HTML
+snippets, instead of each of them re-parsing the page with BeautifulSoup.
+Tables are converted straight from the tree (thead/tbody/tfoot, rowspan and
+colspan handled like pandas.read_html) without re-serializing them.
+"""
+
+import copy
+import logging
+import re
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")  # same as pandas.read_html
+_HIDDEN = re.compile(r"display:\s*none", re.IGNORECASE)
+# Dropped from the text and HTML handed to the LLM
+NOISE_TAGS = ("script", "style", "svg", "path", "noscript")
+_TEXT_XPATH = "//text()[not(ancestor::script or ancestor::style or ancestor::svg or ancestor::noscript)]"
+
+
+def _clean(s: str) -> str:
+    return _WHITESPACE.sub(" ", (s or "").strip())
+
+
+def _hidden(el) -> bool:
+    return bool(_HIDDEN.search(el.get("style") or ""))
+
+
+class ParsedDocument:
+    def __init__(self, html: str):
+        self.html = html or ""
+        self._root = None
+
+    @property
+    def root(self):
+        """Lazily parsed lxml root element."""
+        if self._root is None:
+            import lxml.html
+            try:
+                self._root = lxml.html.document_fromstring(self.html) if self.html.strip() else lxml.html.document_fromstring("<html></html>")
+            except Exception as e:
+                # e.g. an XML declaration in a str; fall back to bytes
+                logger.debug("lxml could not parse document as str: %s", e)
+                self._root = lxml.html.document_fromstring(self.html.encode("utf-8", errors="replace"))
+        return self._root
+
+    def select(self, selector: str) -> List:
+        """Elements matching a CSS selector (raises on an invalid selector)."""
+        return self.root.cssselect(selector)
+
+    def tables(self) -> List:
+        """DataFrames for every <table> in the document (nested ones included)."""
+        return elements_to_dataframes(self.root.iter("table"))
+
+    def text(self) -> str:
+        """Visible text, whitespace-separated, without scripts/styles/svg."""
+        parts = (t.strip() for t in self.root.xpath(_TEXT_XPATH))
+        return " ".join(p for p in parts if p)
+
+    def cleaned_html(self) -> str:
+        """Serialized HTML with script/style/svg/path elements removed."""
+        import lxml.html
+        root = copy.deepcopy(self.root)
+        for el in list(root.iter(*NOISE_TAGS)):
+            el.drop_tree()
+        return lxml.html.tostring(root, encoding="unicode")
+
+
+def as_document(html_or_doc: Union[str, ParsedDocument, None]) -> ParsedDocument:
+    if isinstance(html_or_doc, ParsedDocument):
+        return html_or_doc
+    return ParsedDocument(html_or_doc or "")
+
+
+def _cells(row) -> List:
+    # direct children only: the "row" may be a <thead> missing its <tr>
+    return [c for c in row if c.tag in ("td", "th") and not _hidden(c)]
+
+
+def _section_rows(table):
+    """Split a table into (header, body, footer) <tr> lists like pandas.read_html."""
+    header_rows = []
+    for thead in table.iterfind(".//thead"):
+        header_rows.extend(thead.iterfind("./tr"))
+        if any(c.tag in ("td", "th") for c in thead):
+            header_rows.append(thead)
+    body_rows = table.xpath(".//tbody//tr") + table.xpath("./tr")
+    footer_rows = table.xpath(".//tfoot//tr")
+    body_rows = [r for r in body_rows if not _hidden(r)]
+    if not header_rows:
+        # no <thead>: leading rows made only of <th> are the header
+        while body_rows and _cells(body_rows[0]) and all(c.tag == "th" for c in _cells(body_rows[0])):
+            header_rows.append(body_rows.pop(0))
+    return header_rows, body_rows, footer_rows
+
+
+def _expand_spans(rows, remainder=None, overflow=True):
+    """
+    Turn <tr>s into text rows, copying rowspan/colspan cells into the positions
+    they cover. Returns (rows, remainder of still-open rowspans).
+    """
+    out = []
+    remainder = remainder if remainder is not None else []
+    for tr in rows:
+        texts = []
+        next_remainder = []
+        index = 0
+        for td in _cells(tr):
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+            text = _clean(td.text_content())
+            try:
+                rowspan = max(1, int(td.get("rowspan") or 1))
+            except ValueError:
+                rowspan = 1
+            try:
+                colspan = max(1, int(td.get("colspan") or 1))
+            except ValueError:
+                colspan = 1
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        out.append(texts)
+        remainder = next_remainder
+    if not overflow:
+        while remainder:
+            next_remainder = []
+            texts = []
+            for prev_i, prev_text, prev_rowspan in remainder:
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+            out.append(texts)
+            remainder = next_remainder
+    return out, remainder
+
+
+def table_to_dataframe(table):
+    """
+    Convert one lxml <table> element to a DataFrame, with the same header
+    inference and value parsing (thousands separators, NaN) as pandas.read_html.
+    Returns None for tables without any rows.
+    """
+    from pandas.io.parsers import TextParser
+
+    header_rows, body_rows, footer_rows = _section_rows(table)
+    head, rem = _expand_spans(header_rows)
+    body, rem = _expand_spans(body_rows, remainder=rem, overflow=bool(footer_rows))
+    foot, _ = _expand_spans(footer_rows, remainder=rem, overflow=False)
+
+    header = None
+    if head:
+        body = head + body
+        if len(head) == 1:
+            header = 0
+        else:
+            # ignore all-empty-text header rows
+            header = [i for i, row in enumerate(head) if any(text for text in row)]
+    if foot:
+        body += foot
+    if not body:
+        return None
+    width = max(len(r) for r in body)
+    if width == 0:
+        return None
+    body = [r + [""] * (width - len(r)) for r in body]
+    with TextParser(body, header=header, thousands=",") as tp:
+        return tp.read()
+
+
+def elements_to_dataframes(elements) -> List:
+    """
+    DataFrames for a sequence of elements: a <table> is converted directly,
+    any other element contributes the first table inside it.
+    """
+    dfs = []
+    for el in elements:
+        table = el if el.tag == "table" else next(el.iter("table"), None)
+        if table is None:
+            continue
+        try:
+            df = table_to_dataframe(table)
+        except Exception as e:
+            logger.debug("Failed to convert a table: %s", e)
+            continue
+        if df is not None:
+            dfs.append(df)
+    return dfs
+
+
+def document_text(html_or_doc: Union[str, ParsedDocument, None]) -> Optional[str]:
+    if not html_or_doc:
+        return None
+    return as_document(html_or_doc).text()
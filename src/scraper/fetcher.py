@@ -1,8 +1,11 @@
 # src/scraper/fetcher.py
+import re
 import logging
+from urllib.parse import urljoin, urlsplit, parse_qs
 from typing import List, Optional
-import requests
-from bs4 import BeautifulSoup
+from src.scraper.http_client import get_http_client
+from src.scraper.document import as_document, elements_to_dataframes
+from src.scraper.stream_ingest import DEFAULT_MAX_BODY, BodyTooLarge, LargeBody, body_encoding, decode_body, read_body
 
 logger = logging.getLogger(__name__)
 
@@ -11,11 +14,76 @@ HEADERS = {
 }
 
 
-def fetch_with_requests(url: str, timeout: int = 10, proxies: Optional[dict] = None) -> str:
-    """Fetch page HTML with requests (fast). Raise on error."""
-    resp = requests.get(url, timeout=timeout, headers=HEADERS, proxies=proxies)
-    resp.raise_for_status()
-    return resp.text
+def _get_body(url: str, headers: dict, timeout, proxies, stream_threshold: Optional[int], max_bytes: Optional[int]):
+    """
+    GET `url`; returns (response, body) where body is bytes, a LargeBody, or
+    None for a 304. With a stream threshold the body is read in chunks; without
+    one it is read whole and only checked against max_bytes afterwards. Both
+    go over HTTP/2 when it is enabled.
+    """
+    if not stream_threshold:
+        resp = get_http_client().get(url, timeout=timeout, headers=headers, proxies=proxies)
+        if resp.status_code == 304:
+            return resp, None
+        resp.raise_for_status()
+        if max_bytes and len(resp.content) > max_bytes:
+            raise BodyTooLarge(f"{url}: body exceeds {max_bytes} bytes")
+        return resp, resp.content
+    resp = get_http_client().get(url, timeout=timeout, headers=headers, proxies=proxies, stream=True)
+    if resp.status_code == 304:
+        resp.close()
+        return resp, None
+    try:
+        resp.raise_for_status()
+    except Exception:
+        resp.close()
+        raise
+    return resp, read_body(resp, stream_threshold, max_bytes or DEFAULT_MAX_BODY)
+
+
+def fetch_with_requests(url: str, timeout=None, proxies: Optional[dict] = None, stream_threshold: Optional[int] = None, max_bytes: Optional[int] = None):
+    """
+    Fetch page HTML over the shared keep-alive client (fast). Raise on error.
+    `timeout` is seconds or a (connect, read) tuple; None uses the client defaults.
+    stream_threshold: bodies larger than this many bytes are not read into
+    memory; a stream_ingest.LargeBody is returned instead of the HTML text.
+    max_bytes: larger bodies raise BodyTooLarge.
+    """
+    resp, body = _get_body(url, HEADERS, timeout, proxies, stream_threshold, max_bytes)
+    if isinstance(body, LargeBody):
+        return body
+    return decode_body(resp, body)
+
+
+def fetch_with_cache(url: str, cache, timeout=None, proxies: Optional[dict] = None, stream_threshold: Optional[int] = None, max_bytes: Optional[int] = None):
+    """
+    Fetch page HTML through an HttpCache (src.scraper.http_cache).
+    Returns (html, info) where info = {"status": "hit" | "revalidated" | "miss",
+    "unchanged": bool, "body_hash": str}. `unchanged` means the body is identical
+    to the cached copy, so tables extracted from it earlier can be reused.
+    Bodies above stream_threshold come back as a LargeBody and are not cached.
+    """
+    entry = cache.lookup(url)
+    if entry and cache.is_fresh(entry):
+        cache.touch(url)
+        return cache.read_text(entry), {"status": "hit", "unchanged": True, "body_hash": entry["body_hash"]}
+
+    headers = dict(HEADERS)
+    headers.update(cache.validators(entry))
+    resp, body = _get_body(url, headers, timeout, proxies, stream_threshold, max_bytes)
+    if body is None and entry:
+        cache.touch(url, revalidated=True)
+        return cache.read_text(entry), {"status": "revalidated", "unchanged": True, "body_hash": entry["body_hash"]}
+    body = b"" if body is None else body
+    if isinstance(body, LargeBody):
+        return body, {"status": "miss", "unchanged": False, "body_hash": None}
+
+    html = decode_body(resp, body)
+    if "no-store" in (resp.headers.get("Cache-Control") or "").lower():
+        return html, {"status": "miss", "unchanged": False, "body_hash": None}
+    stored = cache.store(url, body, body_encoding(resp, body), resp.headers)
+    unchanged = bool(entry) and entry["body_hash"] == stored["body_hash"]
+    return html, {"status": "miss", "unchanged": unchanged, "body_hash": stored["body_hash"]}
 
 
 # keep a simple compatibility wrapper for historic calls that expect raw HTML
@@ -27,10 +95,7 @@ def fetch_with_playwright_raw(url: str, timeout: int = 30, wait_for_selector: Op
     
     manager = BrowserManager.get_instance()
     try:
-        browser = manager.get_browser()
-        context = browser.new_context()
-        page = context.new_page()
-        try:
+        with manager.page() as page:
             page.goto(url, timeout=timeout * 1000)
             if wait_for_selector:
                 try:
@@ -40,108 +105,137 @@ def fetch_with_playwright_raw(url: str, timeout: int = 30, wait_for_selector: Op
                 if wait_extra:
                     page.wait_for_timeout(int(wait_extra * 1000))
             return page.content()
-        finally:
-            try:
-                context.close()
-            except Exception:
-                pass
     except Exception as e:
         logger.error("fetch_with_playwright_raw failed: %s", e)
         raise
 
 
-def render_and_extract_with_playwright(url: str, timeout: int = 30, wait_for: int = 900, proxy: Optional[str] = None, screenshot_path: Optional[str] = None):
+def render_and_extract_with_playwright(url: str, timeout: int = 30, wait_for: int = 900, proxy: Optional[str] = None, screenshot_path: Optional[str] = None, **kwargs):
     """
     Import the specialized extractor implemented in playwright_client.
-    Returns: {"tables": [...], "content": "..."}
+    Extra keyword arguments (e.g. resource_policy) are passed through.
+    Returns: {"tables": [...], "content": "...", "network": {...}}
     """
     from src.scraper.playwright_client import render_and_extract
-    return render_and_extract(url, timeout=timeout, wait_for=wait_for, proxy=proxy, screenshot_path=screenshot_path)
+    return render_and_extract(url, timeout=timeout, wait_for=wait_for, proxy=proxy, screenshot_path=screenshot_path, **kwargs)
 
 
-def extract_tables(html: str) -> List:
+def crawl_in_session_with_playwright(url: str, on_page, max_pages: int, **kwargs):
     """
-    Return a list of pandas DataFrame objects parsed from HTML `<table>` elements.
+    Page through a single-page app in one Playwright page (see session_crawl).
+    Returns: {"pages": int, "rows": int, "steps": [...], "stop": str, "xhr": {...}}
     """
-    from io import StringIO
-    import pandas as pd
+    from src.scraper.session_crawl import crawl_in_session
+    return crawl_in_session(url, on_page, max_pages, **kwargs)
 
-    soup = BeautifulSoup(html or "", "html.parser")
-    tables = soup.find_all("table")
-    result = []
-    for table in tables:
-        try:
-            df = pd.read_html(StringIO(str(table)))[0]
-            result.append(df)
-        except Exception as e:
-            logger.debug("Failed to parse a table with pandas: %s", e)
-    return result
+
+def extract_tables(html) -> List:
+    """
+    Return a list of pandas DataFrame objects parsed from HTML `<table>` elements.
+    Accepts raw HTML or a ParsedDocument (parsed once and shared across extractors).
+    """
+    return as_document(html).tables()
 
 
-def extract_table_by_selector(html: str, selector: str) -> List:
+def extract_table_by_selector(html, selector: str) -> List:
     """
     Return a list of DataFrames parsed from elements matching a CSS selector.
-    This stays HTML-only (BeautifulSoup + pandas.read_html).
+    This stays HTML-only (lxml + cssselect on the shared ParsedDocument).
     """
     if not html or not selector:
         return []
-    from io import StringIO
-    import pandas as pd
+    return elements_to_dataframes(as_document(html).select(selector))
+
+
+# Query parameters / path segment that carry a page number
+PAGE_PARAMS = ("page", "p", "pg", "paged", "pagenum", "page_num", "pageno")
+_PATH_PAGE = re.compile(r"/page[/-]?(\d+)(?=/|$)", re.IGNORECASE)
+_NEXT_TEXTS = {"next", "next page", "next >", "next »", "next ›", ">", "»", "›", ">>", "more", "older", "older posts", "load more", "show more"}
+_PREV_WORDS = ("prev", "previous", "newer", "«", "‹", "<")
+_NEXT_TOKEN = re.compile(r"(^|[-_\s])next($|[-_\s])", re.IGNORECASE)
+# minimum score for a candidate to count as the next-page link
+NEXT_LINK_MIN_SCORE = 30
+
+
+def page_number(url: str) -> Optional[int]:
+    """Page number carried by a URL (?page=N style parameter or /page/N), if any."""
+    parts = urlsplit(url)
+    for key, values in parse_qs(parts.query).items():
+        if key.lower() in PAGE_PARAMS and values and values[0].isdigit():
+            return int(values[0])
+    m = _PATH_PAGE.search(parts.path)
+    return int(m.group(1)) if m else None
+
 
-    soup = BeautifulSoup(html or "", "html.parser")
-    selected = soup.select(selector)
-    dfs = []
-    for el in selected:
-        try:
-            df = pd.read_html(StringIO(str(el)))[0]
-            dfs.append(df)
-        except Exception as e:
-            logger.debug("extract_table_by_selector: failed to parse element: %s", e)
-            continue
-    return dfs
+def score_next_anchor(href: str, text: str, attrs: dict, base_url: str, current_page: Optional[int] = None) -> int:
+    """
+    Score how likely one anchor is the "next page" link; 0 or less means no.
+    Works on plain (href, text, attributes) so any parser can feed it.
+    `current_page` is page_number(base_url), passed in to avoid recomputing it.
+    """
+    href = (href or "").strip()
+    if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")):
+        return 0
+    absolute = urljoin(base_url, href)
+    if absolute.split("#")[0] == base_url.split("#")[0]:
+        return 0
+
+    text = " ".join((text or "").split()).lower()
+    rel = (attrs.get("rel") or "").lower().split()
+    hints = " ".join(attrs.get(k) or "" for k in ("class", "id")).lower()
+    label = " ".join(attrs.get(k) or "" for k in ("aria-label", "title")).lower()
+
+    score = 0
+    if "next" in rel:
+        score += 100
+    if text in _NEXT_TEXTS:
+        score += 50
+    elif text and len(text) < 20 and ("next" in text or "more" in text or "older" in text):
+        score += 30
+    if _NEXT_TOKEN.search(hints):
+        score += 40
+    if "next" in label:
+        score += 40
+
+    num = page_number(absolute)
+    if num is not None:
+        if num == (current_page or 1) + 1:
+            score += 35
+        elif num <= (current_page or 1):
+            score -= 20
+
+    if "prev" in rel or any(w in text for w in _PREV_WORDS) or "prev" in hints or "prev" in label:
+        score -= 100
+    if "disabled" in hints or (attrs.get("aria-disabled") or "").lower() == "true":
+        score -= 50
+    return score
+
+
+def best_next_link(anchors, base_url: str) -> Optional[str]:
+    """
+    Pick the next-page link from an iterable of (href, text, attrs) in document
+    order: highest score wins, ties go to the earliest anchor.
+    """
+    current = page_number(base_url)
+    best, best_score = None, NEXT_LINK_MIN_SCORE - 1
+    for href, text, attrs in anchors:
+        score = score_next_anchor(href, text, attrs, base_url, current)
+        if score > best_score:
+            best, best_score = href, score
+    return urljoin(base_url, best.strip()) if best else None
 
 
-def extract_next_page_link(html: str, base_url: str) -> Optional[str]:
+def extract_next_page_link(html, base_url: str) -> Optional[str]:
     """
-    Attempt to find a 'Next' page link in the HTML.
-    Returns absolute URL or None.
+    Find the 'Next' page link in the HTML (or ParsedDocument) with a single pass
+    over its anchors, scoring rel=next, link text, class/id, aria-label/title and
+    ?page=N+1 style URLs. Returns absolute URL or None.
     """
     if not html:
         return None
-    
-    from urllib.parse import urljoin
-    soup = BeautifulSoup(html, "html.parser")
-    
-    # Common text patterns for "Next" buttons
-    next_patterns = [
-        "next", "Next", "NEXT", ">", "»", "›", "More", "older"
-    ]
-    
-    # 1. Look for <a> tags with rel="next"
-    link = soup.find("a", attrs={"rel": "next"})
-    if link and link.get("href"):
-        return urljoin(base_url, link.get("href"))
-        
-    # 2. Look for <a> tags containing specific text
-    for pattern in next_patterns:
-        # strict text match or partial? partial is riskier but more inclusive
-        # try exact match first
-        link = soup.find("a", string=pattern)
-        if link and link.get("href"):
-            return urljoin(base_url, link.get("href"))
-            
-        # try partial match (case insensitive)
-        # (be careful not to match "Next Generation" or something unrelated)
-        # simple heuristic: text length < 20
-        candidates = soup.find_all("a", string=lambda t: t and pattern.lower() in t.lower() and len(t) < 20)
-        if candidates:
-            return urljoin(base_url, candidates[0].get("href"))
-            
-    # 3. Look for common class names/IDs
-    pagination_classes = ["next", "pagination-next", "nav-next"]
-    for cls in pagination_classes:
-        link = soup.find("a", class_=cls) or soup.find("a", id=cls)
-        if link and link.get("href"):
-            return urljoin(base_url, link.get("href"))
-            
-    return None
+    anchors = (
+        (a.get("href"), a.text_content(), a.attrib)
+        for a in as_document(html).root.iter("a")
+        if a.get("href")
+    )
+    return best_next_link(anchors, base_url)
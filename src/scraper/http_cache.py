@@ -0,0 +1,219 @@
+# src/scraper/http_cache.py
+"""
+On-disk conditional HTTP cache for scraped pages.
+
+Layout under data/_http_cache/:
+  index.db                 sqlite index (url -> body hash + validators, object sizes)
+  objects/ab/<sha256>      raw response bodies, content-addressed
+  tables/<sha256>/<sig>/    tables already extracted from that body, stored
+                           as Parquet like a job's tables (see src.storage)
+
+Entries younger than `ttl` seconds are served without a request; older ones are
+revalidated with If-None-Match / If-Modified-Since and a 304 is served from disk.
+Total size is bounded; least recently used entries are evicted first.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 0  # seconds; 0 means "always revalidate"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class HttpCache:
+    def __init__(self, root: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.ttl = float(ttl or 0)
+        self.max_bytes = int(max_bytes or DEFAULT_MAX_BYTES)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tables"), exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30, check_same_thread=False)
+
+    def _init_db(self):
+        conn = self._connect()
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY,
+            body_hash TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            encoding TEXT,
+            stored_at REAL,
+            last_access REAL
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS objects (
+            hash TEXT PRIMARY KEY,
+            size INTEGER
+        )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _object_path(self, body_hash: str) -> str:
+        return os.path.join(self.root, "objects", body_hash[:2], body_hash)
+
+    def _tables_dir(self, body_hash: str) -> str:
+        return os.path.join(self.root, "tables", body_hash)
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        conn = self._connect()
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT url, body_hash, etag, last_modified, encoding, stored_at FROM entries WHERE url=?",
+            (url,),
+        )
+        row = cur.fetchone()
+        conn.close()
+        if not row or not os.path.exists(self._object_path(row[1])):
+            return None
+        return {
+            "url": row[0],
+            "body_hash": row[1],
+            "etag": row[2],
+            "last_modified": row[3],
+            "encoding": row[4],
+            "stored_at": row[5],
+        }
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return self.ttl > 0 and (time.time() - (entry.get("stored_at") or 0)) < self.ttl
+
+    @staticmethod
+    def validators(entry: Optional[Dict]) -> Dict[str, str]:
+        """Conditional request headers for a cached entry."""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_text(self, entry: Dict) -> str:
+        with open(self._object_path(entry["body_hash"]), "rb") as f:
+            body = f.read()
+        return body.decode(entry.get("encoding") or "utf-8", errors="replace")
+
+    def touch(self, url: str, revalidated: bool = False):
+        now = time.time()
+        conn = self._connect()
+        if revalidated:
+            conn.execute("UPDATE entries SET last_access=?, stored_at=? WHERE url=?", (now, now, url))
+        else:
+            conn.execute("UPDATE entries SET last_access=? WHERE url=?", (now, url))
+        conn.commit()
+        conn.close()
+
+    def store(self, url: str, body: bytes, encoding: Optional[str], headers) -> Dict:
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self._object_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        now = time.time()
+        entry = {
+            "url": url,
+            "body_hash": body_hash,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "encoding": encoding,
+            "stored_at": now,
+        }
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (url, body_hash, etag, last_modified, encoding, stored_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, entry["etag"], entry["last_modified"], encoding, now, now),
+            )
+            conn.execute("INSERT OR IGNORE INTO objects (hash, size) VALUES (?, ?)", (body_hash, len(body)))
+            conn.commit()
+            conn.close()
+        self.evict()
+        return entry
+
+    def get_tables(self, body_hash: str, sig: str) -> Optional[List]:
+        d = os.path.join(self._tables_dir(body_hash), sig)
+        if not os.path.isdir(d):
+            return None
+        try:
+            return [storage.read_table(d, name) for name in storage.list_tables(d)]
+        except Exception as e:
+            logger.debug("http cache: unreadable tables for %s: %s", body_hash, e)
+            return None
+
+    def put_tables(self, body_hash: str, sig: str, tables: List):
+        """Store the DataFrames extracted from a cached body under an extraction signature."""
+        d = os.path.join(self._tables_dir(body_hash), sig)
+        # written aside and moved into place whole: a directory that exists is complete
+        tmp = f"{d}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            for k, df in enumerate(tables, start=1):
+                storage.write_table(tmp, f"table_{k}", df)
+            size = sum(e.stat().st_size for e in os.scandir(tmp))
+            shutil.rmtree(d, ignore_errors=True)
+            os.replace(tmp, d)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE objects SET size = size + ? WHERE hash=?", (size, body_hash))
+            conn.commit()
+            conn.close()
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries (and unreferenced objects) until under max_bytes."""
+        with self._lock:
+            conn = self._connect()
+            cur = conn.cursor()
+            total = cur.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if total <= self.max_bytes:
+                conn.close()
+                return
+            target = int(self.max_bytes * 0.9)
+            lru = cur.execute("SELECT url, body_hash FROM entries ORDER BY last_access ASC").fetchall()
+            for url, body_hash in lru:
+                if total <= target:
+                    break
+                cur.execute("DELETE FROM entries WHERE url=?", (url,))
+                still_used = cur.execute("SELECT 1 FROM entries WHERE body_hash=? LIMIT 1", (body_hash,)).fetchone()
+                if still_used:
+                    continue
+                size = cur.execute("SELECT size FROM objects WHERE hash=?", (body_hash,)).fetchone()
+                cur.execute("DELETE FROM objects WHERE hash=?", (body_hash,))
+                total -= size[0] if size else 0
+                try:
+                    os.remove(self._object_path(body_hash))
+                except OSError:
+                    pass
+                shutil.rmtree(self._tables_dir(body_hash), ignore_errors=True)
+            conn.commit()
+            conn.close()
+
+
+def table_signature(*parts) -> str:
+    """Key for stored tables: which extraction settings produced them."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
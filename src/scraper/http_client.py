@@ -0,0 +1,331 @@
+# src/scraper/http_client.py
+"""
+Shared HTTP client for every outbound request the worker makes.
+
+One client per process keeps per-host connection pools alive between calls, so
+consecutive pages of a crawl (and retries of the same page) reuse the TCP+TLS
+connection instead of paying a new handshake each time. It is used by the page
+fetcher, webhook POSTs and the OpenAI-compatible LLM calls.
+
+ - requests.Session with mounted HTTPAdapters (per-host pools, keep-alive)
+ - gzip/deflate always, brotli when `brotli`/`brotlicffi` is installed
+ - optional HTTP/2 through httpx (only used when `httpx[http2]` is installed);
+   its responses and errors are converted to the requests types callers expect
+
+Pools are never rebuilt under a running job: there is one client per pool
+setting (pool sizes, http2), and a job only selects the client matching its
+options, so jobs with the same settings share warm connections. The job's
+timeouts live on a JobClient view of that client, never on the shared one.
+"""
+
+import contextlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_CONNECTIONS = 10  # number of per-host pools kept alive
+DEFAULT_POOL_MAXSIZE = 10  # keep-alive connections per host pool
+DEFAULT_CONNECT_TIMEOUT = 5.0  # seconds
+DEFAULT_READ_TIMEOUT = 10.0  # seconds
+MAX_CLIENTS = 4  # distinct pool settings kept alive per process
+# requests kwargs httpx takes when building the request; others are translated
+# in _h2_kwargs() or keep the request on the requests session
+_H2_REQUEST_KWARGS = {"params", "headers", "cookies", "data", "files", "json"}
+
+Timeout = Union[float, Tuple[float, float], None]
+
+
+def _accept_encoding() -> str:
+    # urllib3 decodes brotli transparently, but only if a brotli module is importable
+    for mod in ("brotli", "brotlicffi"):
+        try:
+            __import__(mod)
+            return "gzip, deflate, br"
+        except ImportError:
+            continue
+    return "gzip, deflate"
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@contextlib.contextmanager
+def _requests_errors():
+    """Re-raise httpx errors as the requests exceptions callers handle."""
+    import httpx
+    try:
+        yield
+    except httpx.ConnectTimeout as e:
+        raise requests.ConnectTimeout(str(e)) from e
+    except httpx.TimeoutException as e:
+        raise requests.ReadTimeout(str(e)) from e
+    except httpx.ConnectError as e:
+        raise requests.ConnectionError(str(e)) from e
+    except httpx.TooManyRedirects as e:
+        raise requests.TooManyRedirects(str(e)) from e
+    except (httpx.InvalidURL, httpx.UnsupportedProtocol) as e:
+        raise requests.exceptions.InvalidURL(str(e)) from e
+    except (httpx.HTTPError, httpx.StreamError) as e:
+        raise requests.RequestException(str(e)) from e
+
+
+class _HttpxRaw:
+    """File-like `raw` of a streamed httpx response (decoded bytes), for requests' iter_content()."""
+
+    def __init__(self, resp):
+        self._resp = resp
+        self._chunks = resp.iter_bytes()
+        self._buf = b""
+
+    def read(self, amt=None, **_):
+        with _requests_errors():
+            while amt is None or len(self._buf) < amt:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buf += chunk
+        if amt is None:
+            data, self._buf = self._buf, b""
+        else:
+            data, self._buf = self._buf[:amt], self._buf[amt:]
+        return data
+
+    def close(self):
+        self._resp.close()
+
+
+def _to_requests_response(resp, stream: bool = False) -> requests.Response:
+    """
+    A requests.Response carrying an httpx response: read in full, or with
+    stream=True read through iter_content() and released by close().
+    """
+    r = requests.Response()
+    r.status_code = resp.status_code
+    r.headers = CaseInsensitiveDict(resp.headers.multi_items())
+    r.encoding = get_encoding_from_headers(r.headers)
+    r.reason = resp.reason_phrase
+    r.url = str(resp.url)
+    if stream:
+        r.raw = _HttpxRaw(resp)
+    else:
+        r._content = resp.content
+    return r
+
+
+def _h2_kwargs(kwargs: dict) -> Optional[Tuple[dict, dict]]:
+    """
+    requests-style kwargs as (build_request kwargs, send kwargs) for httpx;
+    None when one of them (verify, cert, hooks, ...) has no per-request
+    equivalent there.
+    """
+    build, send = {}, {}
+    for key, value in kwargs.items():
+        if key in _H2_REQUEST_KWARGS:
+            build[key] = value
+        elif key == "allow_redirects":
+            send["follow_redirects"] = bool(value)
+        elif key == "auth":
+            send["auth"] = value
+        elif key == "stream":
+            send["stream"] = bool(value)
+        else:
+            return None
+    return build, send
+
+
+class JobClient:
+    """A job's view of a shared HttpClient, carrying that job's default timeouts."""
+
+    def __init__(self, client: "HttpClient", connect_timeout: float, read_timeout: float):
+        self.client = client
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def request(self, method: str, url: str, timeout: Timeout = None, **kwargs):
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, (tuple, list)):
+            # a single number keeps its historic meaning of "read timeout"
+            timeout = (min(self.connect_timeout, float(timeout)), float(timeout))
+        return self.client.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+class HttpClient:
+    _instance = None  # JobClient of the running job
+    _clients: "OrderedDict[tuple, HttpClient]" = OrderedDict()  # by _pool_key()
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        http2: bool = False,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self._session = None
+        self._h2_client = None
+
+    @staticmethod
+    def _pool_key(pool_connections=None, pool_maxsize=None, http2=None) -> tuple:
+        return (
+            DEFAULT_POOL_CONNECTIONS if pool_connections is None else int(pool_connections),
+            DEFAULT_POOL_MAXSIZE if pool_maxsize is None else int(pool_maxsize),
+            bool(http2),
+        )
+
+    @classmethod
+    def get_instance(cls, **settings):
+        """
+        Return the JobClient of the running job. Passing settings (pool sizes,
+        timeouts, http2) makes a new view with those timeouts over the client
+        with those pool settings, creating it if needed; no existing pool is
+        closed and no other job's timeouts change.
+        """
+        with cls._lock:
+            if cls._instance is None or settings:
+                key = cls._pool_key(settings.get("pool_connections"), settings.get("pool_maxsize"), settings.get("http2"))
+                client = cls._clients.get(key)
+                if client is None:
+                    client = cls(pool_connections=key[0], pool_maxsize=key[1], http2=key[2])
+                    cls._clients[key] = client
+                    while len(cls._clients) > MAX_CLIENTS:
+                        # dropped, not closed: a straggling fetch may still hold it
+                        cls._clients.popitem(last=False)
+                cls._clients.move_to_end(key)
+                cls._instance = JobClient(
+                    client,
+                    float(settings.get("connect_timeout") or DEFAULT_CONNECT_TIMEOUT),
+                    float(settings.get("read_timeout") or DEFAULT_READ_TIMEOUT),
+                )
+            return cls._instance
+
+    @property
+    def session(self) -> requests.Session:
+        """Lazy initialization of the pooled requests session."""
+        if self._session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({"Accept-Encoding": _accept_encoding(), "Connection": "keep-alive"})
+            self._session = s
+        return self._session
+
+    def _get_h2_client(self):
+        if not self.http2:
+            return None
+        if self._h2_client is None:
+            if not _http2_available():
+                logger.warning("http2 requested but httpx[http2] is not installed, using HTTP/1.1")
+                self.http2 = False
+                return None
+            import httpx
+            limits = httpx.Limits(
+                max_connections=self.pool_connections * self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize,
+            )
+            self._h2_client = httpx.Client(
+                http2=True,
+                limits=limits,
+                # requests follows redirects by default; httpx does not
+                follow_redirects=True,
+                headers={"Accept-Encoding": _accept_encoding()},
+            )
+        return self._h2_client
+
+    def _timeout(self, timeout: Timeout) -> Tuple[float, float]:
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, (tuple, list)):
+            return (float(timeout[0]), float(timeout[1]))
+        # a single number keeps its historic meaning of "read timeout"
+        return (min(self.connect_timeout, float(timeout)), float(timeout))
+
+    def request(self, method: str, url: str, timeout: Timeout = None, proxies: Optional[dict] = None, **kwargs):
+        """
+        Send a request over the shared pools. Returns a requests.Response and
+        raises requests exceptions, whichever transport carried the request.
+        """
+        connect, read = self._timeout(timeout)
+        # httpx binds proxies (and TLS settings) to the client, so such requests stay on the session
+        h2_kwargs = _h2_kwargs(kwargs) if not proxies else None
+        h2 = self._get_h2_client() if h2_kwargs is not None else None
+        if h2 is not None:
+            import httpx
+            build, send = h2_kwargs
+            with _requests_errors():
+                req = h2.build_request(method, url, timeout=httpx.Timeout(read, connect=connect), **build)
+                return _to_requests_response(h2.send(req, **send), stream=send.get("stream", False))
+        return self.session.request(method, url, timeout=(connect, read), proxies=proxies, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+            self._session = None
+        if self._h2_client is not None:
+            try:
+                self._h2_client.close()
+            except Exception:
+                pass
+            self._h2_client = None
+
+
+def get_http_client(**settings) -> JobClient:
+    return HttpClient.get_instance(**settings)
+
+
+def timeouts_from_options(opts: dict) -> Tuple[float, float]:
+    """(connect, read) timeouts of a job, from its http_* options."""
+    opts = opts or {}
+    return (
+        float(opts.get("http_connect_timeout") or DEFAULT_CONNECT_TIMEOUT),
+        float(opts.get("http_read_timeout") or DEFAULT_READ_TIMEOUT),
+    )
+
+
+def configure_from_options(opts: dict) -> JobClient:
+    """Select the shared client for the http_* job options, with the job's timeouts."""
+    opts = opts or {}
+    connect, read = timeouts_from_options(opts)
+    return HttpClient.get_instance(
+        pool_connections=opts.get("http_pool_connections"),
+        pool_maxsize=opts.get("http_pool_maxsize"),
+        connect_timeout=connect,
+        read_timeout=read,
+        http2=opts.get("http2"),
+    )
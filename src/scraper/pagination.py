@@ -0,0 +1,228 @@
+# src/scraper/pagination.py
+"""
+Pagination URL pattern inference.
+
+From the URLs of the first two pages of a crawl (the start URL and the
+next-page link found on it) infer how the page number is encoded -- a
+`?page=N` style parameter, an `offset=`/`start=` row offset, or a numeric path
+segment such as `/page/3/` -- and predict the URLs of the following pages so
+the crawl engine can fetch them ahead of time, concurrently.
+
+Predictions are only ever used as prefetches: the crawl still follows the
+next-page link it finds on each page and checks it against the prediction.
+A mismatch, a failed (e.g. 404) prefetch or a page repeating the previous
+page's tables abandons the prediction and the crawl carries on by plain
+link-following.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+from src.scraper.dedupe import frame_hash
+
+logger = logging.getLogger(__name__)
+
+# Parameters holding a row offset rather than a page number: page 1 is offset 0
+OFFSET_PARAMS = ("offset", "start", "skip", "from", "first", "startindex", "start_index")
+DEFAULT_LOOKAHEAD = 8
+
+
+def _int(value: str) -> Optional[int]:
+    return int(value) if value is not None and value.isdigit() else None
+
+
+class PagePattern:
+    """
+    Page k of the crawl (1-based) is `base` with its varying component set to
+    `first + (k - 1) * step`.
+    """
+
+    def __init__(self, base: str, kind: str, key, first: int, step: int):
+        self.base = base
+        self.kind = kind  # "query" (key = parameter name) or "path" (key = segment index)
+        self.key = key
+        self.first = first
+        self.step = step
+
+    def value(self, page: int) -> int:
+        return self.first + (page - 1) * self.step
+
+    def url(self, page: int) -> str:
+        parts = urlsplit(self.base)
+        value = str(self.value(page))
+        if self.kind == "query":
+            # substitute in the raw query so the URL is spelled exactly like the
+            # site's own links (and matches prefetches scheduled from them)
+            pattern = r"(^|&)(" + re.escape(self.key) + r")=\d+"
+            query = re.sub(pattern, lambda m: f"{m.group(1)}{m.group(2)}={value}", parts.query, count=1)
+            return urlunsplit(parts._replace(query=query))
+        segments = parts.path.split("/")
+        segments[self.key] = value
+        return urlunsplit(parts._replace(path="/".join(segments)))
+
+    def __repr__(self):
+        return f"{self.kind}:{self.key} first={self.first} step={self.step}"
+
+
+def _query_pattern(a, b) -> Optional[PagePattern]:
+    qa = dict(parse_qsl(a.query, keep_blank_values=True))
+    qb = dict(parse_qsl(b.query, keep_blank_values=True))
+    changed = [k for k in set(qa) | set(qb) if qa.get(k) != qb.get(k)]
+    if len(changed) != 1:
+        return None
+    key = changed[0]
+    vb = _int(qb.get(key))
+    if vb is None:
+        return None
+    va = _int(qa.get(key))
+    if va is None:
+        if key in qa:
+            return None
+        # parameter only appears from page 2 on: page 1 is implicit
+        va = 0 if key.lower() in OFFSET_PARAMS else vb - 1
+    if vb <= va:
+        return None
+    return PagePattern(urlunsplit(b), "query", key, va, vb - va)
+
+
+def _path_pattern(a, b) -> Optional[PagePattern]:
+    sa, sb = a.path.split("/"), b.path.split("/")
+    if len(sa) == len(sb):
+        diff = [i for i, (x, y) in enumerate(zip(sa, sb)) if x != y]
+        if len(diff) != 1:
+            return None
+        i = diff[0]
+        va, vb = _int(sa[i]), _int(sb[i])
+        if va is None or vb is None or vb <= va:
+            return None
+        return PagePattern(urlunsplit(b), "path", i, va, vb - va)
+    # "/blog/" -> "/blog/page/2/": the page segments only appear from page 2 on
+    trimmed_a = [s for s in sa if s]
+    trimmed_b = [s for s in sb if s]
+    if len(trimmed_b) == len(trimmed_a) + 2 and trimmed_b[:len(trimmed_a)] == trimmed_a and trimmed_b[-2].lower() == "page":
+        vb = _int(trimmed_b[-1])
+        if vb is None or vb < 2:
+            return None
+        index = max(i for i, s in enumerate(sb) if s)
+        return PagePattern(urlunsplit(b), "path", index, vb - 1, 1)
+    return None
+
+
+def infer_pattern(first_url: str, second_url: str) -> Optional[PagePattern]:
+    """
+    Infer the page pattern from the URLs of two consecutive pages; None when
+    they differ in anything but a single increasing number.
+    """
+    if not first_url or not second_url:
+        return None
+    a, b = urlsplit(first_url), urlsplit(second_url)
+    if (a.scheme, a.netloc.lower()) != (b.scheme, b.netloc.lower()):
+        return None
+    if a.path == b.path:
+        pattern = _query_pattern(a, b)
+    elif sorted(parse_qsl(a.query)) == sorted(parse_qsl(b.query)):
+        pattern = _path_pattern(a, b)
+    else:
+        return None
+    # must reproduce the URL it was inferred from
+    if pattern is None or not same_page_url(pattern.url(2), second_url):
+        return None
+    return pattern
+
+
+def same_page_url(a: str, b: str) -> bool:
+    """URL equality ignoring fragment and query parameter order."""
+    if not a or not b:
+        return False
+    pa, pb = urlsplit(a), urlsplit(b)
+    return (
+        (pa.scheme, pa.netloc.lower(), pa.path.rstrip("/") or "/") == (pb.scheme, pb.netloc.lower(), pb.path.rstrip("/") or "/")
+        and sorted(parse_qsl(pa.query, keep_blank_values=True)) == sorted(parse_qsl(pb.query, keep_blank_values=True))
+    )
+
+
+def tables_fingerprint(tables: List) -> Optional[str]:
+    """Content hash of a page's tables, to spot a page repeating the previous one."""
+    if not tables:
+        return None
+    h = hashlib.sha1()
+    for df in tables:
+        h.update(frame_hash(df).encode("ascii"))
+    return h.hexdigest()
+
+
+class PagePredictor:
+    """
+    Keeps predicted page URLs prefetched on a CrawlEngine, `lookahead` pages
+    ahead of the page currently being processed.
+    """
+
+    def __init__(self, engine, pattern: PagePattern, max_pages: int, lookahead: int = DEFAULT_LOOKAHEAD):
+        self.engine = engine
+        self.pattern = pattern
+        self.max_pages = max_pages
+        self.lookahead = max(1, int(lookahead or DEFAULT_LOOKAHEAD))
+        self.active = True
+        self.reason = None
+        self.confirmed = 0
+        self._scheduled: Dict[int, str] = {}
+        # prefetch failures are reported from the engine thread
+        self._lock = threading.RLock()
+
+    def advance(self, page_num: int):
+        """Prefetch predicted pages after `page_num`, up to the lookahead window."""
+        with self._lock:
+            if self.active:
+                self._schedule(page_num)
+
+    def _schedule(self, page_num: int):
+        for n in range(page_num + 1, min(self.max_pages, page_num + self.lookahead) + 1):
+            if n in self._scheduled:
+                continue
+            url = self.pattern.url(n)
+            self._scheduled[n] = url
+            fut = self.engine.prefetch(url)
+            fut.add_done_callback(lambda f, n=n: self._check(n, f))
+
+    def _check(self, page_num: int, fut):
+        # a predicted page that failed to fetch (404, ...) is past the end or a wrong guess
+        if self.active and not fut.cancelled() and fut.exception() is not None:
+            self.abandon(f"page {page_num} prefetch failed: {fut.exception()}", after=page_num - 1)
+
+    def confirm(self, page_num: int, next_link: Optional[str]) -> bool:
+        """
+        Check the next-page link found on `page_num` against the prediction;
+        keeps prefetching on a match, abandons the prediction otherwise.
+        """
+        if not self.active:
+            return False
+        if not same_page_url(next_link, self.pattern.url(page_num + 1)):
+            self.abandon(f"page {page_num} links to {next_link}")
+            return False
+        self.confirmed += 1
+        self.advance(page_num + 1)
+        return True
+
+    def abandon(self, reason: str, after: int = 0):
+        """Stop predicting and drop the prefetches of pages after `after`."""
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self.reason = reason
+            dropped = [url for n, url in self._scheduled.items() if n > after]
+        logger.info("Pagination prediction abandoned: %s", reason)
+        for url in dropped:
+            self.engine.discard(url)
+
+    def stats(self) -> dict:
+        return {
+            "pattern": repr(self.pattern),
+            "prefetched": len(self._scheduled),
+            "confirmed": self.confirmed,
+            "abandoned": self.reason,
+        }
@@ -0,0 +1,286 @@
+# src/scraper/session_crawl.py
+"""
+In-session SPA pagination for Playwright crawls.
+
+A plain crawl finds the next page's href in the HTML and opens it with a
+fresh goto. Single-page apps often have a "Next" button without an href, or
+load more rows as the user scrolls. crawl_in_session() keeps one page open
+instead: it clicks the next / "load more" control (or scrolls to the bottom
+when there is none), waits for the DOM to settle and extracts again. Each
+step only reports rows it has not seen before, so grids that grow
+(infinite scroll) and grids that are replaced (paged) both come out
+incrementally. The crawl stops after max_pages steps or when a step brings
+no new rows.
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from src.scraper.dedupe import raw_table_hash
+from src.scraper.playwright_client import (
+    DEFAULT_MAX_GRID_ROWS,
+    PWTimeout,
+    RouteBlocker,
+    _extract_with_capture,
+    _manager,
+    extract_grid_tables_from_page,
+    scroll_budget,
+    wait_for_dom_stable,
+)
+from src.scraper.xhr_capture import ResponseCapture
+
+logger = logging.getLogger(__name__)
+
+MODES = ("auto", "click", "scroll")
+PROBE_SCROLL_MS = 800  # how long probe_pagination() waits for a scroll to load more
+STEP_WAIT_MS = 5000  # max wait for the DOM to settle after a click/scroll
+SCROLL_IDLE_STEPS = 2  # lazy loads can be slow: allow one empty scroll before stopping
+NEXT_MARK = "data-adf-next"
+
+# Finds the most likely "next page" / "load more" control, marks it with
+# NEXT_MARK and returns a description of it (null when there is none).
+_FIND_NEXT_JS = """
+({ mark }) => {
+  document.querySelectorAll(`[${mark}]`).forEach((el) => el.removeAttribute(mark));
+  const NEXT = /^(next|next page|next ›|next »|›|»|>|→|older|load more|show more|more results|view more|see more)$/i;
+  const LOOSE = /\\b(next|load more|show more|more results)\\b/i;
+  const PREV = /\\b(prev|previous|back|first|last)\\b|«|‹/i;
+  const disabled = (el) =>
+    el.disabled || el.getAttribute("aria-disabled") === "true" ||
+    /(^|[\\s_-])disabled($|[\\s_-])/i.test(el.className && el.className.baseVal !== undefined ? el.className.baseVal : el.className || "") ||
+    (el.parentElement && /(^|[\\s_-])disabled($|[\\s_-])/i.test(el.parentElement.className || ""));
+  const visible = (el) => {
+    const r = el.getBoundingClientRect();
+    const s = getComputedStyle(el);
+    return r.width > 0 && r.height > 0 && s.visibility !== "hidden" && s.display !== "none";
+  };
+  let best = null, bestScore = 0;
+  const candidates = document.querySelectorAll("button, a, [role=button], [role=link], li[title], span[title]");
+  for (const el of candidates) {
+    if (!visible(el) || disabled(el)) continue;
+    const text = (el.innerText || el.textContent || "").trim().replace(/\\s+/g, " ");
+    const label = [el.getAttribute("aria-label"), el.getAttribute("title"), el.getAttribute("rel")].filter(Boolean).join(" ");
+    const cls = typeof el.className === "string" ? el.className : "";
+    let score = 0;
+    if (NEXT.test(text)) score += 50;
+    else if (text.length <= 30 && LOOSE.test(text)) score += 30;
+    if (/\\bnext\\b/i.test(label)) score += 40;
+    if (/(^|[\\s_-])next($|[\\s_-])/i.test(cls)) score += 20;
+    if (PREV.test(text) || /\\b(prev|previous)\\b/i.test(label)) score -= 100;
+    if (score > bestScore) { best = el; bestScore = score; }
+  }
+  if (!best || bestScore < 30) return null;
+  best.setAttribute(mark, "1");
+  return { text: (best.innerText || "").trim().slice(0, 40), tag: best.tagName.toLowerCase(), score: bestScore };
+}
+"""
+
+_SCROLL_BOTTOM_JS = """
+() => {
+  const before = document.documentElement.scrollHeight;
+  window.scrollTo(0, before);
+  return before;
+}
+"""
+
+# Scrolls a scrollable page to the bottom and reports whether it grew (infinite
+# scroll), then scrolls back.
+_SCROLL_GROWS_JS = """
+async ({ waitMs }) => {
+  const el = document.scrollingElement || document.documentElement;
+  const before = el.scrollHeight;
+  if (before <= window.innerHeight + 50) return false;
+  window.scrollTo(0, before);
+  await new Promise((resolve) => setTimeout(resolve, waitMs));
+  const grew = el.scrollHeight > before;
+  window.scrollTo(0, 0);
+  return grew;
+}
+"""
+
+
+class _RowTracker:
+    """Remembers every row reported so far, per table header signature."""
+
+    def __init__(self):
+        self.seen = set()
+
+    def new_rows(self, tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        for t in tables:
+            headers = t.get("headers") or []
+            fresh = []
+            for row in t.get("rows") or []:
+                key = raw_table_hash(headers, [row])
+                if key not in self.seen:
+                    self.seen.add(key)
+                    fresh.append(row)
+            if fresh:
+                out.append(dict(t, rows=fresh))
+        return out
+
+
+def _click_next(page, timeout_ms: int) -> Optional[Dict[str, Any]]:
+    try:
+        found = page.evaluate(_FIND_NEXT_JS, {"mark": NEXT_MARK})
+    except Exception as e:
+        logger.debug("next control lookup failed: %s", e)
+        return None
+    if not found:
+        return None
+    try:
+        page.click(f"[{NEXT_MARK}]", timeout=timeout_ms)
+    except Exception as e:
+        logger.info("Clicking next control %r failed: %s", found.get("text"), e)
+        return None
+    return found
+
+
+def _scroll_bottom(page) -> bool:
+    try:
+        page.evaluate(_SCROLL_BOTTOM_JS)
+        return True
+    except Exception as e:
+        logger.debug("scroll failed: %s", e)
+        return False
+
+
+def probe_pagination(page) -> Dict[str, Any]:
+    """
+    Whether a rendered page can be paged in session: {"next": next control
+    (see _FIND_NEXT_JS) or None, "scroll": scrolling to the bottom loads more}.
+    The scroll is only tried when there is no next control.
+    """
+    try:
+        found = page.evaluate(_FIND_NEXT_JS, {"mark": NEXT_MARK})
+        grows = False if found else bool(page.evaluate(_SCROLL_GROWS_JS, {"waitMs": PROBE_SCROLL_MS}))
+    except Exception as e:
+        logger.debug("pagination probe failed: %s", e)
+        return {"next": None, "scroll": False}
+    return {"next": found, "scroll": grows}
+
+
+async def probe_pagination_async(page) -> Dict[str, Any]:
+    """probe_pagination() for pages of the async Playwright API."""
+    try:
+        found = await page.evaluate(_FIND_NEXT_JS, {"mark": NEXT_MARK})
+        grows = False if found else bool(await page.evaluate(_SCROLL_GROWS_JS, {"waitMs": PROBE_SCROLL_MS}))
+    except Exception as e:
+        logger.debug("pagination probe failed: %s", e)
+        return {"next": None, "scroll": False}
+    return {"next": found, "scroll": grows}
+
+
+def crawl_in_session(
+    url: str,
+    on_page: Callable[[int, List[Dict[str, Any]], str, str], None],
+    max_pages: int,
+    mode: str = "auto",
+    timeout: int = 30,
+    wait_for: int = 900,
+    proxy: Optional[str] = None,
+    stealth: bool = True,
+    resource_policy: Optional[Dict[str, Any]] = None,
+    max_grid_rows: int = DEFAULT_MAX_GRID_ROWS,
+    capture_xhr: bool = True,
+    screenshot_path: Optional[str] = None,
+    skip_pages: int = 0,
+) -> Dict[str, Any]:
+    """
+    Open `url` once and page through it in place.
+
+    on_page(page_num, tables, page_url, html) is called for every step that
+    brought new rows; tables hold only the new rows ({headers, rows, source}).
+    The first `skip_pages` such steps are replayed without calling on_page
+    (the page was already saved by a plain render, or before a resume).
+    mode: "click" follows next / "load more" controls, "scroll" scrolls to the
+          bottom for infinite loads, "auto" clicks when a control exists and
+          scrolls otherwise.
+    Returns {"pages", "rows", "steps": [{"action", "new_rows", "url"}], "stop", "xhr"}.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown session pagination mode {mode!r}")
+    tracker = _RowTracker()
+    blocker = RouteBlocker(resource_policy) if resource_policy else None
+    capture = ResponseCapture() if capture_xhr else None
+    steps: List[Dict[str, Any]] = []
+    pages = rows = 0
+    stop = "max_pages"
+
+    def _extract(page):
+        if capture:
+            return _extract_with_capture(page, capture, max_grid_rows, scroll_budget(timeout))
+        return extract_grid_tables_from_page(page, wait_for=0, max_rows=max_grid_rows, scroll_budget_ms=scroll_budget(timeout))
+
+    def _report(page, action) -> int:
+        nonlocal pages, rows
+        fresh = tracker.new_rows(_extract(page))
+        count = sum(len(t["rows"]) for t in fresh)
+        steps.append({"action": action, "new_rows": count, "url": page.url})
+        if count:
+            pages += 1
+            rows += count
+            if pages <= skip_pages:
+                return count
+            try:
+                html = page.content()
+            except Exception:
+                html = ""
+            on_page(pages, fresh, page.url, html)
+        return count
+
+    try:
+        with _manager.page(proxy=proxy, stealth=stealth) as page:
+            page.set_default_navigation_timeout(timeout * 1000)
+            if blocker:
+                blocker.install(page)
+            if capture:
+                capture.install(page)
+            try:
+                try:
+                    page.goto(url, wait_until="domcontentloaded")
+                except PWTimeout:
+                    logger.info("Playwright navigation timeout for %s", url)
+                wait_for_dom_stable(page, max_wait_ms=wait_for)
+                if not _report(page, "load"):
+                    stop = "no_rows"
+                idle = 0
+                while stop == "max_pages" and pages < max_pages:
+                    action = None
+                    if mode in ("auto", "click") and _click_next(page, timeout * 1000):
+                        action = "click"
+                    elif mode in ("auto", "scroll") and _scroll_bottom(page):
+                        action = "scroll"
+                    if action is None:
+                        stop = "no_next_control"
+                        break
+                    wait_for_dom_stable(page, max_wait_ms=STEP_WAIT_MS)
+                    if _report(page, action):
+                        idle = 0
+                        continue
+                    idle += 1
+                    if action == "click" or idle >= SCROLL_IDLE_STEPS:
+                        stop = "no_new_rows"
+            except Exception as exc:
+                logger.exception("crawl_in_session failed: %s", exc)
+                stop = f"error: {exc}"
+                if screenshot_path:
+                    try:
+                        page.screenshot(path=screenshot_path)
+                    except Exception:
+                        pass
+            finally:
+                if capture:
+                    capture.uninstall(page)
+    except Exception as e:
+        logger.exception("Fatal Playwright error: %s", e)
+        _manager.close()
+        stop = f"error: {e}"
+
+    return {
+        "pages": pages,
+        "rows": rows,
+        "steps": steps,
+        "stop": stop,
+        "xhr": {"responses": capture.seen} if capture else None,
+    }
@@ -0,0 +1,428 @@
+# src/scraper/stream_ingest.py
+"""
+Bounded-memory ingestion of very large HTML pages.
+
+Report pages and data dumps can be hundreds of MB. Loading them as one string
+and one lxml tree exhausts the worker, so a body larger than the stream
+threshold is not read into memory. read_body() hands back a LargeBody
+instead: the response still open, plus the bytes read so far.
+iter_table_frames() feeds it chunk by chunk into lxml's HTMLPullParser and
+emits each table's rows as typed DataFrame batches while it parses. Finished
+rows and elements are dropped from the tree, so peak memory is bounded by the
+chunk size and one batch of rows, not by the page size.
+save_streamed_tables() writes those batches straight to CSV/Parquet/SQLite.
+
+Differences from the in-memory path (document.table_to_dataframe):
+ - nested tables are only part of their cell's text, not separate tables;
+ - <tfoot> rows stay where they appear in the markup;
+ - several header rows are joined into one row of names.
+Every body above `max_bytes` raises BodyTooLarge, streamed or not.
+"""
+
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.scraper.dedupe import TableHasher
+from src.scraper.document import _expand_spans
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_STREAM_THRESHOLD = 16 * 1024 * 1024
+DEFAULT_MAX_BODY = 512 * 1024 * 1024
+ROWS_PER_BATCH = 5000
+MAX_ANCHORS = 5000  # kept for next-page detection
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def _declared_encoding(resp) -> Optional[str]:
+    # requests assumes ISO-8859-1 for text/* without a charset; let lxml read <meta> instead
+    if "charset" in (resp.headers.get("Content-Type") or "").lower():
+        return resp.encoding
+    return None
+
+
+class LargeBody:
+    """A response body too large to hold in memory, consumed once via chunks()."""
+
+    def __init__(self, resp, prefix: List[bytes], received: int, max_bytes: int):
+        self.url = resp.url
+        self.encoding = _declared_encoding(resp)
+        self.received = received
+        self.max_bytes = max_bytes
+        self.next_link: Optional[str] = None  # set once the body has been parsed
+        self._resp = resp
+        self._prefix = prefix
+
+    def chunks(self) -> Iterator[bytes]:
+        try:
+            prefix, self._prefix = self._prefix, []
+            yield from prefix
+            for chunk in self._resp.iter_content(CHUNK_SIZE):
+                self.received += len(chunk)
+                if self.received > self.max_bytes:
+                    raise BodyTooLarge(f"{self.url}: body exceeds {self.max_bytes} bytes")
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            self._resp.close()
+        except Exception:
+            pass
+
+
+def read_body(resp, stream_threshold: Optional[int] = None, max_bytes: int = DEFAULT_MAX_BODY):
+    """
+    Read a response opened with stream=True. Returns the body as bytes, or a
+    LargeBody once it passes `stream_threshold` (None: never stream).
+    Raises BodyTooLarge past `max_bytes`.
+    """
+    try:
+        declared = int(resp.headers.get("Content-Length") or 0)
+    except ValueError:
+        declared = 0
+    # Content-Length is the encoded size; the checks below count decoded bytes
+    if declared > max_bytes:
+        resp.close()
+        raise BodyTooLarge(f"{resp.url}: Content-Length {declared} exceeds {max_bytes} bytes")
+    if stream_threshold and declared > stream_threshold:
+        return LargeBody(resp, [], 0, max_bytes)
+    chunks, received = [], 0
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        received += len(chunk)
+        if received > max_bytes:
+            resp.close()
+            raise BodyTooLarge(f"{resp.url}: body exceeds {max_bytes} bytes")
+        if stream_threshold and received > stream_threshold:
+            return LargeBody(resp, chunks, received, max_bytes)
+    return b"".join(chunks)
+
+
+def body_encoding(resp, body: bytes) -> str:
+    """The response's declared encoding, else one detected from the body (requests' apparent_encoding)."""
+    if resp.encoding:
+        return resp.encoding
+    from requests.compat import chardet
+    return (chardet.detect(body) or {}).get("encoding") or "utf-8"
+
+
+def decode_body(resp, body: bytes) -> str:
+    """Text of a body read by read_body(), decoded the way requests' resp.text would."""
+    encoding = body_encoding(resp, body)
+    try:
+        return str(body, encoding, errors="replace")
+    except LookupError:
+        return str(body, "utf-8", errors="replace")
+
+
+def _drop_finished(el):
+    # iterparse idiom: empty the element and unlink the siblings already handled
+    el.clear(keep_tail=False)
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+
+def _column_names(header_rows: List[List[str]], width: int) -> List:
+    if not header_rows:
+        return list(range(width))
+    names = []
+    for i in range(width):
+        parts = []
+        for row in header_rows:
+            text = row[i] if i < len(row) else ""
+            if text and text not in parts:
+                parts.append(text)
+        names.append(" ".join(parts) or f"Unnamed: {i}")
+    # duplicate names get .1, .2 suffixes like pandas
+    seen: Dict[str, int] = {}
+    out = []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            out.append(f"{name}.{seen[name]}")
+        else:
+            seen[name] = 0
+            out.append(name)
+    return out
+
+
+def _to_frame(rows: List[List[str]], columns: List):
+    from pandas.io.parsers import TextParser
+
+    width = len(columns)
+    rows = [r[:width] + [""] * (width - len(r)) for r in rows]
+    with TextParser(rows, names=columns, header=None, thousands=",") as tp:
+        return tp.read()
+
+
+def iter_table_frames(body: LargeBody, batch_rows: int = ROWS_PER_BATCH) -> Iterator[Tuple[int, "object"]]:
+    """
+    Parse a LargeBody incrementally and yield (table number from 1, DataFrame
+    batch) as rows come in; a table's batches share its columns. Anchors seen
+    on the way are scored for the next-page link (body.next_link).
+    """
+    import lxml.html
+    from lxml import etree
+    from src.scraper.fetcher import best_next_link
+
+    parser = etree.HTMLPullParser(events=("start", "end"), encoding=body.encoding)
+    # lxml.html elements (text_content() etc.), as in ParsedDocument
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    anchors = []
+    depth = 0  # <table> nesting depth
+    table_no = 0
+    in_thead = False
+    header_rows: List[List[str]] = []
+    columns = None
+    rows: List[List[str]] = []
+    remainder: list = []
+
+    def _flush():
+        nonlocal rows
+        frame = _to_frame(rows, columns)
+        rows = []
+        return frame
+
+    def _events():
+        for chunk in body.chunks():
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    for event, el in _events():
+        tag = el.tag if isinstance(el.tag, str) else ""
+        if event == "start":
+            if tag == "table":
+                depth += 1
+                if depth == 1:
+                    table_no += 1
+                    header_rows, columns, rows, remainder, in_thead = [], None, [], [], False
+            elif tag == "thead" and depth == 1:
+                in_thead = True
+            continue
+
+        if tag == "a" and el.get("href") and len(anchors) < MAX_ANCHORS:
+            anchors.append((el.get("href"), el.text_content(), dict(el.attrib)))
+        if depth == 1 and tag == "tr":
+            expanded, remainder = _expand_spans([el], remainder=remainder)
+            texts = expanded[0]
+            # a leading row of <th> cells only (find() looks at direct children)
+            th_row = el.find("td") is None and el.find("th") is not None
+            if columns is None and (in_thead or (not rows and th_row)):
+                header_rows.append(texts)
+            elif texts:
+                if columns is None:
+                    width = max([len(texts)] + [len(r) for r in header_rows])
+                    columns = _column_names(header_rows, width)
+                rows.append(texts)
+                if len(rows) >= batch_rows:
+                    yield table_no, _flush()
+            _drop_finished(el)
+        elif tag == "thead" and depth == 1:
+            in_thead = False
+        elif tag == "table":
+            depth -= 1
+            if depth == 0:
+                if rows:
+                    yield table_no, _flush()
+                _drop_finished(el)
+        elif depth == 0 and tag not in ("html", "body"):
+            _drop_finished(el)
+    body.next_link = best_next_link(anchors, body.url)
+
+
+def _wider_type(a, b):
+    """An Arrow type that holds values of both `a` and `b`."""
+    import pyarrow as pa
+
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(t(a) for t in numeric) and any(t(b) for t in numeric):
+        return pa.float64()
+    return pa.string()
+
+
+class _TableWriter:
+    """Appends a table's DataFrame batches to CSV, Parquet and/or SQLite."""
+
+    def __init__(self, base_path: str, name: str, formats, conn=None, extra_columns: Optional[dict] = None, text_parquet: bool = False):
+        self.name = name
+        self.text_parquet = text_parquet
+        self.formats = set(formats)
+        self.conn = conn
+        self.extra_columns = extra_columns or {}
+        self.csv_path = base_path + ".csv"
+        self.parquet_path = base_path + ".parquet"
+        self.rows = 0
+        self.hasher = None
+        self._parquet = None
+        self._schema = None
+        # Parquet is written under a temporary name and renamed on close()
+        self._generation = 0
+        self._parquet_tmp = self.parquet_path + ".tmp"
+
+    def write(self, df):
+        if self.hasher is None:
+            self.hasher = TableHasher(list(df.columns))
+        self.hasher.update_frame(df)
+        for i, (col, value) in enumerate(self.extra_columns.items()):
+            if col not in df.columns:
+                df.insert(i, col, value)
+        first = self.rows == 0
+        self.rows += len(df)
+        if "csv" in self.formats:
+            df.to_csv(self.csv_path, index=False, header=first, mode="w" if first else "a")
+        if "parquet" in self.formats:
+            self._write_parquet(df)
+        if "sqlite" in self.formats and self.conn is not None:
+            try:
+                df.to_sql(self.name, self.conn, if_exists="replace" if first else "append", index=False)
+            except Exception:
+                pass
+
+    def _write_parquet(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.text_parquet:
+            df = df.astype("string")
+        try:
+            table = self._arrow_table(df)
+            if self._parquet is None:
+                self._schema = table.schema
+                self._parquet = pq.ParquetWriter(self._parquet_tmp, self._schema)
+            elif not table.schema.equals(self._schema):
+                try:
+                    table = table.cast(self._schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    # typed differently from the batches so far (e.g. text in a numeric column)
+                    self._widen(table.schema)
+                    table = table.cast(self._schema)
+            self._parquet.write_table(table)
+        except Exception as e:
+            logger.info("Parquet output of %s dropped: %s", self.name, e)
+            self.formats.discard("parquet")
+            self._close_parquet()
+            self._remove(self._parquet_tmp)
+
+    @staticmethod
+    def _arrow_table(df):
+        import pyarrow as pa
+
+        df.columns = [str(c) for c in df.columns]
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # mixed-type object columns: store them as text
+            df = df.copy()
+            for col in df.select_dtypes(["object"]).columns:
+                df[col] = df[col].astype("string")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        return table.replace_schema_metadata(None)
+
+    def _widen(self, schema):
+        """Switch to a schema holding both `schema` and the one so far, rewriting the rows written."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        fields = []
+        for field in self._schema:
+            other = schema.field(field.name).type if field.name in schema.names else field.type
+            fields.append(pa.field(field.name, _wider_type(field.type, other)))
+        wider = pa.schema(fields)
+        self._close_parquet()
+        written = self._parquet_tmp
+        self._generation += 1
+        self._parquet_tmp = f"{self.parquet_path}.{self._generation}.tmp"
+        self._parquet = pq.ParquetWriter(self._parquet_tmp, wider)
+        for batch in pq.ParquetFile(written).iter_batches():
+            self._parquet.write_table(pa.Table.from_batches([batch]).cast(wider))
+        self._remove(written)
+        self._schema = wider
+
+    def _close_parquet(self):
+        if self._parquet is not None:
+            try:
+                self._parquet.close()
+            except Exception:
+                pass
+            self._parquet = None
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        self._close_parquet()
+        if "parquet" in self.formats and os.path.exists(self._parquet_tmp):
+            os.replace(self._parquet_tmp, self.parquet_path)
+
+    def discard(self):
+        self.close()
+        self._remove(self.csv_path)
+        self._remove(self.parquet_path)
+        if "sqlite" in self.formats and self.conn is not None:
+            try:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{self.name}"')
+            except Exception:
+                pass
+
+
+def save_streamed_tables(body: LargeBody, out_dir: str, name_for, formats=("csv", "parquet", "sqlite"),
+                         conn=None, extra_columns: Optional[dict] = None, deduper=None, text_parquet: bool = False,
+                         source: Optional[str] = None) -> List[Dict]:
+    """
+    Stream every table of `body` into files named name_for(table number) in
+    `out_dir`, without holding a whole table in memory. Unlike the in-memory
+    path, all-empty columns are kept (they are only known at the end). Tables
+    repeating one already kept (deduper, see dedupe.TableDeduper; `source` is
+    the tables' dedupe source) are removed again. A batch typed differently from the table's earlier ones (e.g. text
+    in a numeric column) widens the Parquet schema (to float64 or text) and
+    the rows written so far are rewritten with it; text_parquet=True stores
+    every column as text from the start.
+    Returns [{"name", "rows", "files"}] for the tables kept.
+    """
+    saved = []
+    writer = None
+
+    def _finish(w):
+        w.close()
+        if w.rows == 0:
+            return
+        if deduper is not None and deduper.check_key(w.hasher.hexdigest(), w.name, w.rows, source=source):
+            w.discard()
+            return
+        files = [os.path.basename(p) for p, fmt in ((w.csv_path, "csv"), (w.parquet_path, "parquet")) if fmt in w.formats]
+        saved.append({"name": w.name, "rows": w.rows, "files": files})
+
+    try:
+        for table_no, df in iter_table_frames(body):
+            name = name_for(table_no)
+            if writer is None or writer.name != name:
+                if writer is not None:
+                    _finish(writer)
+                writer = _TableWriter(os.path.join(out_dir, name), name, formats, conn=conn, extra_columns=extra_columns, text_parquet=text_parquet)
+            writer.write(df)
+        if writer is not None:
+            _finish(writer)
+            writer = None
+    finally:
+        if writer is not None:
+            writer.discard()
+    return saved
@@ -0,0 +1,252 @@
+# src/scraper/xhr_capture.py
+"""
+Grid data straight from the JSON API behind it.
+
+Grids like ag-Grid or MUI DataGrid are filled from JSON XHR/fetch calls.
+ResponseCapture records those responses while a page is rendered and
+scrolled; match_xhr_tables() then looks for array-of-objects payloads whose
+fields and values match a grid extracted from the DOM and returns them as
+typed tables (numbers stay numbers) with source "xhr:<url>".
+"""
+
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_RESPONSES = 200
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+MAX_TOTAL_BYTES = 50 * 1024 * 1024
+MAX_DEPTH = 6
+MIN_RECORDS = 2
+SAMPLE_ROWS = 20
+# share of the DOM grid's sampled cell values that must appear in the payload;
+# matching field names lower the bar (formatted cells like "$1,200" vs 1200)
+MIN_VALUE_OVERLAP = 0.5
+MIN_HEADER_OVERLAP = 0.5
+MIN_VALUE_OVERLAP_WITH_HEADERS = 0.2
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def _norm_key(s: str) -> str:
+    # "firstName", "first_name" and "First Name" all become "firstname"
+    return _NON_ALNUM.sub("", str(s).lower())
+
+
+def _norm_value(v) -> str:
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return " ".join(str(v).split()).lower()
+
+
+class ResponseCapture:
+    """Collects JSON XHR/fetch responses of a page; bodies are read in collect()."""
+
+    def __init__(self):
+        self._responses = []
+        self._captured: List[Tuple[str, Any]] = []
+        self._read = 0
+        self._bytes = 0
+        self._bodies = set()
+        self.seen = 0
+
+    def install(self, page):
+        page.on("response", self._on_response)
+
+    def uninstall(self, page):
+        # pooled pages are reused: don't keep capturing for the next job
+        try:
+            page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+
+    def _on_response(self, response):
+        try:
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            if "json" not in (response.headers.get("content-type") or "").lower():
+                return
+        except Exception:
+            return
+        self.seen += 1
+        if len(self._responses) < MAX_RESPONSES:
+            self._responses.append(response)
+
+    def collect(self) -> List[Tuple[str, Any]]:
+        """
+        (url, parsed JSON) of the responses captured so far, within the size
+        budget. Bodies already read by an earlier call are not read again.
+        """
+        for response in self._pending():
+            try:
+                if not response.ok:
+                    continue
+                body = response.body()
+            except Exception as e:
+                logger.debug("xhr capture: body of %s unavailable: %s", response.url, e)
+                continue
+            self._add(response.url, body)
+        return list(self._captured)
+
+    def _pending(self):
+        pending = self._responses[self._read:]
+        self._read = len(self._responses)
+        return pending
+
+    def _add(self, url: str, body: bytes):
+        if len(body) > MAX_RESPONSE_BYTES or self._bytes + len(body) > MAX_TOTAL_BYTES:
+            return
+        # the same request fired twice would duplicate its rows; keyed on the body,
+        # not the URL, because POST-paged endpoints serve every page from one URL
+        key = (url, hashlib.sha1(body).digest())
+        if key in self._bodies:
+            return
+        self._bodies.add(key)
+        self._bytes += len(body)
+        try:
+            self._captured.append((url, json.loads(body)))
+        except ValueError:
+            pass
+
+
+class AsyncResponseCapture(ResponseCapture):
+    """ResponseCapture for pages of the async Playwright API."""
+
+    async def collect(self) -> List[Tuple[str, Any]]:
+        for response in self._pending():
+            try:
+                if not response.ok:
+                    continue
+                body = await response.body()
+            except Exception as e:
+                logger.debug("xhr capture: body of %s unavailable: %s", response.url, e)
+                continue
+            self._add(response.url, body)
+        return list(self._captured)
+
+
+def _flatten(record: Dict[str, Any], prefix: str = "", depth: int = 0) -> Dict[str, Any]:
+    flat = {}
+    for k, v in record.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict) and depth < 1:
+            flat.update(_flatten(v, f"{key}.", depth + 1))
+        elif isinstance(v, (dict, list)):
+            flat[key] = json.dumps(v, ensure_ascii=False)
+        else:
+            flat[key] = v
+    return flat
+
+
+def find_record_arrays(data: Any, path: str = "$", depth: int = 0):
+    """Yield (json path, records) for every array of objects in a JSON document."""
+    if depth > MAX_DEPTH:
+        return
+    if isinstance(data, list):
+        dicts = [x for x in data if isinstance(x, dict)]
+        if len(dicts) >= MIN_RECORDS and len(dicts) >= 0.8 * len(data):
+            yield path, dicts
+            return
+        for i, x in enumerate(data[:5]):
+            yield from find_record_arrays(x, f"{path}[{i}]", depth + 1)
+    elif isinstance(data, dict):
+        for k, v in data.items():
+            yield from find_record_arrays(v, f"{path}.{k}", depth + 1)
+
+
+def _records_table(records: List[Dict[str, Any]]) -> Tuple[List[str], List[List[Any]]]:
+    flat = [_flatten(r) for r in records]
+    headers: List[str] = []
+    seen = set()
+    for r in flat:
+        for k in r:
+            if k not in seen:
+                seen.add(k)
+                headers.append(k)
+    return headers, [[r.get(h) for h in headers] for r in flat]
+
+
+def _match_score(dom_table: Dict[str, Any], keys: set, values: set) -> float:
+    dom_headers = {_norm_key(h) for h in dom_table.get("headers") or [] if h}
+    header_overlap = len(dom_headers & keys) / len(dom_headers) if dom_headers else 0.0
+    sample = [_norm_value(v) for row in (dom_table.get("rows") or [])[:SAMPLE_ROWS] for v in row if v not in (None, "")]
+    value_overlap = sum(1 for v in sample if v in values) / len(sample) if sample else 0.0
+    if value_overlap < MIN_VALUE_OVERLAP and not (
+        header_overlap >= MIN_HEADER_OVERLAP and value_overlap >= MIN_VALUE_OVERLAP_WITH_HEADERS
+    ):
+        return 0.0
+    return value_overlap + header_overlap
+
+
+def match_xhr_tables(captured: List[Tuple[str, Any]], dom_tables: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Map DOM table index -> typed table from the best matching JSON payload.
+    Arrays from responses of the same endpoint (scroll/paging calls) with the
+    same fields are concatenated first; `captured` holds each distinct response
+    once (see ResponseCapture._add).
+    """
+    merged: Dict[Tuple[str, str, tuple], Dict[str, Any]] = {}
+    for url, data in captured:
+        parts = urlsplit(url)
+        endpoint = f"{parts.scheme}://{parts.netloc}{parts.path}"
+        for path, records in find_record_arrays(data):
+            headers, rows = _records_table(records)
+            key = (endpoint, path, tuple(headers))
+            entry = merged.setdefault(key, {"url": url, "headers": headers, "rows": []})
+            entry["rows"].extend(rows)
+
+    for entry in merged.values():
+        entry["keys"] = {_norm_key(h) for h in entry["headers"]}
+        entry["values"] = {_norm_value(v) for row in entry["rows"] for v in row if v not in (None, "")}
+
+    matches: Dict[int, Dict[str, Any]] = {}
+    for i, dom in enumerate(dom_tables):
+        best, best_score = None, 0.0
+        for entry in merged.values():
+            score = _match_score(dom, entry["keys"], entry["values"])
+            if score > best_score:
+                best, best_score = entry, score
+        if best is not None:
+            matches[i] = {
+                "headers": best["headers"],
+                "rows": best["rows"],
+                "source": f"xhr:{best['url']}",
+            }
+    return matches
+
+
+def merge_xhr_tables(dom_tables: List[Dict[str, Any]], matches: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """DOM tables with each matched grid replaced by its JSON payload, when that is at least as complete."""
+    out = []
+    used = set()
+    for i, dom in enumerate(dom_tables):
+        xhr = matches.get(i)
+        if xhr is not None and xhr["source"] not in used and len(xhr["rows"]) >= len(dom.get("rows") or []):
+            used.add(xhr["source"])
+            if dom.get("coverage"):
+                expected = dom["coverage"].get("expected")
+                coverage = dict(dom["coverage"], rows=len(xhr["rows"]), source="xhr")
+                coverage["ratio"] = min(1, len(xhr["rows"]) / expected) if expected else None
+                xhr = dict(xhr, coverage=coverage)
+            out.append(xhr)
+        else:
+            out.append(dom)
+    return out
+
+
+def xhr_covers(dom_tables: List[Dict[str, Any]], matches: Dict[int, Dict[str, Any]]) -> bool:
+    """True when every virtualized grid is matched by a payload holding all of its rows."""
+    for i, dom in enumerate(dom_tables):
+        cov = dom.get("coverage")
+        if dom.get("source") != "virtualized" or not cov:
+            continue
+        xhr = matches.get(i)
+        expected: Optional[int] = cov.get("expected")
+        if xhr is None or expected is None or len(xhr["rows"]) < expected:
+            return False
+    return True
@@ -0,0 +1,516 @@
+# src/storage.py
+"""
+Canonical table storage for jobs.
+
+Every table of a job is stored once, as data/{job_id}/{name}.parquet, and
+listed in data/{job_id}/_tables.json (name -> file, rows, column names and
+Arrow types). All reads go through read_table(), or read_window() for a
+page of rows. CSV, JSON and SQLite are
+only derived from the Parquet files for downloads: streamed batch by batch
+(iter_export, iter_zip for several tables) or prebuilt by src.exports.
+
+The API keeps naming tables "{name}.csv" (file_name / table_name convert).
+Jobs written before this layout have CSV files and a data.db instead; they
+are still listed and read from those.
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+MANIFEST = "_tables.json"
+EXPORT_FORMATS = ("csv", "json", "parquet")
+NO_DATA_FILE = "no_data.csv"
+_SUFFIXES = (".csv", ".parquet", ".json")
+EXPORT_BATCH_ROWS = 50_000
+# rows per Parquet row group: the unit read_window() decodes
+ROW_GROUP_ROWS = 50_000
+FILTER_OPS = ("eq", "ne", "lt", "le", "gt", "ge", "contains")
+ORDER_CACHE_SIZE = 16
+# budget for the materialized rows of sorted/filtered views (see _view_rows)
+VIEW_CACHE_MB = int(os.getenv("DATA_VIEW_CACHE_MB", "256"))
+STREAM_CHUNK = 1024 * 1024
+
+
+def table_name(file: str) -> str:
+    """"page_1_table_1.csv" (or .parquet/.json, or no suffix) -> "page_1_table_1"."""
+    for suffix in _SUFFIXES:
+        if file.endswith(suffix):
+            return file[: -len(suffix)]
+    return file
+
+
+def file_name(name: str) -> str:
+    """The name the API shows for table `name`."""
+    return f"{name}.csv"
+
+
+def load_manifest(job_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(job_dir, MANIFEST)) as f:
+            return json.load(f).get("tables") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(job_dir: str, tables: Dict[str, Dict]):
+    path = os.path.join(job_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"tables": tables}, f)
+    os.replace(tmp, path)
+
+
+def _column_labels(columns) -> List[str]:
+    # Parquet needs unique string names: join MultiIndex levels, suffix repeats like pandas
+    labels = []
+    for col in columns:
+        if isinstance(col, tuple):
+            parts = []
+            for part in col:
+                part = str(part)
+                if part and not part.startswith("Unnamed:") and part not in parts:
+                    parts.append(part)
+            col = " ".join(parts) or "Unnamed"
+        labels.append(str(col))
+    seen: Dict[str, int] = {}
+    out = []
+    for label in labels:
+        if label in seen:
+            seen[label] += 1
+            out.append(f"{label}.{seen[label]}")
+        else:
+            seen[label] = 0
+            out.append(label)
+    return out
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    tmp = path + ".tmp"
+    try:
+        df.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_ROWS)
+    except Exception:
+        # mixed-type object columns (e.g. numbers and text): store them as text
+        df = df.copy()
+        for col in df.select_dtypes(["object"]).columns:
+            df[col] = df[col].astype("string")
+        df.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp, path)
+
+
+def _entry(path: str) -> Dict:
+    import pyarrow.parquet as pq
+
+    meta = pq.ParquetFile(path).metadata
+    schema = meta.schema.to_arrow_schema()
+    return {
+        "file": os.path.basename(path),
+        "rows": meta.num_rows,
+        "columns": [{"name": f.name, "type": str(f.type)} for f in schema],
+        "updated": time.time(),
+    }
+
+
+def write_table(job_dir: str, name: str, df: pd.DataFrame) -> Dict:
+    """Store `df` as table `name` (replacing it) and return its manifest entry."""
+    df = df.copy(deep=False)
+    df.columns = _column_labels(df.columns)
+    path = os.path.join(job_dir, f"{name}.parquet")
+    _write_parquet(df, path)
+    return register_table(job_dir, name)
+
+
+def register_table(job_dir: str, name: str) -> Dict:
+    """Add a Parquet file already written as {name}.parquet (e.g. streamed) to the manifest."""
+    entry = _entry(os.path.join(job_dir, f"{name}.parquet"))
+    tables = load_manifest(job_dir)
+    tables[name] = entry
+    _save_manifest(job_dir, tables)
+    return entry
+
+
+def list_tables(job_dir: str) -> List[str]:
+    """Table names of a job, in the order they were written; pre-manifest CSVs follow."""
+    names = list(load_manifest(job_dir))
+    known = set(names)
+    try:
+        legacy = sorted(f for f in os.listdir(job_dir) if f.endswith(".csv") and f != NO_DATA_FILE)
+    except OSError:
+        legacy = []
+    names.extend(n for n in map(table_name, legacy) if n not in known)
+    return names
+
+
+def table_path(job_dir: str, name: str) -> str:
+    """The stored file of table `name` (Parquet, or CSV for pre-manifest jobs)."""
+    entry = load_manifest(job_dir).get(name)
+    if entry:
+        return os.path.join(job_dir, entry["file"])
+    legacy = os.path.join(job_dir, file_name(name))
+    if os.path.exists(legacy):
+        return legacy
+    raise FileNotFoundError(f"table {name} not found")
+
+
+def read_table(job_dir: str, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    path = table_path(job_dir, name)
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=columns)
+    return pd.read_parquet(path, columns=columns)
+
+
+def source_file(job_dir: str, name: str, fmt: str) -> Optional[str]:
+    """The stored file of table `name` when it already is in `fmt` (served as is), else None."""
+    path = table_path(job_dir, name)
+    return path if path.endswith(f".{fmt}") else None
+
+
+class _ParquetRows:
+    """Row access to a Parquet file that only decodes the row groups (and columns) asked for."""
+
+    def __init__(self, path: str):
+        import numpy as np
+        import pyarrow.parquet as pq
+
+        self.pf = pq.ParquetFile(path)
+        meta = self.pf.metadata
+        self.num_rows = meta.num_rows
+        self.names = self.pf.schema_arrow.names
+        self._bounds = np.cumsum([0] + [meta.row_group(i).num_rows for i in range(meta.num_row_groups)])
+
+    def read(self, columns: List[str]):
+        return self.pf.read(columns=columns)
+
+    def estimated_bytes(self, columns: List[str]) -> int:
+        """Decoded size of `columns` over all rows, from the footer's uncompressed sizes."""
+        meta = self.pf.metadata
+        wanted = set(columns)
+        total = 0
+        for i in range(meta.num_row_groups):
+            group = meta.row_group(i)
+            for j in range(group.num_columns):
+                if group.column(j).path_in_schema in wanted:
+                    total += group.column(j).total_uncompressed_size
+        return total
+
+    def take(self, indices, columns: List[str]):
+        import numpy as np
+
+        group_of = np.searchsorted(self._bounds, indices, side="right") - 1
+        groups = np.unique(group_of)
+        table = self.pf.read_row_groups(groups.tolist(), columns=columns)
+        # position of each requested row in the concatenation of the groups read
+        sizes = self._bounds[groups + 1] - self._bounds[groups]
+        base = dict(zip(groups.tolist(), np.concatenate([[0], np.cumsum(sizes)[:-1]]).tolist()))
+        local = indices - self._bounds[group_of] + np.array([base[g] for g in group_of.tolist()], dtype=indices.dtype)
+        return table.take(local)
+
+
+class _MemoryRows:
+    """The same access over an in-memory table (CSV tables of pre-manifest jobs)."""
+
+    def __init__(self, df: pd.DataFrame):
+        import pyarrow as pa
+
+        df = df.copy(deep=False)
+        df.columns = _column_labels(df.columns)
+        self.table = pa.Table.from_pandas(df, preserve_index=False)
+        self.num_rows = self.table.num_rows
+        self.names = self.table.column_names
+
+    def read(self, columns: List[str]):
+        return self.table.select(columns)
+
+    def estimated_bytes(self, columns: List[str]) -> int:
+        return self.table.select(columns).nbytes
+
+    def take(self, indices, columns: List[str]):
+        return self.table.select(columns).take(indices)
+
+
+# (path, size, mtime, sort, descending, filters, search) -> row order; the
+# next page of a sorted/filtered view doesn't evaluate it again
+_order_cache: "OrderedDict[tuple, object]" = OrderedDict()
+# the same key plus the columns -> that view's rows, materialized in view order
+_view_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_order_lock = threading.Lock()
+
+
+def _parse_filter(spec: str) -> Tuple[str, str, str]:
+    # "col:op:value"; the column name may itself contain colons
+    parts = spec.rsplit(":", 2)
+    if len(parts) != 3 or parts[1] not in FILTER_OPS:
+        raise ValueError(f"invalid filter {spec!r}: expected column:op:value with op in {', '.join(FILTER_OPS)}")
+    return parts[0], parts[1], parts[2]
+
+
+def _filter_mask(column, op: str, value: str):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if op == "contains":
+        return pc.match_substring(pc.cast(column, pa.string()), value, ignore_case=True)
+    try:
+        scalar = pa.scalar(value).cast(column.type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        raise ValueError(f"filter value {value!r} does not fit a {column.type} column")
+    compare = {"eq": pc.equal, "ne": pc.not_equal, "lt": pc.less, "le": pc.less_equal, "gt": pc.greater, "ge": pc.greater_equal}
+    return compare[op](column, scalar)
+
+
+def _row_order(rows, key: tuple, sort: Optional[str], descending: bool, filters, search: Optional[str]):
+    """Row numbers of the view in display order; None for all rows in stored order."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not sort and not filters and not search:
+        return None
+    with _order_lock:
+        if key in _order_cache:
+            _order_cache.move_to_end(key)
+            return _order_cache[key]
+    needed = {c for c, _, _ in filters}
+    if sort:
+        needed.add(sort)
+    if search:
+        needed.update(rows.names)
+    table = rows.read([c for c in rows.names if c in needed])
+    mask = None
+    for col, op, value in filters:
+        m = _filter_mask(table[col], op, value)
+        mask = m if mask is None else pc.and_kleene(mask, m)
+    if search:
+        hit = None
+        for col in table.column_names:
+            m = pc.match_substring(pc.cast(table[col], pa.string()), search, ignore_case=True)
+            hit = m if hit is None else pc.or_kleene(hit, m)
+        mask = hit if mask is None else pc.and_kleene(mask, hit)
+    if mask is None:
+        order = np.arange(rows.num_rows)
+    else:
+        order = np.flatnonzero(pc.fill_null(mask, False).to_numpy())
+    if sort:
+        keys = table[sort].take(order).combine_chunks()
+        ranks = pc.array_sort_indices(keys, order="descending" if descending else "ascending", null_placement="at_end")
+        order = order[ranks.to_numpy()]
+    with _order_lock:
+        _order_cache[key] = order
+        while len(_order_cache) > ORDER_CACHE_SIZE:
+            _order_cache.popitem(last=False)
+    return order
+
+
+def _view_rows(rows, key: tuple, columns: List[str], order):
+    """
+    The view's `columns` in view order, built once and cached within
+    VIEW_CACHE_MB: the rows of a sorted or filtered page are spread over the
+    whole file, so reading them per page would decode most row groups every
+    time. None when the view is too large to keep.
+    """
+    budget = VIEW_CACHE_MB * 1024 * 1024
+    if rows.estimated_bytes(columns) * len(order) // max(rows.num_rows, 1) > budget:
+        return None
+    vkey = key + (tuple(columns),)
+    with _order_lock:
+        if vkey in _view_cache:
+            _view_cache.move_to_end(vkey)
+            return _view_cache[vkey]
+    table = rows.take(order, columns)
+    with _order_lock:
+        _view_cache[vkey] = table
+        while len(_view_cache) > 1 and sum(t.nbytes for t in _view_cache.values()) > budget:
+            _view_cache.popitem(last=False)
+    return table
+
+
+def _encode_cursor(offset: int, view: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset, "v": view}, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, view: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+    if data.get("v") != view:
+        raise ValueError("cursor belongs to a different view of the table (or the table changed)")
+    return offset
+
+
+def read_window(job_dir: str, name: str, offset: int = 0, limit: int = 1000, columns: Optional[List[str]] = None,
+                sort: Optional[str] = None, descending: bool = False, filters: Iterable[str] = (),
+                search: Optional[str] = None, cursor: Optional[str] = None) -> Tuple[pd.DataFrame, int, Optional[str]]:
+    """
+    One page of table `name`: rows [offset, offset + limit) of the view
+    sorted by `sort` and filtered by `filters` ("column:op:value", see
+    FILTER_OPS) and `search` (case-insensitive text in any column), with only
+    `columns` decoded. A cursor returned by an earlier call continues after
+    its page instead of `offset`.
+    Only the row groups holding the page are read; sorting and filtering read
+    just the columns they need, once per view, and the view's rows are then
+    kept in view order (both cached, see _view_rows). Returns (rows, total
+    rows in the view, cursor of the next page or None).
+    Raises ValueError for unknown columns, bad filters or a stale cursor.
+    """
+    import numpy as np
+
+    path = table_path(job_dir, name)
+    rows = _MemoryRows(read_table(job_dir, name)) if path.endswith(".csv") else _ParquetRows(path)
+    filters = [_parse_filter(f) for f in filters]
+    unknown = [c for c in list(columns or []) + ([sort] if sort else []) + [f[0] for f in filters] if c not in rows.names]
+    if unknown:
+        raise ValueError(f"unknown column(s): {', '.join(unknown)}")
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, sort, descending, tuple(filters), search or None)
+    view = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    if cursor:
+        offset = _decode_cursor(cursor, view)
+    offset, limit = max(0, int(offset)), max(0, int(limit))
+
+    order = _row_order(rows, key, sort, descending, filters, search or None)
+    total = rows.num_rows if order is None else len(order)
+    stop = min(offset + limit, total)
+    selected = list(columns) if columns else rows.names
+    if offset >= stop:
+        page = pd.DataFrame(columns=selected)
+    elif order is None:
+        page = rows.take(np.arange(offset, stop), selected).to_pandas()
+    else:
+        view_rows = _view_rows(rows, key, selected, order)
+        if view_rows is not None:
+            page = view_rows.slice(offset, stop - offset).to_pandas()
+        else:
+            page = rows.take(order[offset:stop], selected).to_pandas()
+    next_cursor = _encode_cursor(stop, view) if stop < total else None
+    return page, total, next_cursor
+
+
+def _iter_frames(job_dir: str, name: str, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    path = table_path(job_dir, name)
+    if path.endswith(".csv"):
+        yield from pd.read_csv(path, chunksize=batch_rows)
+        return
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+
+class _Sink:
+    """Write-only file object whose written bytes are collected for a generator to hand on."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def iter_export(job_dir: str, name: str, fmt: str) -> Iterator[bytes]:
+    """
+    Table `name` serialized as `fmt` (csv, json or parquet), batch by batch,
+    without writing a file or holding the whole table.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unsupported export format {fmt!r}")
+    stored = source_file(job_dir, name, fmt)
+    if stored:
+        with open(stored, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+    if fmt == "csv":
+        first = True
+        for df in _iter_frames(job_dir, name):
+            yield df.to_csv(index=False, header=first).encode("utf-8")
+            first = False
+    elif fmt == "json":
+        yield b"["
+        first = True
+        for df in _iter_frames(job_dir, name):
+            if df.empty:
+                continue
+            records = df.to_json(orient="records")[1:-1]
+            yield (records if first else "," + records).encode("utf-8")
+            first = False
+        yield b"]"
+    else:
+        # only pre-manifest CSV tables get here; they were small enough to write whole
+        sink = _Sink()
+        df = read_table(job_dir, name)
+        df.columns = _column_labels(df.columns)
+        df.to_parquet(sink, index=False)
+        yield sink.drain()
+
+
+def iter_zip(entries: Iterable[Tuple[str, Iterator[bytes]]], compress: bool = True) -> Iterator[bytes]:
+    """
+    A zip archive of (arcname, byte chunks) entries, produced while it is
+    being read: nothing is staged on disk, and memory holds one chunk.
+    """
+    sink = _Sink()
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(sink, "w", compression=compression) as zf:
+        for arcname, chunks in entries:
+            with zf.open(arcname, "w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def write_sqlite(job_dir: str, path: str, on_table: Optional[Callable[[str], None]] = None):
+    """
+    Write all tables of a job into a new SQLite database at `path`. Like the
+    data.db jobs used to write, a cleaned table replaces its original (under
+    the original's name). on_table(name) is called after each table.
+    """
+    names = list_tables(job_dir)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        for name in names:
+            if name.startswith("cleaned_") and name[len("cleaned_"):] in names:
+                continue
+            cleaned = f"cleaned_{name}"
+            df = read_table(job_dir, cleaned if cleaned in names else name)
+            try:
+                df.to_sql(name, conn, if_exists="replace", index=False)
+            except Exception as e:
+                print(f"SQLite export of {name} failed: {e}")
+            if on_table is not None:
+                on_table(name)
+    finally:
+        conn.close()
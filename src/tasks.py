@@ -1,24 +1,43 @@
 import os
-import requests
+import json
 import pandas as pd
-import sqlite3
-from src import jobs_db
+from src import exports, jobs_db, storage
+from src.scraper.http_client import get_http_client, configure_from_options, timeouts_from_options
 from src.scraper.fetcher import (
     fetch_with_requests,
     render_and_extract_with_playwright,
+    crawl_in_session_with_playwright,
     extract_tables,
     extract_table_by_selector,
+    extract_next_page_link,
     fetch_with_playwright_raw,
+    fetch_with_cache,
 )
+from src.scraper.http_cache import HttpCache, table_signature
+from src.scraper.stream_ingest import BodyTooLarge, LargeBody, save_streamed_tables
+from src.scraper.document import ParsedDocument, as_document
+from src.scraper.pagination import PagePredictor, infer_pattern, tables_fingerprint
+from src.scraper.dedupe import TableDeduper
+from src import fetch_strategy
+from src.scraper.crawler import CrawlEngine, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST
 
 
 
 DATA_DIR = os.path.join(os.getcwd(), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+# cap of the DOM-stability wait per rendered page (render_wait_max_ms)
+RENDER_WAIT_MAX_MS = 3000
 
-def _tables_from_html(html: str):
-    """Return list of DataFrames parsed from HTML <table> elements."""
+
+def _post_webhook(webhook_url: str, body: dict):
+    """POST a job notification over the shared keep-alive client."""
+    get_http_client().post(webhook_url, json=body, timeout=5)
+
+
+def _tables_from_html(html):
+    """Return list of DataFrames parsed from HTML <table> elements (str or ParsedDocument)."""
     return extract_tables(html or "")
 
 
@@ -43,7 +62,331 @@ def _tables_from_playwright_extract(extracted: list):
     return dfs
 
 
-def process_url_job(job_id: str, payload: dict):
+def _fetch_static(url: str, opts: dict, cache=None):
+    """
+    Fetch raw HTML with requests, through the conditional HTTP cache when enabled.
+    Returns (html, cache_info); cache_info is None when the cache is off.
+    Bodies above stream_threshold_mb come back as a LargeBody instead of
+    text (see stream_ingest); bodies above max_body_mb fail the fetch.
+    """
+    proxy = opts.get("proxy")
+    requests_proxies = {"http": proxy, "https": proxy} if proxy else None
+    limits = {
+        "stream_threshold": int(opts.get("stream_threshold_mb", 16)) * 1024 * 1024,
+        "max_bytes": int(opts.get("max_body_mb", 512)) * 1024 * 1024,
+    }
+    # the job's own timeouts go with each request: the shared client may be
+    # serving another job's options by now
+    timeout = timeouts_from_options(opts)
+    if cache is not None:
+        return fetch_with_cache(url, cache, timeout=timeout, proxies=requests_proxies, **limits)
+    return fetch_with_requests(url, timeout=timeout, proxies=requests_proxies, **limits), None
+
+
+def _open_http_cache(opts: dict):
+    if not opts.get("http_cache", False):
+        return None
+    try:
+        return HttpCache(
+            os.path.join(DATA_DIR, "_http_cache"),
+            ttl=opts.get("http_cache_ttl", 0),
+            max_bytes=int(opts.get("http_cache_max_mb", 512)) * 1024 * 1024,
+        )
+    except Exception as e:
+        print(f"HTTP cache unavailable: {e}")
+        return None
+
+
+def _render_options(opts: dict) -> dict:
+    """Playwright render settings from job options (sync and async renderers alike)."""
+    from src.scraper.playwright_client import build_resource_policy
+
+    return {
+        "timeout": int(opts.get("playwright_timeout", 30)),
+        "wait_for": int(opts.get("render_wait_max_ms", RENDER_WAIT_MAX_MS)),
+        "proxy": opts.get("proxy"),
+        "resource_policy": build_resource_policy(opts),
+        "max_grid_rows": int(opts.get("max_grid_rows", 10000)),
+        "capture_xhr": bool(opts.get("capture_xhr", True)),
+    }
+
+
+def _open_renderer(opts: dict, probe_pagination: bool = False):
+    """
+    AsyncRenderer rendering several pages at once on the worker's shared
+    browser pool (see async_renderer.AsyncBrowserPool), or None when
+    render_concurrency is 1 (pages then render one at a time on the sync API).
+    Closing it only cancels the job's pending renders.
+    """
+    from src.scraper.async_renderer import AsyncRenderer
+
+    concurrency = int(opts.get("render_concurrency", 4))
+    if concurrency <= 1:
+        return None
+    return AsyncRenderer(concurrency=concurrency, probe_pagination=probe_pagination, **_render_options(opts)).start()
+
+
+def _render_page(url: str, page_num: int, job_dir: str, opts: dict, state: dict, prerendered=None) -> dict:
+    """
+    Render one page with Playwright and fold its network/readiness stats into `state`.
+    prerendered: Future of a render already started on the job's AsyncRenderer.
+    With state["renderer"] set, the page is rendered there instead of on the sync API;
+    state["open_renderer"] opens it on the first render (crawls that only start
+    rendering mid-run).
+    """
+    # Capture an error screenshot per page ("error_page_{page_num}.png"), overwritten by each attempt
+    err_shot = os.path.join(job_dir, f"error_page_{page_num}.png")
+    renderer = state.get("renderer")
+    probe = bool(state.get("probe_pagination"))
+    if renderer is None and state.pop("open_renderer", False):
+        renderer = state["renderer"] = _open_renderer(opts, probe_pagination=probe)
+    if prerendered is not None:
+        extraction_result = prerendered.result()
+    elif renderer is not None:
+        extraction_result = renderer.render(url, screenshot_path=err_shot).result()
+    else:
+        extraction_result = render_and_extract_with_playwright(url, screenshot_path=err_shot, probe_pagination=probe, **_render_options(opts))
+    network = extraction_result.get("network")
+    if network:
+        agg = state.setdefault("resource_blocking", {"blocked": 0, "allowed": 0, "blocked_by_type": {}, "estimated_bytes_saved": 0})
+        for key in ("blocked", "allowed", "estimated_bytes_saved"):
+            agg[key] += network.get(key, 0)
+        for rtype, n in (network.get("blocked_by_type") or {}).items():
+            agg["blocked_by_type"][rtype] = agg["blocked_by_type"].get(rtype, 0) + n
+    ready = extraction_result.get("ready")
+    if ready:
+        state.setdefault("render_wait_ms", {})[str(page_num)] = ready.get("waited_ms")
+    xhr = extraction_result.get("xhr")
+    if xhr:
+        agg = state.setdefault("xhr_capture", {"responses": 0, "tables": 0})
+        agg["responses"] += xhr.get("responses", 0)
+        agg["tables"] += xhr.get("tables", 0)
+    coverage = [t["coverage"] for t in extraction_result.get("tables", []) if t.get("coverage")]
+    if coverage:
+        state.setdefault("grid_coverage", {})[str(page_num)] = coverage
+    return extraction_result
+
+
+def _scrape_page(job_id: str, current_url: str, page_num: int, job_dir: str, opts: dict, state: dict, prefetched=None, on_html=None, prerendered=None) -> dict:
+    """
+    Fetch one page and extract its tables, retrying with exponential backoff.
+
+    state: crawl-wide flags shared between pages ("force_playwright" sticks once
+           the plain requests fetch has failed), the HTTP cache and its counters.
+    prefetched: Future of a requests fetch already started by the crawl engine;
+                it stands in for the first attempt's fetch.
+    prerendered: Future of a render already started on the job's AsyncRenderer;
+                 it stands in for the first render.
+    With learn_fetch_strategy (default) pages of domains where the static fetch
+    keeps finding no tables go straight to rendering (src/fetch_strategy.py).
+    on_html: called with the static page's ParsedDocument as soon as it is fetched,
+             before table parsing.
+    A body above stream_threshold_mb is not parsed here: the result carries it
+    as "stream" (a LargeBody, tables empty) for the caller to stream to disk.
+    The page is parsed once (ParsedDocument) and shared by table extraction, the
+    selector, selector healing and next-link detection.
+    Returns {"success": bool, "tables": [DataFrame], "html": str, "doc": ParsedDocument,
+    "used_playwright": bool, "pagination": render probe (see _render_page) or None}.
+    """
+    import time
+
+    table_selector = opts.get("table_selector")
+    max_retries = int(opts.get("max_retries", 0))
+    cache = state.get("http_cache")
+    tables_sig = table_signature("tables", table_selector)
+
+    html = None
+    doc = None
+    cache_info = None
+    tables = []
+    used_selector = False
+    used_playwright = False
+    rendered = False
+    pagination = None
+    learn = bool(opts.get("learn_fetch_strategy", True))
+    route_render = False
+    if learn and not state["force_playwright"]:
+        route_render = fetch_strategy.choose_strategy(current_url) == fetch_strategy.RENDER
+        if route_render:
+            state["routed_to_render"] = state.get("routed_to_render", 0) + 1
+            if prefetched is not None:
+                prefetched.cancel()
+                prefetched = None
+    
+    # Retry loop
+    attempts = 0
+    success = False
+    last_error = None
+    
+    while attempts <= max_retries:
+        attempts += 1
+        try:
+            # Try requests first
+            static_started = None
+            if not state["force_playwright"] and not route_render:
+                static_started = time.monotonic()
+                try:
+                    if prefetched is not None:
+                        html, cache_info = prefetched.result()
+                    else:
+                        html, cache_info = _fetch_static(current_url, opts, cache)
+                    if isinstance(html, LargeBody):
+                        # too large to parse in memory: the caller streams its tables
+                        if learn:
+                            fetch_strategy.record_outcome(current_url, fetch_strategy.STATIC, True, static_started)
+                        return {"success": True, "tables": [], "html": None, "doc": ParsedDocument(""), "used_playwright": False, "stream": html}
+                    if cache_info:
+                        key = "cache_hits" if cache_info["status"] in ("hit", "revalidated") else "cache_misses"
+                        state[key] = state.get(key, 0) + 1
+                    doc = ParsedDocument(html)
+                    if on_html:
+                        on_html(doc)
+                    # Unchanged page: reuse the tables extracted from this exact body last time
+                    if cache_info and cache_info["unchanged"]:
+                        cached_tables = cache.get_tables(cache_info["body_hash"], tables_sig)
+                        if cached_tables is not None:
+                            state["cache_tables_reused"] = state.get("cache_tables_reused", 0) + 1
+                            if learn:
+                                fetch_strategy.record_outcome(current_url, fetch_strategy.STATIC, True, static_started)
+                            return {"success": True, "tables": cached_tables, "html": html, "doc": doc, "used_playwright": False}
+                    tables = _tables_from_html(doc)
+                except BodyTooLarge:
+                    # rendering it would not go any better
+                    raise
+                except Exception:
+                    state["force_playwright"] = True
+                    if learn:
+                        fetch_strategy.record_outcome(current_url, fetch_strategy.STATIC, False, static_started)
+                finally:
+                    prefetched = None
+
+            if state["force_playwright"] or route_render:
+                used_playwright = True
+                rendered = True
+                render_started = time.monotonic()
+                pending_render, prerendered = prerendered, None
+                extraction_result = _render_page(current_url, page_num, job_dir, opts, state, pending_render)
+                tables = _tables_from_playwright_extract(extraction_result.get("tables", []))
+                html = extraction_result.get("content", "")
+                doc = ParsedDocument(html)
+                pagination = extraction_result.get("pagination")
+                if learn:
+                    fetch_strategy.record_outcome(current_url, fetch_strategy.RENDER, bool(tables), render_started)
+
+            # Selector filtering
+            if table_selector and html:
+                try:
+                    sel_tables = extract_table_by_selector(doc, table_selector)
+                    if sel_tables:
+                        tables = sel_tables
+                        used_selector = True
+                    else:
+                        raise ValueError("No tables found with selector")
+                except Exception:
+                    # Selector failed (or was a description)! Try self-healing/NL selection
+                    print(f"Selector '{table_selector}' failed/invalid. Attempting AI selection...")
+                    healed_selector = _heal_selector(
+                        doc, 
+                        table_selector, 
+                        opts.get("llm_api_key"), 
+                        opts.get("llm_model", "gemini-2.5-flash")
+                    )
+                    if healed_selector:
+                        try:
+                            sel_tables = extract_table_by_selector(doc, healed_selector)
+                            if sel_tables:
+                                tables = sel_tables
+                                used_selector = True
+                                # Record that we healed it
+                                jobs_db.update_job_status(job_id, "running", {"healed_selector": healed_selector})
+                        except Exception:
+                            pass
+
+            if learn and static_started is not None and not used_playwright:
+                fetch_strategy.record_outcome(current_url, fetch_strategy.STATIC, bool(tables), static_started)
+
+            # Fallback to Playwright if no tables found (and not already used)
+            if not tables and not used_playwright:
+                rendered = True
+                render_started = time.monotonic()
+                pending_render, prerendered = prerendered, None
+                extraction_result = _render_page(current_url, page_num, job_dir, opts, state, pending_render)
+                tables = _tables_from_playwright_extract(extraction_result.get("tables", []))
+                html = extraction_result.get("content", "")
+                doc = ParsedDocument(html)
+                pagination = extraction_result.get("pagination")
+                used_playwright = bool(tables)
+                if learn:
+                    fetch_strategy.record_outcome(current_url, fetch_strategy.RENDER, bool(tables), render_started)
+            
+            success = True
+            if rendered:
+                state["rendered_pages"] = state.get("rendered_pages", 0) + 1
+            if cache_info and cache_info.get("body_hash") and not rendered:
+                try:
+                    cache.put_tables(cache_info["body_hash"], tables_sig, tables)
+                except Exception as e:
+                    print(f"Failed to cache tables for {current_url}: {e}")
+            break # Exit retry loop
+            
+        except Exception as e:
+            last_error = e
+            print(f"Attempt {attempts} failed for {current_url}: {e}")
+            if isinstance(e, BodyTooLarge):
+                break
+            if attempts <= max_retries:
+                time.sleep(2 ** attempts) # Exponential backoff: 2, 4, 8...
+
+    if prerendered is not None:
+        # routed to the static fetch after all
+        prerendered.cancel()
+    return {"success": success, "tables": tables, "html": html, "doc": doc, "used_playwright": used_playwright, "pagination": pagination}
+
+
+def _cache_stats(state: dict):
+    if state.get("http_cache") is None:
+        return None
+    return {
+        "hits": state.get("cache_hits", 0),
+        "misses": state.get("cache_misses", 0),
+        "tables_reused": state.get("cache_tables_reused", 0),
+    }
+
+
+def _browser_pool_stats(state: dict):
+    if not state.get("rendered_pages"):
+        return None
+    from src.scraper.playwright_client import BrowserManager
+    stats = BrowserManager.get_instance().pool_stats()
+    if state.get("renderer") is not None:
+        from src.scraper.async_renderer import AsyncBrowserPool
+        stats["async"] = AsyncBrowserPool.get_instance().stats()
+    return stats
+
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+
+def load_checkpoint(job_id: str):
+    """The crawl checkpoint of a job, or None if it has none (or it is unreadable)."""
+    path = os.path.join(DATA_DIR, job_id, CHECKPOINT_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(job_dir: str, checkpoint: dict):
+    # write-then-rename so a crash mid-write never leaves a torn checkpoint
+    path = os.path.join(job_dir, CHECKPOINT_FILE)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def process_url_job(job_id: str, payload: dict, resume: bool = False):
     """
     payload: {
       "type": "url",
@@ -55,9 +398,21 @@ def process_url_job(job_id: str, payload: dict):
          "webhook_url": str or null
       }
     }
+    Crawls write a checkpoint (frontier, visited URLs, saved files) to
+    data/{job_id}/_checkpoint.json after every page; with resume=True the crawl
+    continues after the last completed page instead of starting over. A crawl
+    page that fails after its retries stops the job as "failed" (resumable),
+    and a resume starts with that page.
+    Rendered crawl pages are rendered on an AsyncRenderer, several at once when
+    their URLs are known ahead. session_pagination "click"/"scroll" crawls (and
+    crawls reaching a rendered page without a next-page href that has a next
+    control or loads more on scroll) page through the site in one browser page
+    instead (see _session_crawl).
     """
     jobs_db.update_job_status(job_id, "running")
+    webhook_url = None
     try:
+        configure_from_options(payload.get("options") or {})
         if payload.get("type") == "prompt":
             # Generative Job
             prompt = payload.get("value")
@@ -69,25 +424,16 @@ def process_url_job(job_id: str, payload: dict):
             job_dir = os.path.join(DATA_DIR, job_id)
             os.makedirs(job_dir, exist_ok=True)
             
-            # Init DB
-            sqlite_path = os.path.join(job_dir, "data.db")
-            conn = sqlite3.connect(sqlite_path)
-            
             try:
                 df = _generate_with_llm(prompt, api_key, model)
                 if not df.empty:
-                    df.to_csv(os.path.join(job_dir, "generated_data.csv"), index=False)
-                    try:
-                        df.to_sql("generated_data", conn, if_exists="replace", index=False)
-                    except Exception:
-                        pass
+                    storage.write_table(job_dir, "generated_data", df)
+                    exports.schedule_exports(job_id)
                     jobs_db.update_job_status(job_id, "completed", {"rows": len(df), "note": "generated via LLM"})
                 else:
                     jobs_db.update_job_status(job_id, "completed", {"rows": 0, "note": "LLM returned empty"})
             except Exception as e:
                 jobs_db.update_job_status(job_id, "failed", {"error": str(e)})
-            finally:
-                conn.close()
             return
 
         if payload.get("type") != "url":
@@ -96,20 +442,11 @@ def process_url_job(job_id: str, payload: dict):
 
         start_url = payload.get("value")
         opts = payload.get("options", {}) or {}
-        force_playwright = bool(opts.get("force_playwright", False))
-        table_selector = opts.get("table_selector")
-        playwright_timeout = int(opts.get("playwright_timeout", 30))
         crawl = bool(opts.get("crawl", False))
         max_pages = int(opts.get("max_pages", 1))
-        max_retries = int(opts.get("max_retries", 0))
-        proxy = opts.get("proxy")
+        playwright_timeout = int(opts.get("playwright_timeout", 30))
         webhook_url = opts.get("webhook_url")
 
-        # Prepare proxy dict for requests
-        requests_proxies = None
-        if proxy:
-            requests_proxies = {"http": proxy, "https": proxy}
-
         # Create directory for this job
         job_dir = os.path.join(DATA_DIR, job_id)
         os.makedirs(job_dir, exist_ok=True)
@@ -118,174 +455,286 @@ def process_url_job(job_id: str, payload: dict):
         visited_urls = set()
         total_rows = 0
         saved_files = []
-        
-        # Initialize SQLite for this job
-        sqlite_path = os.path.join(job_dir, "data.db")
-        conn = sqlite3.connect(sqlite_path)
-
-        for page_num in range(1, max_pages + 1):
-            if not current_url or current_url in visited_urls:
-                break
-            visited_urls.add(current_url)
-            
-            # Update status
-            jobs_db.update_job_status(job_id, "running", {"current_page": page_num, "current_url": current_url})
+        first_page = 1
+        table_hashes = None
+        checkpointing = crawl and max_pages > 1
+        session_mode = opts.get("session_pagination", "auto")
+        use_session = checkpointing and session_mode != "off"
+        resume_session = None
+        checkpoint = load_checkpoint(job_id) if resume else None
+        if checkpoint:
+            frontier = checkpoint.get("frontier") or []
+            current_url = frontier[0] if frontier else None
+            visited_urls = set(checkpoint.get("visited") or [])
+            total_rows = int(checkpoint.get("total_rows") or 0)
+            saved_files = list(checkpoint.get("saved_files") or [])
+            first_page = int(checkpoint.get("completed_page") or 0) + 1
+            table_hashes = checkpoint.get("table_hashes")
+            resume_session = checkpoint.get("session")
+            print(f"Resuming {job_id} at page {first_page} ({current_url})")
+        html = None
+        doc = None
+        used_playwright = bool(checkpoint and checkpoint.get("used_playwright"))
+        state = {
+            "force_playwright": bool(opts.get("force_playwright", False)),
+            "http_cache": _open_http_cache(opts),
+        }
+        # identical tables (within a page or repeated across pages) are only written once
+        deduper = TableDeduper(table_hashes) if opts.get("dedupe_tables", True) else None
 
-            html = None
-            tables = []
-            used_selector = False
-            used_playwright = False
-            
-            # Retry loop
-            import time
-            attempts = 0
-            success = False
-            last_error = None
-            
-            while attempts <= max_retries:
-                attempts += 1
-                try:
-                    # Try requests first
-                    if not force_playwright:
-                        try:
-                            html = fetch_with_requests(current_url, timeout=10, proxies=requests_proxies)
-                            tables = _tables_from_html(html)
-                        except Exception:
-                            force_playwright = True
-
-                    if force_playwright:
-                        used_playwright = True
-                        # Pass screenshot path only on the last attempt
-                        screenshot_path = None
-                        if attempts > max_retries: # This is the last attempt (actually attempts starts at 1, so if attempts > max_retries it means we are failing)
-                             # Wait, logic: attempts 1..max_retries+1. 
-                             pass
-                        
-                        # We want to capture screenshot if this attempt fails AND it's the last one.
-                        # But render_and_extract captures on exception.
-                        # So we pass screenshot_path if attempts == max_retries + 1?
-                        # Let's just always pass a screenshot path for the "error.png" and overwrite it?
-                        # Or better: "error_page_{page_num}.png"
-                        err_shot = os.path.join(job_dir, f"error_page_{page_num}.png")
-                        
-                        extraction_result = render_and_extract_with_playwright(
-                            current_url, 
-                            timeout=playwright_timeout, 
-                            wait_for=900, 
-                            proxy=proxy,
-                            screenshot_path=err_shot
-                        )
-                        tables = _tables_from_playwright_extract(extraction_result.get("tables", []))
-                        html = extraction_result.get("content", "")
-                        
-                        # If we are crawling and need next link, we might need HTML.
-                        # As discussed, we skip this optimization for now or rely on what we have.
-
-                    # Selector filtering
-                    if table_selector and html:
-                        try:
-                            sel_tables = extract_table_by_selector(html or "", table_selector)
-                            if sel_tables:
-                                tables = sel_tables
-                                used_selector = True
-                            else:
-                                raise ValueError("No tables found with selector")
-                        except Exception:
-                            # Selector failed (or was a description)! Try self-healing/NL selection
-                            print(f"Selector '{table_selector}' failed/invalid. Attempting AI selection...")
-                            healed_selector = _heal_selector(
-                                html, 
-                                table_selector, 
-                                opts.get("llm_api_key"), 
-                                opts.get("llm_model", "gemini-2.5-flash")
-                            )
-                            if healed_selector:
-                                try:
-                                    sel_tables = extract_table_by_selector(html or "", healed_selector)
-                                    if sel_tables:
-                                        tables = sel_tables
-                                        used_selector = True
-                                        # Record that we healed it
-                                        jobs_db.update_job_status(job_id, "running", {"healed_selector": healed_selector})
-                                except Exception:
-                                    pass
-
-                    # Fallback to Playwright if no tables found (and not already used)
-                    if not tables and not used_playwright:
-                        err_shot = os.path.join(job_dir, f"error_page_{page_num}.png")
-                        extraction_result = render_and_extract_with_playwright(
-                            current_url, 
-                            timeout=playwright_timeout, 
-                            wait_for=900, 
-                            proxy=proxy,
-                            screenshot_path=err_shot
-                        )
-                        tables = _tables_from_playwright_extract(extraction_result.get("tables", []))
-                        html = extraction_result.get("content", "")
-                        used_playwright = bool(tables)
-                    
-                    success = True
-                    break # Exit retry loop
-                    
-                except Exception as e:
-                    last_error = e
-                    logger = None # dummy
-                    print(f"Attempt {attempts} failed for {current_url}: {e}")
-                    if attempts <= max_retries:
-                        time.sleep(2 ** attempts) # Exponential backoff: 2, 4, 8...
-
-            if not success:
-                # Page failed after retries
-                print(f"Failed to scrape {current_url} after {max_retries+1} attempts.")
-                # We continue to next page? Or stop job?
-                # Usually stop job or at least mark partial failure.
-                # Let's continue but log it.
-                continue
+        # Crawls prefetch the next page on the engine while this one is parsed and saved.
+        # Rendered crawls render predicted pages concurrently on an AsyncRenderer
+        # instead; crawls that fall back to rendering mid-run open it on their
+        # first render (see _render_page).
+        engine = None
+        session_first = use_session and session_mode in ("click", "scroll")
+        rendered_crawl = checkpointing and state["force_playwright"] and not session_first
+        # rendered pages report whether they can be paged in session (see below)
+        state["probe_pagination"] = use_session
+        if rendered_crawl:
+            engine = _open_renderer(opts, probe_pagination=use_session)
+            state["renderer"] = engine
+        elif checkpointing:
+            state["open_renderer"] = True
+        if crawl and max_pages > 1 and not rendered_crawl:
+            engine = CrawlEngine(
+                lambda u: _fetch_static(u, opts, state["http_cache"]),
+                concurrency=opts.get("crawl_concurrency", DEFAULT_CONCURRENCY),
+                per_host=opts.get("crawl_per_host", DEFAULT_PER_HOST),
+            ).start()
+        prefetched_next = {"doc": None, "link": None}
+        # URL pattern inferred from pages 1 and 2; predicted pages are prefetched ahead
+        predictor = None
+        last_fingerprint = None
+        session_stats = None
+        # (page_num, url) of a crawl page that failed; the job stops there, resumable
+        failed_page = None
 
-            # Save tables for this page
+        def _save_tables(tables, page_num):
+            nonlocal total_rows
             for i, df in enumerate(tables):
                 df = df.dropna(axis=1, how="all")
                 if df.empty:
                     continue
                 
-                total_rows += len(df)
                 base_name = f"page_{page_num}_table_{i+1}"
-                csv_path = os.path.join(job_dir, f"{base_name}.csv")
-                parquet_path = os.path.join(job_dir, f"{base_name}.parquet")
-                
-                df.to_csv(csv_path, index=False)
-                saved_files.append(f"{base_name}.csv")
-                
-                try:
-                    df.to_parquet(parquet_path, index=False)
-                except Exception:
-                    pass
+                if deduper is not None and deduper.check(df, base_name):
+                    continue
+
+                total_rows += len(df)
+                # one typed Parquet table; CSV/JSON/SQLite are derived on download
+                storage.write_table(job_dir, base_name, df)
+                saved_files.append(storage.file_name(base_name))
+
+        def _save_stream(stream, page_num):
+            nonlocal total_rows
+            saved = save_streamed_tables(
+                stream,
+                job_dir,
+                lambda k: f"page_{page_num}_table_{k}",
+                formats=("parquet",),
+                deduper=deduper,
+            )
+            for t in saved:
+                storage.register_table(job_dir, t["name"])
+                total_rows += t["rows"]
+                saved_files.append(storage.file_name(t["name"]))
+            state["streamed_pages"] = state.get("streamed_pages", 0) + 1
+
+        def _session_crawl(start, first_page_num, skip):
+            """
+            Page through `start` in one browser page; the session's k-th page with
+            new rows is job page first_page_num + k - 1. The first `skip` session
+            pages were saved already and are only replayed.
+            """
+            nonlocal used_playwright
+            used_playwright = True
+            session = {"url": start, "first_page": first_page_num}
+
+            def _on_page(k, extracted, page_url, _html):
+                page_num = first_page_num + k - 1
+                visited_urls.add(page_url)
+                jobs_db.update_job_status(job_id, "running", {"current_page": page_num, "current_url": page_url})
+                _save_tables(_tables_from_playwright_extract(extracted), page_num)
+                _checkpoint(page_num, [start], visited_urls, session=session)
+
+            from src.scraper.playwright_client import build_resource_policy
+            result = crawl_in_session_with_playwright(
+                start,
+                _on_page,
+                max_pages - first_page_num + 1,
+                mode=session_mode,
+                timeout=int(opts.get("playwright_timeout", 30)),
+                wait_for=int(opts.get("render_wait_max_ms", RENDER_WAIT_MAX_MS)),
+                proxy=opts.get("proxy"),
+                resource_policy=build_resource_policy(opts),
+                max_grid_rows=int(opts.get("max_grid_rows", 10000)),
+                capture_xhr=bool(opts.get("capture_xhr", True)),
+                screenshot_path=os.path.join(job_dir, "error_session.png"),
+                skip_pages=skip,
+            )
+            xhr = result.get("xhr")
+            if xhr:
+                agg = state.setdefault("xhr_capture", {"responses": 0, "tables": 0})
+                agg["responses"] += xhr.get("responses", 0)
+            # last steps only: a long infinite scroll would bloat the metadata
+            return dict(result, steps=result["steps"][-20:], start_url=start, first_page=first_page_num)
+
+        def _checkpoint(completed_page, frontier, visited, session=None):
+            # the API key is never written to disk; /resume can supply it again
+            options = {k: v for k, v in opts.items() if k != "llm_api_key"}
+            _save_checkpoint(job_dir, {
+                "payload": dict(payload, options=options),
+                "completed_page": completed_page,
+                "frontier": frontier,
+                "visited": sorted(visited),
+                "saved_files": saved_files,
+                "total_rows": total_rows,
+                "used_playwright": used_playwright,
+                "table_hashes": deduper.seen if deduper is not None else None,
+                # in-session crawls resume by replaying the session from its start URL
+                "session": session,
+            })
+
+        def _schedule_next(page_doc, page_url, page_num):
+            # runs as soon as the static HTML is in, before table parsing
+            if engine is None or page_num >= max_pages or state["force_playwright"]:
+                return
+            next_link = extract_next_page_link(page_doc, page_url)
+            prefetched_next.update(doc=page_doc, link=next_link)
+            if next_link and next_link not in visited_urls:
+                engine.prefetch(next_link)
+
+        try:
+            if resume_session and use_session:
+                session_stats = _session_crawl(
+                    resume_session["url"],
+                    resume_session["first_page"],
+                    first_page - resume_session["first_page"],
+                )
+                current_url = None
+            elif session_first and state["force_playwright"] and current_url:
+                session_stats = _session_crawl(current_url, first_page, 0)
+                current_url = None
+
+            for page_num in range(first_page, max_pages + 1):
+                if not current_url or current_url in visited_urls:
+                    break
+                visited_urls.add(current_url)
                 
-                try:
-                    df.to_sql(base_name, conn, if_exists="replace", index=False)
-                except Exception:
-                    pass
+                # Update status
+                jobs_db.update_job_status(job_id, "running", {"current_page": page_num, "current_url": current_url})
 
-            # Find next page if crawling
-            if crawl and page_num < max_pages:
-                from src.scraper.fetcher import extract_next_page_link
-                # Only works if we have HTML (from requests). 
-                # If we used Playwright, we didn't get raw HTML back in this MVP flow.
-                if html:
-                    next_link = extract_next_page_link(html, current_url)
-                    if next_link:
-                        current_url = next_link
-                    else:
+                page = _scrape_page(
+                    job_id,
+                    current_url,
+                    page_num,
+                    job_dir,
+                    opts,
+                    state,
+                    prefetched=engine.take(current_url) if engine and not rendered_crawl else None,
+                    prerendered=state["renderer"].take(current_url) if state.get("renderer") else None,
+                    on_html=lambda d, u=current_url, n=page_num: _schedule_next(d, u, n),
+                )
+                html = page["html"]
+                doc = page["doc"]
+                used_playwright = page["used_playwright"]
+                tables = page["tables"]
+                stream = page.get("stream")
+                if stream is not None:
+                    try:
+                        _save_stream(stream, page_num)
+                    except Exception as e:
+                        print(f"Streaming {current_url} failed: {e}")
+                        page["success"] = False
+
+                if not page["success"]:
+                    # Page failed after retries
+                    print(f"Failed to scrape {current_url} after {int(opts.get('max_retries', 0))+1} attempts.")
+                    # A checkpointed crawl stops here and stays resumable (a resume
+                    # retries this page); without checkpoints the page is skipped.
+                    if checkpointing:
+                        _checkpoint(page_num - 1, [current_url], visited_urls - {current_url})
+                        failed_page = (page_num, current_url)
                         break
-                else:
-                    # If we used Playwright, we can't easily find next link without refactoring render_and_extract
-                    # to return HTML or links. For MVP, we stop if we can't find it.
+                    continue
+
+                # Save tables for this page
+                _save_tables(tables, page_num)
+
+                if engine is not None:
+                    fingerprint = tables_fingerprint(tables)
+                    if predictor is not None and fingerprint and fingerprint == last_fingerprint:
+                        predictor.abandon(f"page {page_num} repeats the previous page's tables", after=page_num)
+                    last_fingerprint = fingerprint
+
+                # Find next page if crawling
+                next_link = None
+                # Only works if we have HTML (from requests or the rendered page content).
+                if crawl and page_num < max_pages and stream is not None:
+                    # found by the streaming parser; html was never held in memory
+                    next_link = stream.next_link
+                elif crawl and page_num < max_pages and html:
+                    if prefetched_next["doc"] is doc:
+                        next_link = prefetched_next["link"]
+                    else:
+                        next_link = extract_next_page_link(doc, current_url)
+                        # the page was re-rendered; drop a prefetch that no longer applies
+                        if engine is not None and prefetched_next["link"] and prefetched_next["link"] != next_link:
+                            engine.discard(prefetched_next["link"])
+                    prefetched_next.update(doc=None, link=None)
+                    renderer = state.get("renderer")
+                    if renderer is not None and state["force_playwright"] and next_link and next_link not in visited_urls:
+                        # the predictor only renders pages beyond the next one ahead
+                        renderer.prefetch(next_link)
+                    if next_link and engine is not None and opts.get("pagination_inference", True):
+                        if predictor is None and page_num == 1:
+                            pattern = infer_pattern(current_url, next_link)
+                            if pattern is not None:
+                                predictor = PagePredictor(engine, pattern, max_pages, lookahead=engine.concurrency)
+                                predictor.advance(2)
+                        elif predictor is not None:
+                            predictor.confirm(page_num, next_link)
+
+                if checkpointing:
+                    _checkpoint(page_num, [next_link] if next_link else [], visited_urls)
+                probe = page.get("pagination") or {}
+                pageable = (probe.get("next") and session_mode != "scroll") or (probe.get("scroll") and session_mode != "click")
+                if not next_link and use_session and page_num < max_pages and pageable:
+                    # rendered page without a next-page href but with a next control
+                    # or infinite scroll: a SPA; continue in one browser page
+                    session_stats = _session_crawl(current_url, page_num, 1)
+                if not next_link:
                     break
-        
-        conn.close()
+                current_url = next_link
+        finally:
+            if engine is not None:
+                engine.close()
+            if state.get("renderer") is not None and state["renderer"] is not engine:
+                state["renderer"].close()
+
+        if failed_page is not None:
+            page_num, url = failed_page
+            if saved_files:
+                # the pages saved so far stay downloadable while the job waits for a resume
+                exports.schedule_exports(job_id)
+            error = f"page {page_num} ({url}) failed after {int(opts.get('max_retries', 0))+1} attempts; resume to retry it"
+            jobs_db.update_job_status(job_id, "failed", {
+                "error": error,
+                "resumable": True,
+                "rows": total_rows,
+                "table_count": len(saved_files),
+                "pages_scraped": page_num - 1,
+            })
+            if webhook_url:
+                try:
+                    _post_webhook(webhook_url, {"job_id": job_id, "status": "failed", "error": error, "rows": total_rows})
+                except Exception as e:
+                    print(f"Webhook failed: {e}")
+            return
 
         # LLM Fallback
-        if not saved_files and opts.get("llm_api_key"):
+        if not saved_files and opts.get("llm_api_key") and not state.get("streamed_pages"):
             print("No tables found. Attempting LLM extraction...")
             
             # If requests failed, we might not have HTML yet. Fetch it now.
@@ -293,20 +742,20 @@ def process_url_job(job_id: str, payload: dict):
                 try:
                     print("Fetching raw HTML for LLM via Playwright...")
                     html = fetch_with_playwright_raw(current_url, timeout=playwright_timeout)
+                    doc = None
                 except Exception as e:
                     print(f"Failed to fetch HTML for LLM: {e}")
 
             llm_df = _extract_with_llm(
-                html, 
+                doc if doc is not None else html, 
                 opts.get("llm_prompt"),
                 opts.get("llm_api_key"),
                 opts.get("llm_model", "gemini-2.5-flash")
             )
             if not llm_df.empty:
                 base_name = "llm_data"
-                csv_path = os.path.join(job_dir, f"{base_name}.csv")
-                llm_df.to_csv(csv_path, index=False)
-                saved_files.append(f"{base_name}.csv")
+                storage.write_table(job_dir, base_name, llm_df)
+                saved_files.append(storage.file_name(base_name))
                 total_rows += len(llm_df)
                 
                 # Update status to reflect LLM usage
@@ -319,6 +768,8 @@ def process_url_job(job_id: str, payload: dict):
             pd.DataFrame().to_csv(os.path.join(job_dir, "no_data.csv"), index=False)
             # status remains completed
         else:
+            # JSON/SQLite/Parquet downloads are built on the worker, not in the request
+            exports.schedule_exports(job_id)
             # update DB metadata
             jobs_db.update_job_status(
                 job_id,
@@ -326,21 +777,33 @@ def process_url_job(job_id: str, payload: dict):
                 {
                     "rows": total_rows,
                     "table_count": len(saved_files),
-                    "pages_scraped": len(visited_urls),
+                    "pages_scraped": max(len(visited_urls), session_stats["first_page"] + session_stats["pages"] - 1) if session_stats else len(visited_urls),
                     "used_playwright": used_playwright,
+                    "http_cache": _cache_stats(state),
+                    "browser_pool": _browser_pool_stats(state),
+                    "resource_blocking": state.get("resource_blocking"),
+                    "render_wait_ms": state.get("render_wait_ms"),
+                    "grid_coverage": state.get("grid_coverage"),
+                    "xhr_capture": state.get("xhr_capture"),
+                    "pagination": predictor.stats() if predictor is not None else None,
+                    "session_pagination": session_stats,
+                    "async_render": state["renderer"].stats() if state.get("renderer") else None,
+                    "routed_to_render": state.get("routed_to_render", 0),
+                    "streamed_pages": state.get("streamed_pages", 0),
+                    "deduplicated": deduper.stats() if deduper is not None else None,
                 },
             )
             
         # Webhook notification
         if webhook_url:
             try:
-                requests.post(webhook_url, json={
+                _post_webhook(webhook_url, {
                     "job_id": job_id,
                     "status": status,
                     "rows": total_rows,
                     "files": saved_files,
                     "download_url": f"/jobs/{job_id}/download" # Relative URL, user needs to prepend host
-                }, timeout=5)
+                })
             except Exception as e:
                 print(f"Webhook failed: {e}")
 
@@ -348,27 +811,22 @@ def process_url_job(job_id: str, payload: dict):
         jobs_db.update_job_status(job_id, "failed", {"error": str(exc)})
         if webhook_url:
             try:
-                requests.post(webhook_url, json={"job_id": job_id, "status": "failed", "error": str(exc)}, timeout=5)
+                _post_webhook(webhook_url, {"job_id": job_id, "status": "failed", "error": str(exc)})
             except Exception:
                 pass
         raise
 
 
-def _extract_with_llm(html: str, prompt: str, api_key: str, model: str) -> pd.DataFrame:
+def _extract_with_llm(html, prompt: str, api_key: str, model: str) -> pd.DataFrame:
     """
-    Extract data from HTML using an LLM (Gemini or OpenAI).
+    Extract data from HTML (str or ParsedDocument) using an LLM (Gemini or OpenAI).
     Returns a DataFrame.
     """
     if not html:
         return pd.DataFrame()
 
-    # 1. Clean HTML to reduce token usage
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, "html.parser")
-    # remove scripts, styles
-    for script in soup(["script", "style", "svg", "path", "noscript"]):
-        script.decompose()
-    text = soup.get_text(separator=" ", strip=True)
+    # 1. Visible text only (no scripts, styles, svg) to reduce token usage
+    text = as_document(html).text()
     # Truncate if too long (rough heuristic: 1 char ~= 0.25 tokens, limit to ~100k chars for Gemini)
     text = text[:100000]
 
@@ -390,14 +848,13 @@ def _extract_with_llm(html: str, prompt: str, api_key: str, model: str) -> pd.Da
             content = response.text
         else:
             # Assume OpenAI compatible
-            import requests
             headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
             data = {
                 "model": model,
                 "messages": [{"role": "user", "content": final_prompt}],
                 "temperature": 0
             }
-            resp = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=60)
+            resp = get_http_client().post(OPENAI_CHAT_URL, headers=headers, json=data, timeout=60)
             resp.raise_for_status()
             content = resp.json()["choices"][0]["message"]["content"]
 
@@ -441,10 +898,9 @@ def _generate_with_llm(user_prompt: str, api_key: str, model: str) -> pd.DataFra
             response = m.generate_content(prompt_text)
             return response.text
         else:
-            import requests
             headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
             data = {"model": model, "messages": [{"role": "user", "content": prompt_text}], "temperature": 0.7}
-            resp = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=60)
+            resp = get_http_client().post(OPENAI_CHAT_URL, headers=headers, json=data, timeout=60)
             resp.raise_for_status()
             return resp.json()["choices"][0]["message"]["content"]
 
@@ -541,7 +997,7 @@ User Request: {user_prompt}
         return pd.DataFrame()
 
 
-def _heal_selector(html: str, broken_selector: str, api_key: str, model: str) -> str | None:
+def _heal_selector(html, broken_selector: str, api_key: str, model: str) -> str | None:
     """
     Use LLM to find a new CSS selector when the provided one fails.
     """
@@ -549,13 +1005,8 @@ def _heal_selector(html: str, broken_selector: str, api_key: str, model: str) ->
         return None
         
     # Truncate HTML to avoid token limits, but keep enough structure
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, "html.parser")
-    # remove scripts/styles to save tokens
-    for s in soup(["script", "style", "svg", "path"]):
-        s.decompose()
-    # Get first 15k chars of cleaned HTML
-    clean_html = str(soup)[:15000]
+    # (scripts/styles/svg removed to save tokens); first 15k chars
+    clean_html = as_document(html).cleaned_html()[:15000]
     
     prompt = f"""
     The user is looking for a table described as (or using the selector): '{broken_selector}'.
@@ -712,8 +1163,6 @@ def clean_job_data(job_id: str, instruction: str = None, file_filter: str = None
     """
     Background task to clean data for a job.
     """
-    import glob
-    
     job_dir = os.path.join(DATA_DIR, job_id)
     if not os.path.exists(job_dir):
         print(f"Job dir {job_dir} not found")
@@ -728,12 +1177,11 @@ def clean_job_data(job_id: str, instruction: str = None, file_filter: str = None
     # Update status to cleaning
     jobs_db.update_job_status(job_id, "cleaning")
 
-    # Find all CSVs (excluding already cleaned ones and generated ones)
-    all_csv_files = glob.glob(os.path.join(job_dir, "*.csv"))
-    csv_files = []
+    # Find all tables (excluding already cleaned ones and generated ones)
+    tables = []
     
-    for f in all_csv_files:
-        name = os.path.basename(f)
+    for table in storage.list_tables(job_dir):
+        name = storage.file_name(table)
         
         # Skip if not the requested file (if filter is active)
         if file_filter and file_filter != "all" and name != file_filter:
@@ -756,22 +1204,15 @@ def clean_job_data(job_id: str, instruction: str = None, file_filter: str = None
              # If user selected "page_1_table_1.csv", we clean it to produce "cleaned_page_1_table_1.csv"
              pass
              
-        csv_files.append(f)
-    
-    # Init DB
-    sqlite_path = os.path.join(job_dir, "data.db")
-    conn = sqlite3.connect(sqlite_path)
+        tables.append(table)
     
     cleaned_count = 0
     
-    for csv_path in csv_files:
-        filename = os.path.basename(csv_path)
-        # Extra check if using default logic (was partially handled above but safe to keep)
-        if not file_filter and (filename.startswith("cleaned_") or filename == "generated_data.csv"):
-            continue
+    for table in tables:
+        filename = storage.file_name(table)
             
         try:
-            df = pd.read_csv(csv_path)
+            df = storage.read_table(job_dir, table)
             if df.empty:
                 continue
                 
@@ -791,14 +1232,8 @@ def clean_job_data(job_id: str, instruction: str = None, file_filter: str = None
 
                 cleaned_df = _apply_cleaning_code(df, code, job_dir=job_dir)
                 
-                # Save cleaned CSV
-                cleaned_filename = f"cleaned_{filename}"
-                cleaned_path = os.path.join(job_dir, cleaned_filename)
-                cleaned_df.to_csv(cleaned_path, index=False)
-                
-                # Update DB (replace table with cleaned version)
-                table_name = filename.replace(".csv", "")
-                cleaned_df.to_sql(table_name, conn, if_exists="replace", index=False)
+                # Save cleaned table (the SQLite export uses it in place of the original)
+                storage.write_table(job_dir, f"cleaned_{table}", cleaned_df)
                 
                 cleaned_count += 1
         except Exception as e:
@@ -808,10 +1243,10 @@ def clean_job_data(job_id: str, instruction: str = None, file_filter: str = None
                     f.write(f"Failed to clean {filename}: {str(e)}\n")
             except:
                 pass
-            
-    conn.close()
     
     if cleaned_count > 0:
+        # the cleaned tables changed the job's exports
+        exports.schedule_exports(job_id)
         jobs_db.update_job_status(job_id, "completed", {"cleaned": True, "cleaned_files": cleaned_count})
     else:
         print(f"No files cleaned for job {job_id}")
@@ -1,7 +1,11 @@
 # src/worker.py
 import os
 import sys
+import time
+import signal
 import logging
+import importlib
+import multiprocessing
 
 # Ensure project root (/app) is on sys.path so `src` is importable by RQ
 HERE = os.path.dirname(os.path.abspath(__file__))       # /app/src
@@ -9,7 +13,7 @@ PROJECT_ROOT = os.path.dirname(HERE)                    # /app
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-from rq import Worker, Queue
+from rq import Worker, Queue, SimpleWorker
 from redis import Redis
 from dotenv import load_dotenv
 
@@ -27,19 +31,182 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 logger.info("Using REDIS_URL=%s", REDIS_URL)
 redis_conn = Redis.from_url(REDIS_URL)
 
+# "fork": rq.Worker, one forked work horse per job (default)
+# "persistent": a long-lived child runs jobs in-process and is recycled after
+#               WORKER_MAX_JOBS jobs or once its RSS exceeds WORKER_MAX_RSS_MB
+WORKER_MODE = os.getenv("WORKER_MODE", "fork")
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "200"))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "1500"))
+# queues in priority order: export builds (src/exports.py) before scrape jobs;
+# WORKER_QUEUES=exports runs a worker dedicated to them
+WORKER_QUEUES = [n.strip() for n in os.getenv("WORKER_QUEUES", "exports,default").split(",") if n.strip()]
+# extra seconds past job.timeout before the supervisor kills a stuck child
+WORKER_TIMEOUT_GRACE = int(os.getenv("WORKER_TIMEOUT_GRACE", "30"))
+
+# Heavy modules imported once here, so forked work horses and the persistent
+# child inherit them instead of re-importing them for every job.
+# google.generativeai is left out on purpose: it starts grpc, which is not
+# fork-safe; the tasks import it in the child when a job needs the LLM.
+PRELOAD_MODULES = [
+    "pandas",
+    "numpy",
+    "cssselect",
+    "lxml.html",
+    "pyarrow",
+    "playwright.sync_api",
+    "src.scraper.async_renderer",
+    "src.tasks",
+    "src.batch",
+]
+
+
+def preload_modules():
+    started = time.monotonic()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as exc:
+            logger.warning("Preload of %s failed: %s", name, exc)
+    logger.info("Preloaded %d modules in %.2fs", len(PRELOAD_MODULES), time.monotonic() - started)
+
+
+def check_shared_browser():
+    """Say loudly at startup when BROWSER_CDP_URL is set but unreachable: renders would fall back to local Chromium."""
+    from src.scraper.playwright_client import BROWSER_CDP_URL, shared_browser_error
+    if not BROWSER_CDP_URL:
+        return
+    error = shared_browser_error(BROWSER_CDP_URL)
+    if error:
+        logger.error("Shared browser at %s unreachable (%s): renders will launch a local Chromium (see cdp_fallbacks in job stats)", BROWSER_CDP_URL, error)
+    else:
+        logger.info("Shared browser at %s reachable", BROWSER_CDP_URL)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        import resource
+        # ru_maxrss is the peak (KiB on Linux), a safe over-estimate
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PersistentWorker(SimpleWorker):
+    """
+    Runs jobs in this (long-lived) process. Job timeouts are still enforced by
+    RQ's death penalty (SIGALRM); the supervisor additionally watches the shared
+    deadline and kills the process if a job ignores it.
+    """
+
+    deadline = None  # multiprocessing.Value shared with the supervisor
+    current_job = None  # multiprocessing.Array holding the running rq job id
+
+    def execute_job(self, job, queue):
+        if self.deadline is not None:
+            timeout = job.timeout if job.timeout and job.timeout > 0 else None
+            self.deadline.value = time.time() + timeout + WORKER_TIMEOUT_GRACE if timeout else 0.0
+            self.current_job.value = job.id.encode()[:63]
+        try:
+            super().execute_job(job, queue)
+        finally:
+            if self.deadline is not None:
+                self.deadline.value = 0.0
+                self.current_job.value = b""
+        rss = _rss_mb()
+        if rss > WORKER_MAX_RSS_MB:
+            logger.info("Worker RSS %.0f MB above %s MB, recycling", rss, WORKER_MAX_RSS_MB)
+            self._stop_requested = True
+
+
+def _persistent_child(queue_names, deadline, current_job):
+    conn = Redis.from_url(REDIS_URL)
+    queues = [Queue(name, connection=conn) for name in queue_names]
+    worker = PersistentWorker(queues, connection=conn)
+    worker.deadline = deadline
+    worker.current_job = current_job
+    worker.work(max_jobs=WORKER_MAX_JOBS)
+
+
+# tasks whose first argument is the AutoDataFlow job they run for
+JOB_TASKS = ("process_url_job", "process_batch_job", "finalize_batch_job", "clean_job_data")
+
+
+def _fail_stuck_job(job_id: str):
+    from rq.job import Job, JobStatus
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+        q = Queue(job.origin, connection=redis_conn)
+        job.set_status(JobStatus.FAILED)
+        q.failed_job_registry.add(job, exc_string="Job exceeded its timeout; worker process was killed")
+        # keyed on the task: a shard's first argument is its batch's job id, and
+        # one shard timing out fails only that shard (finalize_batch_job reports the batch)
+        func = (job.func_name or "").rsplit(".", 1)[-1]
+        if func == "process_batch_shard" and len(job.args) >= 2:
+            jobs_db.fail_shard(job.args[0], job.args[1])
+        elif func in JOB_TASKS and job.args:
+            jobs_db.update_job_status(job.args[0], "failed", {"error": "job timed out"})
+    except Exception as exc:
+        logger.warning("Could not mark stuck job %s as failed: %s", job_id, exc)
+
+
+def run_persistent(queue_names):
+    """Supervise a long-lived job process, recycling it when it exits or hangs."""
+    ctx = multiprocessing.get_context("fork")
+    deadline = ctx.Value("d", 0.0, lock=False)
+    current_job = ctx.Array("c", 64, lock=False)
+    stopping = {"flag": False}
+    child = {"proc": None}
+
+    def _stop(signum, frame):
+        stopping["flag"] = True
+        if child["proc"] is not None and child["proc"].is_alive():
+            os.kill(child["proc"].pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stopping["flag"]:
+        proc = ctx.Process(target=_persistent_child, args=(queue_names, deadline, current_job), daemon=False)
+        started = time.monotonic()
+        proc.start()
+        child["proc"] = proc
+        logger.info("Started persistent job process pid=%s", proc.pid)
+        while proc.is_alive():
+            proc.join(timeout=1)
+            if deadline.value and time.time() > deadline.value:
+                job_id = current_job.value.decode(errors="ignore")
+                logger.error("Job %s exceeded its timeout, killing pid=%s", job_id, proc.pid)
+                proc.kill()
+                proc.join()
+                _fail_stuck_job(job_id)
+                deadline.value = 0.0
+        logger.info("Persistent job process pid=%s exited with %s", proc.pid, proc.exitcode)
+        if time.monotonic() - started < 5:
+            # e.g. Redis unreachable: don't spin
+            time.sleep(5)
+
+
 def main():
     try:
         logger.info("Connecting to Redis at %s", REDIS_URL)
-        q = Queue("default", connection=redis_conn)
-        logger.info("Starting worker listening on queue: %s", q.name)
+        queues = [Queue(name, connection=redis_conn) for name in WORKER_QUEUES]
+        logger.info("Starting worker listening on queues: %s", ", ".join(WORKER_QUEUES))
         if sys.platform == "win32":
             logger.warning("Running on Windows: Using SimpleWorker (no fork). Job timeouts might not work accurately.")
-            from rq import SimpleWorker
-            worker = SimpleWorker([q], connection=redis_conn)
+            worker = SimpleWorker(queues, connection=redis_conn)
+            worker.work()
+            return
+
+        preload_modules()
+        check_shared_browser()
+        if WORKER_MODE == "persistent":
+            logger.info("Persistent mode: recycling after %s jobs or %s MB RSS", WORKER_MAX_JOBS, WORKER_MAX_RSS_MB)
+            run_persistent(WORKER_QUEUES)
         else:
-            worker = Worker([q], connection=redis_conn)
-        
-        worker.work()
+            worker = Worker(queues, connection=redis_conn)
+            worker.work()
     except Exception as exc:
         logger.exception("Worker crashed on startup: %s", exc)
         raise
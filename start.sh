@@ -1,5 +1,12 @@
 #!/bin/bash
 
+# Optionally run one shared Chromium for the worker(s)
+if [ "$SHARED_BROWSER" = "1" ]; then
+  echo "Starting shared browser..."
+  python -u src/browser_server.py &
+  export BROWSER_CDP_URL=${BROWSER_CDP_URL:-http://127.0.0.1:9222}
+fi
+
 # Start the worker in the background
 echo "Starting Worker..."
 python -u src/worker.py &